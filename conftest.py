@@ -0,0 +1,4 @@
+import os
+
+# The Prolog client reads the rosbridge host from the ROS_MASTER_URI. The tests only talk to FakeRosprolog.
+os.environ.setdefault("ROS_MASTER_URI", "http://localhost:11311")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Compare the latency of Prolog.once on the fused one-shot path and on the iterative path.
+Needs a running rosbridge server and rosprolog (see README.md), unless --fake-latency is given.
+
+Usage: python -m src.benchmarks.bench_once [--iterations N] [--query QUERY] [--fake-latency SECONDS]
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from src.neem_interface_python.rosprolog_client import Prolog
+
+
+def measure(once: Callable[[str], object], query: str, iterations: int) -> List[float]:
+    """
+    Return the latency of each call in seconds.
+    """
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        once(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: List[float]):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(f"{name:>10}: mean {statistics.mean(latencies_ms):8.3f} ms, "
+          f"median {statistics.median(latencies_ms):8.3f} ms, "
+          f"min {min(latencies_ms):8.3f} ms, max {max(latencies_ms):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--query", default="X = 1")
+    parser.add_argument("--fake-latency", type=float,
+                        help="Run against FakeRosprolog with this service round-trip time in seconds")
+    args = parser.parse_args()
+
+    if args.fake_latency is not None:
+        from tests.fake_rosprolog import FakeRosprolog
+        FakeRosprolog(latency=args.fake_latency).install()
+
+    prolog = Prolog()
+    # Warm up the connection
+    prolog.once(args.query)
+    iterative = measure(prolog.once_iterative, args.query, args.iterations)
+    fused = measure(prolog.once_fused, args.query, args.iterations)
+    report("iterative", iterative)
+    report("fused", fused)
+    print(f"Speedup (median): {statistics.median(iterative) / statistics.median(fused):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
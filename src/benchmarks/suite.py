@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the client side of neem_interface_python.
+All benchmarks run against FakeRosprolog, an in-process stand-in for rosprolog with a configurable service latency,
+so they need neither ROS nor rosbridge nor KnowRob.
+
+Usage: python -m src.benchmarks.suite [--latency SECONDS] [--scale FACTOR] [--only NAME ...] [--json PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, List, Tuple
+
+os.environ.setdefault("ROS_MASTER_URI", "http://localhost:11311")
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from src.neem_interface_python.neem_interface import NEEMInterface
+from src.neem_interface_python.rosprolog_client import Prolog
+from tests.fake_rosprolog import FakeRosprolog
+from src.neem_interface_python.utils.rosbridge import set_connection_pool
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+from src.neem_interface_python.utils.utils import Datapoint, Pose
+
+BENCHMARKS = {}
+SETUPS = {}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name: str, setup: Callable[[float], object] = None):
+    """
+    Register a benchmark. It receives the fake server and the scale factor and returns the number of logical
+    operations it performed.
+    :param setup: called with the scale factor before the time measurement starts. Its result is passed to the
+    benchmark as third argument.
+    """
+
+    def register(fn: Callable[..., int]):
+        BENCHMARKS[name] = fn
+        if setup is not None:
+            SETUPS[name] = setup
+        return fn
+
+    return register
+
+
+def _poses(n: int) -> List[Datapoint]:
+    rotations = Rotation.random(n, random_state=0)
+    return [Datapoint(timestamp=1000.0 + i * 0.01, frame="ee_link", reference_frame="world",
+                      pos=[0.001 * i, 0.0, 0.5], ori=rotations[i]) for i in range(n)]
+
+
+@benchmark("once_iterative")
+def bench_once_iterative(server: FakeRosprolog, scale: float) -> int:
+    prolog = Prolog(fused_once=False)
+    n = int(200 * scale)
+    for _ in range(n):
+        prolog.once("is_action(Action)")
+    return n
+
+
+@benchmark("once_fused")
+def bench_once_fused(server: FakeRosprolog, scale: float) -> int:
+    prolog = Prolog(fused_once=True)
+    n = int(200 * scale)
+    for _ in range(n):
+        prolog.once("is_action(Action)")
+    return n
+
+
+@benchmark("batch")
+def bench_batch(server: FakeRosprolog, scale: float) -> int:
+    n = int(1000 * scale)
+    Prolog().batch([f"is_action('action_{i}')" for i in range(n)])
+    return n
+
+
+def _all_solutions(server: FakeRosprolog, scale: float, prefetch: int) -> int:
+    n = int(1000 * scale)
+    server.add_solutions(r"^is_state\(State\)", [{"State": f"state_{i}"} for i in range(n)])
+    Prolog(prefetch=prefetch, unordered=prefetch > 1).all_solutions("is_state(State)")
+    return n
+
+
+@benchmark("all_solutions")
+def bench_all_solutions(server: FakeRosprolog, scale: float) -> int:
+    return _all_solutions(server, scale, prefetch=1)
+
+
+@benchmark("all_solutions_prefetch_16")
+def bench_all_solutions_prefetched(server: FakeRosprolog, scale: float) -> int:
+    return _all_solutions(server, scale, prefetch=16)
+
+
+@benchmark("assert_tf_trajectory")
+def bench_assert_tf_trajectory(server: FakeRosprolog, scale: float) -> int:
+    points = _poses(int(500 * scale))
+    NEEMInterface().assert_tf_trajectory(points)
+    return len(points)
+
+
+@benchmark("assert_tf_trajectory_bulk")
+def bench_assert_tf_trajectory_bulk(server: FakeRosprolog, scale: float) -> int:
+    points = _poses(int(500 * scale))
+    NEEMInterface().assert_tf_trajectory(points, batch_size=50, parallel=4)
+    return len(points)
+
+
+@benchmark("assert_object_trajectory")
+def bench_assert_object_trajectory(server: FakeRosprolog, scale: float) -> int:
+    points = _poses(int(500 * scale))
+    # One status per inserted pose, each of which names the object once
+    server.add_solutions(r"findall\(Status", lambda query_str: [{"Statuses": ["true"] * query_str.count("Cup_0")}])
+    neem_interface = NEEMInterface()
+    neem_interface.assert_object_trajectory("http://www.ease-crc.org/ont/SOMA.owl#Cup_0",
+                                            [Pose(p.reference_frame, p.pos, p.ori) for p in points],
+                                            [p.timestamp for p in points], [p.timestamp for p in points])
+    return len(points)
+
+
+def _tf_messages(scale: float) -> List[Dict]:
+    n = int(20000 * scale)
+    quaternions = Rotation.random(n, random_state=0).as_quat()
+    return [{"header": {"stamp": {"$date": f"2021-05-03T12:{i // 6000 % 60:02d}:{i // 100 % 60:02d}.{i % 100:02d}0Z"},
+                        "frame_id": "world"},
+             "child_frame_id": "ee_link",
+             "transform": {"translation": {"x": 0.001 * i, "y": 0.0, "z": 0.5},
+                           "rotation": dict(zip("xyzw", quaternions[i].tolist()))}} for i in range(n)]
+
+
+@benchmark("from_tf_per_point", setup=_tf_messages)
+def bench_from_tf_per_point(server: FakeRosprolog, scale: float, messages: List[Dict]) -> int:
+    [Datapoint.from_tf(message) for message in messages]
+    return len(messages)
+
+
+@benchmark("from_tf_batch", setup=_tf_messages)
+def bench_from_tf_batch(server: FakeRosprolog, scale: float, messages: List[Dict]) -> int:
+    TrajectoryArray.from_tf_messages(messages)
+    return len(messages)
+
+
+def _unreal_samples(scale: float) -> Tuple[List, List, List]:
+    n = int(20000 * scale)
+    return [1000.0 + i * 0.01 for i in range(n)], [[0.1 * i, 0.0, 50.0] for i in range(n)], \
+        Rotation.random(n, random_state=0).as_quat().tolist()
+
+
+@benchmark("from_unreal_per_point", setup=_unreal_samples)
+def bench_from_unreal_per_point(server: FakeRosprolog, scale: float, samples: Tuple[List, List, List]) -> int:
+    timestamps, positions, orientations = samples
+    [Datapoint.from_unreal(t, "ee_link", "world", p, o) for t, p, o in zip(timestamps, positions, orientations)]
+    return len(timestamps)
+
+
+@benchmark("from_unreal_batch", setup=_unreal_samples)
+def bench_from_unreal_batch(server: FakeRosprolog, scale: float, samples: Tuple[List, List, List]) -> int:
+    timestamps, positions, orientations = samples
+    TrajectoryArray.from_unreal(timestamps, "ee_link", "world", positions, orientations)
+    return len(timestamps)
+
+
+def _add_neem_metadata(server: FakeRosprolog, subactions: int, end_time: float):
+    actions = [f"http://www.ease-crc.org/ont/SOMA.owl#Action_{i}" for i in range(subactions + 1)]
+    server.add_solutions(r"is_episode\(Episode\)", [{"Episode": "http://www.ease-crc.org/ont/SOMA.owl#Episode_0"}])
+    server.add_solutions(r"is_setting_for\(.*has_time_interval\(Action",
+                         [{"Action": actions[0], "StartTime": 0.0, "EndTime": end_time, "Subactions": actions[1:],
+                           "Participants": [f"http://www.ease-crc.org/ont/SOMA.owl#Object_{i % 10}" for i in
+                                            range(len(actions))],
+                           "Tasks": [[action, "http://www.ease-crc.org/ont/SOMA.owl#Grasping_0"]
+                                     for action in actions]}])
+
+
+@benchmark("neem_get_transitions")
+def bench_neem_get_transitions(server: FakeRosprolog, scale: float) -> int:
+    from src.neem_interface_python.neem import NEEM
+
+    n = int(200 * scale)
+    transitions = [f"http://www.ease-crc.org/ont/SOMA.owl#StateTransition_{i}" for i in range(n)]
+    _add_neem_metadata(server, subactions=0, end_time=float(n))
+    # Unsorted, and with one transition outside of the episode
+    rows = [[t, float(i), float(i)] for i, t in reversed(list(enumerate(transitions)))] + \
+           [["http://www.ease-crc.org/ont/SOMA.owl#StateTransition_late", float(n + 1), float(n + 1)]]
+    server.add_solutions(r"findall\(\[Transition, TransitionStartTime", [{"Transitions": rows}])
+    assert NEEM().get_transitions() == transitions
+    return n
+
+
+@benchmark("neem_metadata")
+def bench_neem_metadata(server: FakeRosprolog, scale: float) -> int:
+    from src.neem_interface_python.neem import NEEM
+
+    _add_neem_metadata(server, subactions=50, end_time=100.0)
+    server.add_solutions(r"tf_mng_trajectory", [{"Trajectory": []}])
+    neem = NEEM()
+    n = int(200 * scale)
+    for _ in range(n):
+        neem.get_top_level_action()
+        neem.get_participants()
+        neem.get_trajectory("http://www.ease-crc.org/ont/SOMA.owl#Object_0")
+    return n
+
+
+def _triples(server: FakeRosprolog, scale: float) -> List[str]:
+    n = int(200 * scale)
+    soma = "http://www.ease-crc.org/ont/SOMA.owl#"
+    dul = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"
+    actions = [f"{soma}Action_{i}" for i in range(n)]
+    triples = [[action, f"{dul}hasParticipant", f"{soma}Object_{j}"] for action in actions for j in range(3)] + \
+              [[action, f"{dul}executesTask", f"{soma}Grasping_{i}"] for i, action in enumerate(actions)]
+    server.add_solutions(r"findall\(\[S, P, O\]", [{"Prefixes": [["soma", soma], ["dul", dul]], "Triples": triples,
+                                                    "CompletePredicates": [f"{dul}hasParticipant",
+                                                                           f"{dul}executesTask"]}])
+
+    def objects(query_str: str) -> List[Dict]:
+        subject, predicate = re.search(r"holds\('([^']*)', '([^']*)', X\)", query_str).groups()
+        return [{"X": o} for s, p, o in triples if s == subject and p == predicate]
+
+    server.add_solutions(r"holds\('[^']*', '[^']*', X\)", objects)
+    return actions
+
+
+def _get_triple_objects(server: FakeRosprolog, scale: float, snapshot: bool) -> int:
+    actions = _triples(server, scale)
+    neem_interface = NEEMInterface()
+    if snapshot:
+        neem_interface.enable_triple_snapshot()
+    for action in actions:
+        assert len(neem_interface.get_triple_objects(action, "http://www.ontologydesignpatterns.org/ont/dul/"
+                                                             "DUL.owl#hasParticipant")) == 3
+    return len(actions)
+
+
+@benchmark("get_triple_objects")
+def bench_get_triple_objects(server: FakeRosprolog, scale: float) -> int:
+    return _get_triple_objects(server, scale, snapshot=False)
+
+
+@benchmark("get_triple_objects_snapshot")
+def bench_get_triple_objects_snapshot(server: FakeRosprolog, scale: float) -> int:
+    return _get_triple_objects(server, scale, snapshot=True)
+
+
+def _recorded_trajectory(server: FakeRosprolog):
+    """
+    Serve tf_mng_trajectory and mem_tf_get for an object moving along x at 1 m/s, sampled at 100 Hz from 1000 s to
+    1100 s. Return the x position mem_tf_get answers for a time, the one of the latest sample at or before it.
+    """
+    timestamps = 1000.0 + 0.01 * np.arange(10001)
+
+    def trajectory(query_str: str) -> List[Dict]:
+        start, end = map(float, re.search(r"', ([-\d.e+]+), ([-\d.e+]+), Trajectory", query_str).groups())
+        selected = timestamps[(timestamps >= start) & (timestamps <= end)]
+        return [{"Trajectory": [{"term": ["-", t, ["world", [t - 1000.0, 0.0, 0.5], [0.0, 0.0, 0.0, 1.0]]]}
+                                for t in selected.tolist()]}]
+
+    def x_at(t):
+        return timestamps[np.searchsorted(timestamps, t, side="right") - 1] - 1000.0
+
+    def pose(query_str: str) -> List[Dict]:
+        t = float(re.search(r"Pose, ([-\d.e+]+)\)", query_str).group(1))
+        return [{"Pose": ["world", [float(x_at(t)), 0.0, 0.5], [0.0, 0.0, 0.0, 1.0]]}]
+
+    server.add_solutions(r"tf_mng_trajectory", trajectory)
+    server.add_solutions(r"mem_tf_get", pose)
+    return x_at
+
+
+def _get_object_pose(server: FakeRosprolog, scale: float, cache: bool) -> int:
+    x_at = _recorded_trajectory(server)
+    neem_interface = NEEMInterface()
+    if cache:
+        neem_interface.enable_trajectory_cache(window=10.0)
+    n = int(500 * scale)
+    for t in np.random.default_rng(0).uniform(1000.0, 1100.0, n).tolist():
+        assert abs(neem_interface.get_object_pose("ee_link", t).pos[0] - x_at(t)) < 1e-6
+    return n
+
+
+@benchmark("get_object_pose")
+def bench_get_object_pose(server: FakeRosprolog, scale: float) -> int:
+    return _get_object_pose(server, scale, cache=False)
+
+
+@benchmark("get_object_pose_cached")
+def bench_get_object_pose_cached(server: FakeRosprolog, scale: float) -> int:
+    return _get_object_pose(server, scale, cache=True)
+
+
+@benchmark("get_object_poses_cached")
+def bench_get_object_poses_cached(server: FakeRosprolog, scale: float) -> int:
+    x_at = _recorded_trajectory(server)
+    neem_interface = NEEMInterface()
+    neem_interface.enable_trajectory_cache(window=10.0)
+    timestamps = np.random.default_rng(0).uniform(1000.0, 1100.0, int(100000 * scale))
+    poses = neem_interface.get_object_poses("ee_link", timestamps)
+    assert np.allclose(poses.positions[:, 0], x_at(timestamps))
+    return len(timestamps)
+
+
+@benchmark("get_tf_trajectory")
+def bench_get_tf_trajectory(server: FakeRosprolog, scale: float) -> int:
+    _recorded_trajectory(server)
+    trajectory = NEEMInterface().get_tf_trajectory("ee_link", 1000.0, 1000.0 + 100.0 * min(scale, 1.0), as_array=True)
+    return len(trajectory)
+
+
+@benchmark("iter_tf_trajectory")
+def bench_iter_tf_trajectory(server: FakeRosprolog, scale: float) -> int:
+    _recorded_trajectory(server)
+    n = 0
+    for chunk in NEEMInterface().iter_tf_trajectory("ee_link", 1000.0, 1000.0 + 100.0 * min(scale, 1.0), window=10.0):
+        n += len(chunk)
+    return n
+
+
+@benchmark("rest_endpoints")
+def bench_rest_endpoints(server: FakeRosprolog, scale: float) -> int:
+    try:
+        from src.rest_neem_interface.RESTClient import app
+    except ImportError as e:
+        raise SkipBenchmark(f"REST dependencies are not installed: {e}")
+
+    server.add_solutions(r"findall\(\[Act\],is_action\(Act\), Act\)", [{"Act": [["action_0"], ["action_1"]]}])
+    client = app.test_client()
+    n = int(50 * scale)
+    for i in range(n):
+        client.get("/knowrob/api/v1.0/get_all_actions")
+        client.post("/knowrob/api/v1.0/add_subaction_with_task",
+                    json={"parent_action_iri": "action_0", "sub_action_type": "soma:'Grasping'",
+                          "task_type": "soma:'Grasping'", "start_time": i, "end_time": i + 1,
+                          "objects_participated": "[Cup:Cup_0,Bowl:Bowl_0]", "game_participant": "participant_0"})
+    return 2 * n
+
+
+def run(names: List[str], latency: float, scale: float) -> Dict[str, Dict]:
+    results = {}
+    for name in names:
+        server = FakeRosprolog(latency=latency)
+        server.install()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                args = (server, scale) if name not in SETUPS else (server, scale, SETUPS[name](scale))
+                start = time.perf_counter()
+                operations = BENCHMARKS[name](*args)
+                seconds = time.perf_counter() - start
+        except SkipBenchmark as e:
+            print(f"{name:>28}: skipped ({e})")
+            continue
+        finally:
+            set_connection_pool(None)
+        service_calls = server.service_calls
+        results[name] = {"seconds": seconds, "operations": operations, "ops_per_second": operations / seconds,
+                         "service_calls": service_calls,
+                         "service_calls_per_operation": service_calls / max(operations, 1)}
+        print(f"{name:>28}: {seconds:8.3f} s, {operations:6d} ops, {operations / seconds:10.1f} ops/s, "
+              f"{service_calls:7d} service calls ({service_calls / max(operations, 1):.2f}/op)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.001, help="Simulated service round-trip time in seconds")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the problem size of every benchmark")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS.keys()), help="Benchmarks to run")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.only or list(BENCHMARKS.keys()), args.latency, args.scale)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"latency": args.latency, "scale": args.scale, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
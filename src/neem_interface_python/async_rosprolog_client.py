@@ -0,0 +1,168 @@
+"""
+asyncio-based rosprolog client. Service calls are issued through roslibpy's callback interface, so many queries can be
+in flight on a single rosbridge connection without a thread per query.
+"""
+
+import asyncio
+from concurrent import futures
+from typing import Optional, Dict, List, AsyncIterator
+
+import roslibpy
+
+from src.neem_interface_python.rosprolog_client import PrologException, PrologQueryRejected, _RosprologClient, \
+    _call_service_async, _finish_when_started, _parse_next_solution, new_query_id
+from src.neem_interface_python.utils.rosbridge import RosbridgeConnection, RosbridgeConnectionPool
+
+
+async def _call_service(srv: roslibpy.Service, request: Dict) -> Dict:
+    return await _response(_call_service_async(srv, request))
+
+
+async def _response(future: futures.Future) -> Dict:
+    # Shielded, so that cancelling the awaiting task does not cancel the Future which roslibpy resolves later on
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+class AsyncPrologQuery(object):
+    def __init__(self, query_str: str, simple_query_srv: roslibpy.Service, next_solution_srv: roslibpy.Service,
+                 finish_srv: roslibpy.Service, iterative=True):
+        """
+        Async counterpart of PrologQuery. The query is sent to rosprolog by awaiting start(), which AsyncProlog.query
+        does for you.
+        :param iterative: if False, all solutions will be calculated by rosprolog during the first service call
+        """
+        self._query_str = query_str
+        self._simple_query_srv = simple_query_srv
+        self._next_solution_srv = next_solution_srv
+        self._finish_query_srv = finish_srv
+        self._iterative = iterative
+
+        self._started = False
+        self._finished = False
+        self._query_id = None
+
+    async def start(self) -> "AsyncPrologQuery":
+        if not self._started:
+            start_future = _call_service_async(self._simple_query_srv, {"id": self.get_id(), "query": self._query_str,
+                                                                        "mode": 1 if self._iterative else 0})
+            try:
+                result = await _response(start_future)
+            except BaseException:
+                # Cancelled or failed while waiting: rosprolog may still start the query, which must not stay open
+                self._finished = True
+                _finish_when_started(start_future, self._finish_query_srv, self.get_id())
+                raise
+            if not result["ok"]:
+                self._finished = True
+                raise PrologQueryRejected('Prolog query failed: {}'.format(result["message"]))
+            self._started = True
+        return self
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.finish()
+
+    def __aiter__(self):
+        return self.solutions()
+
+    async def next_solution(self) -> Optional[Dict]:
+        """
+        Request the next solution. Return None if there are no more solutions.
+        """
+        if self._finished:
+            return None
+        next_solution = await _call_service(self._next_solution_srv, {"id": self.get_id()})
+        return _parse_next_solution(next_solution, self.get_id())
+
+    async def solutions(self) -> AsyncIterator[Dict]:
+        try:
+            while not self._finished:
+                solution = await self.next_solution()
+                if solution is None:
+                    break
+                yield solution
+        finally:
+            await self.finish()
+
+    async def finish(self):
+        if self._started and not self._finished:
+            self._finished = True
+            # The request is sent right away, so the query is finished even if the awaiting task is cancelled
+            await _call_service(self._finish_query_srv, {"id": self.get_id()})
+
+    def get_id(self) -> str:
+        if self._query_id is None:
+            self._query_id = new_query_id("PYTHON_ASYNC_QUERY")
+        return self._query_id
+
+
+class AsyncProlog(_RosprologClient):
+    def __init__(self, name_space='rosprolog', connection: RosbridgeConnection = None,
+                 pool: RosbridgeConnectionPool = None):
+        """
+        asyncio counterpart of Prolog. All methods are coroutines and can be awaited concurrently, e.g. with
+        asyncio.gather, to keep many queries pending on the same rosbridge connection.
+        :type name_space: str
+        :param connection: rosbridge connection used for all queries. By default, each query is assigned a
+        connection from the connection pool.
+        :param pool: connection pool to use instead of the default one. See utils.rosbridge.
+        """
+        super().__init__(name_space, connection=connection, pool=pool)
+
+    async def _new_query(self, query_str: str, iterative=True) -> AsyncPrologQuery:
+        with self._connection_lease() as connection:
+            if connection.is_connected:
+                services = self._services(connection)
+            else:
+                # (Re-)connecting blocks for up to the connect timeout of the connection, keep it off the event loop
+                services = await asyncio.get_running_loop().run_in_executor(None, self._services, connection)
+        simple_query_srv, next_solution_srv, finish_srv = services
+        return AsyncPrologQuery(query_str, simple_query_srv=simple_query_srv, next_solution_srv=next_solution_srv,
+                                finish_srv=finish_srv, iterative=iterative)
+
+    async def query(self, query_str: str) -> AsyncPrologQuery:
+        """
+        Start a query and return an object which asks rosprolog for one solution at a time.
+        Use it with 'async with' and 'async for' to iterate over the solutions and finish the query afterwards.
+        """
+        return await (await self._new_query(query_str)).start()
+
+    async def once(self, query_str: str) -> Optional[Dict]:
+        """
+        Call rosprolog once and immediately finish the query.
+        Return None if Prolog returned false.
+        Return a Dict mapping all variables in the query to atoms if the query succeeded.
+        Throw an exception if query execution failed (syntax errors, connection errors etc.)
+        """
+        async with await self._new_query(query_str) as q:
+            return await q.next_solution()
+
+    async def ensure_once(self, query_str: str) -> Dict:
+        """
+        Same as once, but throws an exception if Prolog returns false.
+        """
+        res = await self.once(query_str)
+        if res is None:
+            raise PrologException(f"Prolog returned false.\nQuery: {query_str}")
+        return res
+
+    async def all_solutions(self, query_str: str) -> List[Dict]:
+        """
+        Requests all solutions from rosprolog, this might take a long time
+        Return an empty List if Prolog returned False.
+        Return a List of Dicts mapping all variables in the query to atoms if the query succeeded.
+        Throw an exception if query execution failed (syntax errors, connection errors etc.)
+        """
+        q = await (await self._new_query(query_str, iterative=False)).start()
+        return [solution async for solution in q.solutions()]
+
+    async def ensure_all_solutions(self, query_str: str) -> List[Dict]:
+        """
+        Same as all_solutions, but raise an exception if Prolog returns false.
+        """
+        res = await self.all_solutions(query_str)
+        if len(res) == 0:
+            raise PrologException(f"Prolog returned false.\nQuery: {query_str}")
+        return res
@@ -0,0 +1,172 @@
+"""
+In-memory builder for parts of an episode, which are asserted together in a single kb_project call.
+"""
+
+from typing import List, Dict, Tuple, Union
+
+from src.neem_interface_python.rosprolog_client import Prolog, atom
+from src.neem_interface_python.utils.terms import PrologTerm, number
+from src.neem_interface_python.utils.write_behind import IriAllocator
+
+
+class Node(PrologTerm):
+    """
+    An individual in an EpisodeGraph. Until the graph is committed, it is a Prolog variable which new_iri binds to the
+    IRI of the individual, unless the IRI was allocated in advance. Nodes can be used wherever the builder methods
+    expect an IRI.
+    """
+    pass
+
+
+Individual = Union[str, Node]
+
+
+def _term(individual: Individual) -> str:
+    if isinstance(individual, PrologTerm):
+        return individual
+    return atom(individual)
+
+
+class EpisodeGraph:
+    """
+    Accumulates states, situations, transitions, subactions and participant roles of an episode, and asserts all of
+    them in one kb_project call, i.e. in one round trip:
+
+        graph = EpisodeGraph()
+        state = graph.state([cup_iri], start_time, end_time)
+        situation = graph.situation(agent_iri, [cup_iri])
+        iris = graph.commit(prolog)
+        state_iri = iris[state]
+    """
+
+    def __init__(self, iri_allocator: IriAllocator = None):
+        """
+        :param iri_allocator: if given, the IRIs of new individuals are allocated on the client, so they are known
+        before the graph is committed
+        """
+        self.iri_allocator = iri_allocator
+        self.facts: List[str] = []
+        self._variables: List[Node] = []
+        self._iris: Dict[Node, str] = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self.facts)
+
+    def node(self, name: str, iri_class: str) -> Node:
+        """
+        Add a new individual whose IRI is created from iri_class, e.g. soma:'State'. Its types have to be asserted
+        separately.
+        :param name: prefix of the Prolog variable, must start with an uppercase letter
+        """
+        if self.iri_allocator is not None:
+            iri = self.iri_allocator.new_iri(iri_class)
+            node = Node(atom(iri))
+            self._iris[node] = iri
+            return node
+        node = Node(f"{name}_{self._counter}")
+        self._counter += 1
+        self._variables.append(node)
+        self.facts.append(f"new_iri({node}, {atom(iri_class)})")
+        return node
+
+    def individual(self, name: str, iri_class: str, individual_class: str = None) -> Node:
+        """
+        Add a new individual which is an instance of individual_class (default: iri_class).
+        """
+        node = self.node(name, iri_class)
+        self.fact(f"is_individual({node})", f"instance_of({node}, {atom(individual_class or iri_class)})")
+        return node
+
+    def fact(self, *facts: str):
+        """
+        Add facts in the syntax of kb_project. Nodes can be inserted with str.format or f-strings.
+        """
+        self.facts.extend(facts)
+
+    def state(self, participants: List[Individual], start_time: float = None, end_time: float = None,
+              state_class="soma:'State'", state_type="soma:'StateType'") -> Node:
+        state = self.individual("State", "soma:'State'", state_class)
+        classifier = self.individual("StateType", "soma:'StateType'", state_type)
+        self.fact(f"holds({classifier}, dul:'classifies', {state})")
+        self._time_interval(state, start_time, end_time)
+        self.fact(*[f"has_participant({state}, {_term(participant)})" for participant in participants])
+        return state
+
+    def situation(self, agent: Individual, involved_objects: List[Individual],
+                  situation_type="dul:'Situation'") -> Node:
+        situation = self.individual("Situation", situation_type)
+        self.fact(f"holds({situation}, dul:'includesAgent', {_term(agent)})")
+        self.fact(*[f"holds({situation}, dul:'includesObject', {_term(obj)})" for obj in involved_objects])
+        return situation
+
+    def transition(self, agent: Individual, obj: Individual, start_time: float,
+                   end_time: float) -> Tuple[Node, Node, Node]:
+        """
+        Add a state transition of obj caused by agent, from a state at start_time to a state at end_time.
+        Return the nodes of the transition, the initial state and the terminal state.
+        """
+        initial_state = self._scene_state("Initial", agent, obj, start_time)
+        terminal_state = self._scene_state("Terminal", agent, obj, end_time)
+        transition = self.individual("Transition", "dul:'Transition'", "soma:'StateTransition'")
+        self.fact(f"holds({transition}, soma:'hasInitialScene', {initial_state[0]})",
+                  f"holds({transition}, soma:'hasTerminalScene', {terminal_state[0]})")
+        return transition, initial_state[1], terminal_state[1]
+
+    def subaction(self, parent_action: Individual, sub_action_type="dul:'Action'", task_type="dul:'Task'",
+                  start_time: float = None, end_time: float = None) -> Node:
+        """
+        Add a subaction of a given type and an associated task of a given type.
+        """
+        sub_action = self.node("SubAction", sub_action_type)
+        task = self.node("Task", task_type)
+        self.fact(f"has_type({sub_action}, {atom(sub_action_type)})", f"has_type({task}, {atom(task_type)})",
+                  f"executes_task({sub_action}, {task})",
+                  f"triple({_term(parent_action)}, dul:hasConstituent, {sub_action})")
+        self._time_interval(sub_action, start_time, end_time)
+        return sub_action
+
+    def participant_with_role(self, action: Individual, participant: Individual, role_type="dul:'Role'") -> Node:
+        """
+        Add that participant took part in action with a role of the given type. Return the node of the role.
+        """
+        role = self.node("Role", role_type)
+        self.fact(f"has_participant({_term(action)}, {_term(participant)})", f"has_type({role}, {atom(role_type)})",
+                  f"has_role({_term(participant)}, {role})")
+        return role
+
+    def query(self) -> str:
+        return f"kb_project([{', '.join(self.facts)}])"
+
+    def allocated(self) -> bool:
+        """
+        True if the IRIs of all nodes were allocated in advance, so committing the graph yields no new information
+        """
+        return len(self._variables) == 0
+
+    def iris(self) -> Dict[Node, str]:
+        """
+        IRIs of the nodes which are known so far
+        """
+        return dict(self._iris)
+
+    def commit(self, prolog: Prolog) -> Dict[Node, str]:
+        """
+        Assert the whole graph with a single query and return the IRIs of all nodes.
+        """
+        solution = prolog.ensure_once(self.query())
+        for node in self._variables:
+            self._iris[node] = solution[node]
+        return self.iris()
+
+    def _time_interval(self, event: Node, start_time: float = None, end_time: float = None):
+        if start_time is not None and end_time is not None:
+            self.fact(f"has_time_interval({event}, {number(start_time)}, {number(end_time)})")
+
+    def _scene_state(self, name: str, agent: Individual, obj: Individual, time: float) -> Tuple[Node, Node]:
+        scene = self.individual(f"{name}Scene", "soma:'Scene'")
+        state = self.node(f"{name}State", "soma:'State'")
+        self.fact(f"is_state({state})", f"has_participant({state}, {_term(obj)})",
+                  f"has_participant({state}, {_term(agent)})", f"holds({scene}, dul:'includesEvent', {state})",
+                  f"has_time_interval({state}, {number(time)}, {number(time)})")
+        return scene, state
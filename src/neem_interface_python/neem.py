@@ -1,7 +1,70 @@
-from typing import List
+import time
+from typing import List, Dict, Optional
 
-from neem_interface import NEEMInterface
-from rosprolog_client import Prolog, atom
+from src.neem_interface_python.neem_interface import NEEMInterface
+from src.neem_interface_python.rosprolog_client import Prolog, atom
+
+
+class NEEMMetadata:
+    """
+    Index of the properties of a NEEM which most queries about it start from, fetched with a single query
+    """
+
+    def __init__(self, episode: str, top_level_action: str, start_time: Optional[float], end_time: Optional[float],
+                 subactions: List[str], participants: List[str], tasks: Dict[str, List[str]], kb_generation: int):
+        """
+        :param start_time: start of the top-level action, None if it has no time interval yet
+        :param end_time: end of the top-level action, None if it has no time interval yet or has not ended
+        :param participants: participants of the top-level action and of its subactions, without duplicates
+        :param tasks: maps the top-level action and each subaction to the tasks it executes
+        :param kb_generation: value of NEEMInterface.kb_generation the index was built for
+        """
+        self.episode = episode
+        self.top_level_action = top_level_action
+        self.start_time = start_time
+        self.end_time = end_time
+        self.subactions = subactions
+        self.participants = participants
+        self.tasks = tasks
+        self.kb_generation = kb_generation
+
+    @property
+    def valid(self) -> bool:
+        """
+        False once the knowledge base has changed, e.g. by an assertion through a NEEMInterface or by loading another
+        NEEM
+        """
+        return self.kb_generation == NEEMInterface.kb_generation
+
+    @staticmethod
+    def query(prolog: Prolog, episode: str) -> "NEEMMetadata":
+        kb_generation = NEEMInterface.kb_generation
+        res = prolog.ensure_once(f"""
+            once(kb_call([
+                is_action(Action), is_setting_for({atom(episode)}, Action)
+            ])),
+            (kb_call(has_time_interval(Action, StartTime, EndTime)) -> true ; StartTime = none, EndTime = none),
+            findall(Subaction,
+                kb_call([is_action(Subaction), holds(Action, dul:hasConstituent, Subaction)]),
+                Subactions),
+            findall(Participant,
+                (member(A, [Action|Subactions]), kb_call(has_participant(A, Participant))),
+                Participants),
+            findall([A, Task],
+                (member(A, [Action|Subactions]), kb_call(executes_task(A, Task))),
+                Tasks)
+        """)
+        tasks = dict()
+        for action, task in res["Tasks"]:
+            tasks.setdefault(action, []).append(task)
+        return NEEMMetadata(episode, res["Action"], _time(res["StartTime"]), _time(res["EndTime"]),
+                            list(dict.fromkeys(res["Subactions"])), list(dict.fromkeys(res["Participants"])), tasks,
+                            kb_generation)
+
+
+def _time(value) -> Optional[float]:
+    # Unbound or unknown interval bounds arrive as variable names or atoms
+    return value if isinstance(value, (int, float)) else None
 
 
 class NEEM:
@@ -13,76 +76,85 @@ class NEEM:
         self.neem_interface = NEEMInterface()
         self.prolog = Prolog()
         self.episode = self.prolog.ensure_once("kb_call(is_episode(Episode))")["Episode"]
+        self._metadata: Optional[NEEMMetadata] = None
+
+    @property
+    def metadata(self) -> NEEMMetadata:
+        """
+        The metadata index of this NEEM. It is built on first access and rebuilt when the knowledge base has changed
+        since, see NEEMInterface.kb_generation.
+        """
+        if self._metadata is None or not self._metadata.valid:
+            self.refresh_metadata()
+        return self._metadata
+
+    def refresh_metadata(self) -> NEEMMetadata:
+        """
+        Rebuild the metadata index, e.g. after the episode has ended
+        """
+        self._metadata = NEEMMetadata.query(self.prolog, self.episode)
+        return self._metadata
 
     def get_transitions(self) -> List[str]:
         """
-        Get a list of transition IRIs associated to this NEEM, sorted by time
+        Get a list of transition IRIs associated to this NEEM, sorted by time.
+        The transitions and the time intervals of their initial states are fetched with a single query.
         """
-        top_level_action = self.get_top_level_action()
+        metadata = self.metadata
         res = self.prolog.ensure_once(f"""
-            kb_call([
-                holds({atom(top_level_action)}, dul:'hasTimeInterval', TimeInterval),
-                holds(TimeInterval, soma:'hasIntervalBegin', StartTime),
-                holds(TimeInterval, soma:'hasIntervalEnd', EndTime)
-            ]).
-        """)
-        start_time = res["StartTime"]
-        end_time = res["EndTime"]
-        res = self.prolog.ensure_all_solutions(f"kb_call(is_transition(Transition)).")
-        all_transitions = [sol["Transition"] for sol in res]
-        transitions_by_time = dict()
-        for transition in all_transitions:
-            res = self.prolog.ensure_once(f"""
+            findall([Transition, TransitionStartTime, TransitionEndTime],
                 kb_call([
-                    holds({atom(transition)}, soma:'hasInitialScene', InitialScene),
+                    is_transition(Transition),
+                    holds(Transition, soma:'hasInitialScene', InitialScene),
                     is_state(InitialState), holds(InitialScene, dul:'includesEvent', InitialState),
                     has_time_interval(InitialState, TransitionStartTime, TransitionEndTime)
-                 ]).
-            """)
-            transition_start_time = res["TransitionStartTime"]
-            transition_end_time = res["TransitionEndTime"]
-            if transition_start_time >= start_time and transition_end_time <= end_time:
+                ]),
+                Transitions)
+        """)
+        transitions_by_time = dict()
+        seen = set()
+        for transition, transition_start_time, transition_end_time in res["Transitions"]:
+            # Only the first initial state of each transition counts
+            if transition in seen:
+                continue
+            seen.add(transition)
+            if (metadata.start_time is None or transition_start_time >= metadata.start_time) and \
+                    (metadata.end_time is None or transition_end_time <= metadata.end_time):
                 # This transition is part of this neem
                 transitions_by_time[transition_start_time] = transition
         return [kv[1] for kv in sorted(transitions_by_time.items())]
 
     def get_top_level_action(self) -> str:
-        solutions = self.prolog.ensure_all_solutions(f"""
-            kb_call([
-                is_action(Action), is_setting_for({atom(self.episode)}, Action)
-            ]).
-        """)
-        return solutions[0]["Action"]
+        return self.metadata.top_level_action
+
+    def get_subactions(self) -> List[str]:
+        return list(self.metadata.subactions)
+
+    def get_tasks(self, action: str = None) -> List[str]:
+        """
+        Get the tasks executed by an action of the episode, by default the top-level action.
+        """
+        metadata = self.metadata
+        return list(metadata.tasks.get(action if action is not None else metadata.top_level_action, []))
 
     def get_participants(self) -> List[str]:
         """
         Get a list of all things participating in any subaction of the episode.
         """
-        top_level_action = self.get_top_level_action()
-        solutions = self.prolog.ensure_all_solutions(f"""
-            kb_call(has_participant({atom(top_level_action)}, Participant))
-        """)
-        participants = [solution["Participant"] for solution in solutions]
-        subaction_solutions = self.prolog.ensure_all_solutions(f"""
-            kb_call([
-                is_action(Action), holds({atom(top_level_action)},dul:hasConstituent,Action),
-                has_participant(Action, Participant)
-            ]).
-        """)
-        subaction_participants = [solution["Participant"] for solution in subaction_solutions]
-        return list(set(participants + subaction_participants))
+        return list(self.metadata.participants)
 
     def get_trajectory(self, object_iri: str) -> List[dict]:
         """
-        Get the trajectory of an object over the course of this NEEM.
+        Get the trajectory of an object over the course of this NEEM, up to now if the NEEM has not ended yet.
         """
-        top_level_action = self.get_top_level_action()
-        res = self.prolog.ensure_once(f"kb_call(has_time_interval({atom(top_level_action)}, StartTime, EndTime))")
-        start_time = res["StartTime"]
-        end_time = res["EndTime"]
+        metadata = self.metadata
+        start_time = metadata.start_time if metadata.start_time is not None else 0.0
+        end_time = metadata.end_time if metadata.end_time is not None else time.time()
         return self.neem_interface.get_tf_trajectory(object_iri, start_time, end_time)
 
     @staticmethod
     def load(neem_dir: str):
         NEEMInterface().load_neem(neem_dir)
-        return NEEM()
+        neem = NEEM()
+        neem.refresh_metadata()
+        return neem
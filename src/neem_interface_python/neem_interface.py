@@ -1,29 +1,145 @@
+import itertools
+import logging
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Tuple, Optional
+import threading
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Tuple, Optional, Iterable, Dict, Union, Iterator, Callable
 import time
 
+import numpy as np
+from scipy.spatial.transform import Rotation
 from tqdm import tqdm
 
-from src.neem_interface_python.rosprolog_client import Prolog, atom
+from src.neem_interface_python.episode_graph import EpisodeGraph, Node
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException, atom
+from src.neem_interface_python.utils.decimation import Decimation
+from src.neem_interface_python.utils.terms import PrologTerm, QueryTemplate, atom_list
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+from src.neem_interface_python.utils.trajectory_cache import TrajectoryCache
+from src.neem_interface_python.utils.triple_store import TripleStore
 from src.neem_interface_python.utils.utils import Datapoint, Pose
+from src.neem_interface_python.utils.write_behind import WriteBehindQueue, IriAllocator
+
+logger = logging.getLogger(__name__)
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+TF_SET_POSE = QueryTemplate("time_scope({start}, {end}, QS), tf_set_pose({frame}, {pose}, QS)")
+TF_SET_POSES = QueryTemplate("forall(member([Start, End, Frame, Pose], {points}), "
+                             "(time_scope(Start, End, QS), tf_set_pose(Frame, Pose, QS)))")
+# Inserts each pose under its own catch/3 and binds Statuses to true, false or error per pose, in the order of points
+TF_SET_POSES_WITH_STATUS = QueryTemplate(
+    "tf_logger_enable, "
+    "findall(Status, (member([Start, End, Frame, Pose], {points}), "
+    "catch(((time_scope(Start, End, QS), tf_set_pose(Frame, Pose, QS)) -> Status = true ; Status = false), _, "
+    "Status = error)), Statuses), "
+    "tf_logger_disable")
+
 
 class NEEMError(Exception):
     pass
 
 
+class TrajectoryInsertionError(NEEMError):
+    def __init__(self, errors: Dict[int, Exception]):
+        """
+        :param errors: maps the index of each pose which could not be inserted to the exception it raised
+        """
+        self.errors = errors
+        first = min(errors)
+        super().__init__(f"Failed to insert {len(errors)} poses, first failure at index {first}: {errors[first]}")
+
+
+class KnownFacts:
+    """
+    Facts which have already been asserted in the current episode, like the type of an actor or a subclass relation,
+    so they do not have to be asserted again. They are forgotten as soon as the generation of the knowledge base
+    changes, i.e. when it is cleared or replaced.
+    """
+
+    def __init__(self, generation: Callable[[], int] = lambda: 0):
+        """
+        :param generation: returns the current generation of the knowledge base, e.g. NEEMInterface.kb_reset_generation
+        """
+        self._facts = set()
+        self._lock = threading.Lock()
+        self._generation = generation
+        self._facts_generation = generation()
+
+    def unknown(self, facts: List[str]) -> List[str]:
+        """
+        Return the facts which have not been asserted yet, without duplicates, in their original order
+        """
+        with self._lock:
+            self._forget_if_replaced()
+            return [fact for fact in dict.fromkeys(facts) if fact not in self._facts]
+
+    def add(self, facts: List[str]):
+        with self._lock:
+            self._forget_if_replaced()
+            self._facts.update(facts)
+
+    def clear(self):
+        with self._lock:
+            self._facts.clear()
+
+    def _forget_if_replaced(self):
+        generation = self._generation()
+        if generation != self._facts_generation:
+            self._facts.clear()
+            self._facts_generation = generation
+
+
+def parse_objects_participated(objects_participated: Union[str, List[str]]) -> List[Tuple[str, str]]:
+    """
+    Parse "[ClassName:IndividualName,...]" (or a list of "ClassName:IndividualName" strings) into
+    (ClassName, IndividualName) pairs. Whitespace and quotes around the names are removed, entries without a class name
+    are skipped.
+    """
+    if isinstance(objects_participated, str):
+        objects_participated = objects_participated.strip().strip("[]").split(",")
+    pairs = []
+    for entry in objects_participated:
+        class_name, separator, individual_name = entry.partition(":")
+        class_name = class_name.strip().strip("'\"")
+        individual_name = individual_name.strip().strip("'\"")
+        if separator and class_name and individual_name:
+            pairs.append((class_name, individual_name))
+    return pairs
+
+
 class NEEMInterface:
     """
     Low-level interface to KnowRob, which enables the easy creation of NEEMs in Python.
     For more ease of use, consider using the Episode object in a 'with' statement instead (see below).
     """
 
-    def __init__(self):
-        self.prolog = Prolog()
-        self.pool_executor = ThreadPoolExecutor(max_workers=4)
+    # Incremented whenever the knowledge base changes, through the Prolog client of any NEEMInterface or because it was
+    # cleared or replaced, so that information derived from it, like the metadata index of a NEEM, can tell whether it
+    # is still valid
+    kb_generation = 0
+    _kb_generations = itertools.count(1)
+    # Incremented whenever the knowledge base is cleared or replaced. The KnownFacts of every instance are tied to it
+    kb_reset_generation = 0
+    _kb_reset_generations = itertools.count(1)
+
+    def __init__(self, max_workers: int = 4):
+        """
+        :param max_workers: number of threads used to insert poses concurrently, see assert_object_trajectory.
+        The Prolog client generates collision-free query ids, so this can safely be raised well beyond 4.
+        """
+        self.prolog = Prolog(on_write=NEEMInterface.knowledge_base_changed)
+        self.max_workers = max_workers
+        self.pool_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.write_behind: Optional[WriteBehindQueue] = None
+        self._iris = IriAllocator(self.prolog)
+        # Reset whenever a VR episode starts or stops and whenever the knowledge base is cleared or replaced
+        self.known_facts = KnownFacts(lambda: NEEMInterface.kb_reset_generation)
+        self.triple_snapshot: Optional[TripleStore] = None
+        self._triple_snapshot_generation = None
+        self.trajectory_cache: Optional[TrajectoryCache] = None
+        self._trajectory_cache_generation = None
 
         # Load neem-interface.pl into KnowRob
         neem_interface_path = "/home/avyas/catkin_ws/src/neem_interface_python/src/neem-interface/neem-interface/neem-interface.pl"
@@ -36,6 +152,74 @@ class NEEMInterface:
 
     def clear_beliefstate(self):
         self.prolog.ensure_once("mem_clear_memory")
+        self.knowledge_base_replaced()
+
+    @classmethod
+    def knowledge_base_replaced(cls):
+        """
+        Invalidate everything derived from the knowledge base, e.g. after loading a NEEM with remember/1 directly
+        """
+        cls.knowledge_base_changed()
+        NEEMInterface.kb_reset_generation = next(cls._kb_reset_generations)
+
+    @classmethod
+    def knowledge_base_changed(cls):
+        """
+        Invalidate information derived from the knowledge base, like the metadata index of a NEEM, after a write which
+        did not go through the Prolog client of a NEEMInterface
+        """
+        NEEMInterface.kb_generation = next(cls._kb_generations)
+
+    def enable_write_behind(self, max_batch_size: int = 100, flush_interval: float = 0.05) -> WriteBehindQueue:
+        """
+        Queue the assertions of add_participant_with_role, assert_state, assert_situation and assert_object_pose
+        instead of executing them right away. These methods then return immediately, with pre-allocated IRIs or
+        Futures, and a background thread sends the queued assertions in batches, in the order they were made.
+        The methods which assert synchronously (add_subaction_with_task, assert_tf_trajectory, ...) flush the queue
+        first, so they do not overtake queued assertions. Queries which read the knowledge base do not wait for queued
+        assertions, call flush() before them.
+        See WriteBehindQueue for the parameters.
+        """
+        if self.write_behind is None:
+            for prefix in ["soma", "dul"]:
+                self._iris.namespace(prefix)
+            self.write_behind = WriteBehindQueue(self.prolog, max_batch_size, flush_interval)
+        return self.write_behind
+
+    def disable_write_behind(self):
+        """
+        Execute all queued assertions and go back to executing assertions synchronously.
+        """
+        if self.write_behind is not None:
+            self.write_behind.close()
+            self.write_behind = None
+
+    def episode_graph(self) -> EpisodeGraph:
+        """
+        Return an empty EpisodeGraph to assert many states, situations, transitions, ... with one call to
+        commit_graph. In write-behind mode, the IRIs of its nodes are allocated in advance.
+        """
+        return EpisodeGraph(self._iris if self.write_behind is not None else None)
+
+    def commit_graph(self, graph: EpisodeGraph) -> Dict[Node, str]:
+        """
+        Assert all facts of the graph in one round trip and return the IRIs of its nodes.
+        In write-behind mode, a graph whose IRIs were allocated in advance is queued instead.
+        """
+        if self.write_behind is not None:
+            if graph.allocated():
+                self.write_behind.submit(graph.query())
+                return graph.iris()
+            # Do not overtake the queued assertions
+            self.write_behind.flush()
+        return graph.commit(self.prolog)
+
+    def flush(self, timeout: float = None):
+        """
+        Block until all assertions queued in write-behind mode have been executed. Does nothing otherwise.
+        """
+        if self.write_behind is not None:
+            self.write_behind.flush(timeout)
 
     ### NEEM Creation ###############################################################
 
@@ -54,14 +238,75 @@ class NEEMInterface:
         """
         End the current episode and save the NEEM to the given path
         """
+        self.flush()
         return self.prolog.ensure_once(
             f"mem_episode_stop({atom(neem_path)}, {end_time if end_time is not None else time.time()})")
 
+    def checkpoint_tf(self, checkpoint_path: str, until: float) -> int:
+        """
+        Dump the tf collection to the given path on the KnowRob host, in the same format as stop_episode, and remove
+        the poses stamped before until from it. Only poses inserted more than a second before the dump started are
+        removed, which the timestamps in their ObjectIds tell, so every removed pose is part of the dump. Poses inserted
+        while the dump is running stay in the collection and end up in a later checkpoint or in the NEEM, possibly a
+        second time, which loading the NEEM ignores.
+        Return the number of bytes written.
+        """
+        self.flush()
+        return self.prolog.ensure_once(f"""
+            mng_get_db(DB, Collection, 'tf'),
+            get_time(Now), Bound is floor(Now) - 1,
+            format(atom(BoundId), '~|~`0t~16r~8+0000000000000000', [Bound]),
+            mng_dump_collection(DB, Collection, {atom(checkpoint_path)}),
+            mng_remove(DB, Collection, [['_id', ['$lt', id(BoundId)]], ['header.stamp', ['$lt', time({until})]]]),
+            findall(Size,
+                (directory_member({atom(checkpoint_path)}, File, [recursive(true)]), exists_file(File),
+                 size_file(File, Size)),
+                Sizes),
+            sum_list(Sizes, Bytes)
+        """)["Bytes"]
+
+    def merge_tf_checkpoints(self, neem_path: str, checkpoint_paths: List[str]):
+        """
+        Add the poses of checkpoints written by checkpoint_tf to the tf collection of a NEEM saved by stop_episode, by
+        concatenating the dump files of the checkpoints and of the NEEM on the KnowRob host, oldest first. A pose which
+        is in several of them is loaded only once, as mongorestore skips documents whose _id has already been loaded.
+        """
+        self.prolog.ensure_once(f"""
+            mng_get_db(DB, Collection, 'tf'),
+            atomic_list_concat([DB, '/', Collection, '.bson'], File),
+            atomic_list_concat([DB, '/', Collection, '.metadata.json'], MetadataFile),
+            findall(Part,
+                (member(Dir, {atom_list(checkpoint_paths + [neem_path])}), directory_file_path(Dir, File, Part),
+                 exists_file(Part)),
+                Parts),
+            directory_file_path({atom(neem_path)}, File, Target),
+            file_directory_name(Target, TargetDir), make_directory_path(TargetDir),
+            atom_concat(Target, '.merged', Merged),
+            setup_call_cleanup(open(Merged, write, Out, [type(binary)]),
+                forall(member(Part, Parts),
+                    setup_call_cleanup(open(Part, read, In, [type(binary)]), copy_stream_data(In, Out), close(In))),
+                close(Out)),
+            rename_file(Merged, Target),
+            directory_file_path({atom(neem_path)}, MetadataFile, TargetMetadata),
+            (   exists_file(TargetMetadata) -> true
+            ;   member(Dir, {atom_list(checkpoint_paths)}), directory_file_path(Dir, MetadataFile, Metadata),
+                exists_file(Metadata) -> copy_file(Metadata, TargetMetadata)
+            ;   true
+            )
+        """)
+
+    def remove_tf_checkpoints(self, checkpoint_path: str):
+        """
+        Delete a checkpoint directory on the KnowRob host
+        """
+        self.prolog.ensure_once(f"delete_directory_and_contents({atom(checkpoint_path)})")
+
     def add_subaction_with_task(self, parent_action, sub_action_type="dul:'Action'", task_type="dul:'Task'",
                                 start_time: float = None, end_time: float = None) -> str:
         """
         Assert a subaction of a given type, and an associated task of a given type.
         """
+        self.flush()
         q = f"mem_add_subaction_with_task({atom(parent_action)},{atom(sub_action_type)},{atom(task_type)},SubAction)"
         solution = self.prolog.ensure_once(q)
         action_iri = solution["SubAction"]
@@ -69,53 +314,79 @@ class NEEMInterface:
             self.prolog.ensure_once(f"kb_project(has_time_interval({atom(action_iri)}, {start_time}, {end_time}))")
         return action_iri
 
-    def add_participant_with_role(self, action: str, participant: str, role_type="dul:'Role'") -> None:
+    def add_participant_with_role(self, action: str, participant: str, role_type="dul:'Role'") -> Optional[Future]:
         """
         Assert that something was a participant with a given role in an action.
         Participant must already have been inserted into the knowledge base.
+        In write-behind mode, return a Future which resolves once the assertion has been executed.
         """
         q = f"mem_add_participant_with_role({atom(action)}, {atom(participant)}, {atom(role_type)})"
+        if self.write_behind is not None:
+            return self.write_behind.submit(q)
         self.prolog.ensure_once(q)
 
-    def assert_tf_trajectory(self, points: List[Datapoint]):
+    def assert_tf_trajectory(self, points: Union[List[Datapoint], TrajectoryArray], batch_size: int = 1,
+                             parallel: int = 1, decimation: Decimation = None) -> float:
+        """
+        Insert the poses of a trajectory into the tf memory and return the throughput in points per second.
+        :param points: the samples of the trajectory, as Datapoints or as a TrajectoryArray
+        :param decimation: if given, only the samples kept by the decimation are inserted. All samples must then belong
+        to the same frame.
+        :param batch_size: number of points inserted by a single Prolog goal. With the default of 1, every point costs
+        a full round trip to rosprolog.
+        :param parallel: number of goals sent to rosprolog at the same time, see Prolog.batch
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        if parallel < 1:
+            raise ValueError(f"parallel must be at least 1, got {parallel}")
+        self.flush()
+        if decimation is not None:
+            if not isinstance(points, TrajectoryArray):
+                points = TrajectoryArray.from_datapoints(points)
+            points = decimation.apply(points)
+            logger.debug(decimation.last_report)
         print(f"Inserting {len(points)} points")
-        for point in tqdm(points):
-            ee_pose_str = point.to_knowrob_string()
-            self.prolog.ensure_once(f"""
-                time_scope({point.timestamp}, {point.timestamp}, QS),
-                tf_set_pose({atom(point.frame)}, {ee_pose_str}, QS).
-            """)
+        start = time.perf_counter()
+        if isinstance(points, TrajectoryArray):
+            rows = [(timestamp, points.frame, pose) for timestamp, pose in points.pose_terms()]
+        else:
+            rows = [(point.timestamp, point.frame, point.to_knowrob_string()) for point in points]
+        goals = [self._tf_set_poses_goal(rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)]
+        if parallel == 1:
+            for goal in tqdm(goals):
+                self.prolog.ensure_once(goal)
+        else:
+            for wave_start in tqdm(range(0, len(goals), parallel)):
+                for result in self.prolog.batch(goals[wave_start:wave_start + parallel], max_in_flight=parallel):
+                    if not result.ok:
+                        raise result.error
+                    if result.solution is None:
+                        raise NEEMError(f"Failed to insert poses: {result.query_str[:200]}")
+        seconds = time.perf_counter() - start
+        return len(points) / seconds if seconds > 0 else float("inf")
+
+    @staticmethod
+    def _tf_set_poses_goal(rows: List[Tuple[float, str, str]]) -> str:
+        """
+        :param rows: timestamp, frame and KnowRob pose string of each point
+        """
+        if len(rows) == 1:
+            timestamp, frame, pose = rows[0]
+            return TF_SET_POSE.format(start=timestamp, end=timestamp, frame=frame, pose=PrologTerm(pose))
+        return TF_SET_POSES.format(points=[[timestamp, timestamp, frame, PrologTerm(pose)]
+                                           for timestamp, frame, pose in rows])
 
     def assert_transition(self, agent_iri: str, object_iri: str, start_time: float, end_time: float) -> Tuple[
         str, str, str]:
-        res = self.prolog.ensure_once(f"""
-            kb_project([
-                new_iri(InitialScene, soma:'Scene'), is_individual(InitialScene), instance_of(InitialScene, soma:'Scene'),
-                new_iri(InitialState, soma:'State'), is_state(InitialState),
-                has_participant(InitialState, {atom(object_iri)}),
-                has_participant(InitialState, {atom(agent_iri)}),
-                holds(InitialScene, dul:'includesEvent', InitialState),
-                has_time_interval(InitialState, {start_time}, {start_time}),
-
-                new_iri(TerminalScene, soma:'Scene'), is_individual(TerminalScene), instance_of(TerminalScene, soma:'Scene'),
-                new_iri(TerminalState, soma:'State'), is_state(TerminalState),
-                has_participant(TerminalState, {atom(object_iri)}),
-                has_participant(TerminalState, {atom(agent_iri)}),
-                holds(TerminalScene, dul:'includesEvent', TerminalState),
-                has_time_interval(TerminalState, {end_time}, {end_time}),
-
-                new_iri(Transition, dul:'Transition'), is_individual(Transition), instance_of(Transition, soma:'StateTransition'),
-                holds(Transition, soma:'hasInitialScene', InitialScene),
-                holds(Transition, soma:'hasTerminalScene', TerminalScene)
-            ]).
-        """)
-        transition_iri = res["Transition"]
-        initial_state_iri = res["InitialState"]
-        terminal_state_iri = res["TerminalState"]
-        return transition_iri, initial_state_iri, terminal_state_iri
+        graph = self.episode_graph()
+        transition, initial_state, terminal_state = graph.transition(agent_iri, object_iri, start_time, end_time)
+        iris = self.commit_graph(graph)
+        return iris[transition], iris[initial_state], iris[terminal_state]
 
     def assert_agent_with_effector(self, effector_iri: str, agent_type="dul:'PhysicalAgent'",
                                    agent_iri: str = None) -> str:
+        self.flush()
         if agent_iri is None:
             agent_iri = self.prolog.ensure_once(f"""
                 kb_project([
@@ -126,57 +397,57 @@ class NEEMInterface:
 
     def assert_state(self, participant_iris: List[str], start_time: float = None, end_time: float = None,
                      state_class="soma:'State'", state_type="soma:'StateType'") -> str:
-        state_iri = self.prolog.ensure_once(f"""
-            kb_project([
-                new_iri(State, soma:'State'), is_individual(State), instance_of(State, {atom(state_class)}),
-                new_iri(StateType, soma:'StateType'), is_individual(StateType), instance_of(StateType, {atom(state_type)}), 
-                holds(StateType, dul:'classifies',  State)
-            ])
-        """)["State"]
-        if start_time is not None and end_time is not None:
-            self.prolog.ensure_once(f"kb_project(has_time_interval({atom(state_iri)}, {start_time}, {end_time}))")
-        for iri in participant_iris:
-            self.prolog.ensure_once(f"kb_project(has_participant({atom(state_iri)}, {atom(iri)}))")
-        return state_iri
+        graph = self.episode_graph()
+        state = graph.state(participant_iris, start_time, end_time, state_class, state_type)
+        return self.commit_graph(graph)[state]
 
     def assert_situation(self, agent_iri: str, involved_objects: List[str], situation_type="dul:'Situation'") -> str:
-        situation_iri = self.prolog.ensure_once(f"""
-            kb_project([
-                new_iri(Situation, {atom(situation_type)}), is_individual(Situation), instance_of(Situation, {atom(situation_type)}),
-                holds(Situation, dul:'includesAgent', {atom(agent_iri)})
-            ])
-        """)["Situation"]
-        for obj_iri in involved_objects:
-            self.prolog.ensure_once(f"kb_project(holds({atom(situation_iri)}, dul:'includesObject', {atom(obj_iri)}))")
-        return situation_iri
-
-    def assert_object_pose(self, obj_iri: str, obj_pose: Pose, start_time: float = None, end_time: float = None):
-        print(f"Object pose of {obj_iri} at {start_time}: {obj_pose.to_knowrob_string()}")
-        if start_time is not None and end_time is not None:
-            qs_query = f"time_scope({start_time}, {end_time}, QS)"
-        elif start_time is not None and end_time is None:
-            qs_query = f"time_scope({start_time}, {time.time()}, QS)"
-        else:
-            qs_query = f"time_scope({time.time()}, {time.time()}, QS)"
-        self.prolog.ensure_once(
-            f"tf_logger_enable, {qs_query}, tf_set_pose({atom(obj_iri)}, {obj_pose.to_knowrob_string()}, QS),"
-            f"tf_logger_disable")
-
-    def assert_object_trajectory(self, obj_iri: str, obj_poses: List[Pose], start_times: List[float],
-                                 end_times: List[float], insert_last_pose_synchronously=True):
-        """
-        :param insert_last_pose_synchronously: Ensure that the last pose of the trajectory has been inserted when this
-        method returns
-        """
-        # Insert in reversed order, so it becomes easy to wait for the last pose of the trajectory
-        obj_poses_reversed = list(reversed(obj_poses))
-        start_times_reversed = list(reversed(start_times))
-        end_times_reversed = list(reversed(end_times))
-        obj_iris = [obj_iri] * len(obj_poses_reversed)
-        generator = self.pool_executor.map(self.assert_object_pose, obj_iris, obj_poses_reversed, start_times_reversed,
-                                           end_times_reversed)
+        graph = self.episode_graph()
+        situation = graph.situation(agent_iri, involved_objects, situation_type)
+        return self.commit_graph(graph)[situation]
+
+    def assert_object_pose(self, obj_iri: str, obj_pose: Pose, start_time: float = None,
+                           end_time: float = None) -> Optional[Future]:
+        """
+        In write-behind mode, return a Future which resolves once the pose has been inserted.
+        """
+        pose_str = obj_pose.to_knowrob_string()
+        print(f"Object pose of {obj_iri} at {start_time}: {pose_str}")
+        if start_time is None:
+            start_time = time.time()
+        if end_time is None:
+            end_time = time.time()
+        set_pose = TF_SET_POSE.format(start=start_time, end=end_time, frame=obj_iri, pose=PrologTerm(pose_str))
+        if self.write_behind is not None:
+            return self.write_behind.submit(f"tf_logger_enable, {set_pose}, tf_logger_disable")
+        self.prolog.ensure_once(f"tf_logger_enable, {set_pose}, tf_logger_disable")
+
+    def assert_object_trajectory(self, obj_iri: str, obj_poses: Iterable[Pose], start_times: Iterable[float],
+                                 end_times: Iterable[float], insert_last_pose_synchronously=True, batch_size: int = 50,
+                                 max_in_flight: int = None, decimation: Decimation = None) -> "TrajectoryInsertion":
+        """
+        Insert the poses of an object in the background and return a handle to wait for or cancel the insertion.
+        The poses are consumed lazily, so they may come from a generator.
+        :param insert_last_pose_synchronously: Ensure that the whole trajectory has been inserted when this method
+        returns, and raise a TrajectoryInsertionError if any pose could not be inserted
+        :param batch_size: number of poses inserted by a single Prolog goal
+        :param max_in_flight: maximum number of batches being inserted at the same time. Defaults to max_workers.
+        :param decimation: if given, only the poses kept by the decimation are inserted, using the start times as
+        timestamps. The poses are then read completely before the insertion starts, and every pose needs a start time.
+        """
+        poses = zip(obj_poses, start_times, end_times)
+        if decimation is not None:
+            poses = list(poses)
+            indices = decimation.indices([start_time for _, start_time, _ in poses], [pose.pos for pose, _, _ in poses],
+                                         Rotation.concatenate([pose.ori for pose, _, _ in poses]).as_quat()
+                                         if len(poses) > 0 else np.empty((0, 4)))
+            poses = [poses[i] for i in indices]
+            logger.debug(decimation.last_report)
+        insertion = TrajectoryInsertion(self, obj_iri, poses, batch_size,
+                                        max_in_flight if max_in_flight is not None else self.max_workers)
         if insert_last_pose_synchronously:
-            next(generator)
+            insertion.wait()
+        return insertion
 
     ### NEEM Parsing ###############################################################
 
@@ -185,6 +456,7 @@ class NEEMInterface:
         Load a NEEM into the KnowRob knowledge base.
         """
         self.prolog.ensure_once(f"mem_clear_memory, remember({atom(neem_path)})")
+        self.knowledge_base_replaced()
 
     def get_all_actions(self, action_type: str = None) -> List[str]:
         if action_type is not None:  # Filter by action type
@@ -211,15 +483,79 @@ class NEEMInterface:
             return res
         return res["Begin"], res["End"]
 
+    def enable_trajectory_cache(self, window: float = 10.0, max_samples: int = 1000000,
+                                interpolate=False) -> TrajectoryCache:
+        """
+        Answer get_object_pose and get_object_poses with a timestamp from a local TrajectoryCache, which fetches the
+        trajectories of objects with tf_mng_trajectory, one window of the given length in seconds at a time. Like
+        mem_tf_get, it returns the latest pose at or before each time, unless interpolate is True. Times the cache
+        cannot answer are looked up with mem_tf_get.
+        The cache is cleared when the knowledge base changes, see kb_generation.
+        """
+        self.trajectory_cache = TrajectoryCache(
+            lambda obj, start, end: self.get_tf_trajectory(obj, start, end, as_array=True), window, max_samples,
+            interpolate)
+        self._trajectory_cache_generation = self.kb_generation
+        return self.trajectory_cache
+
+    def disable_trajectory_cache(self):
+        self.trajectory_cache = None
+
+    def _trajectories(self) -> Optional[TrajectoryCache]:
+        if self.trajectory_cache is not None and self._trajectory_cache_generation != self.kb_generation:
+            self.trajectory_cache.clear()
+            self._trajectory_cache_generation = self.kb_generation
+        return self.trajectory_cache
+
     def get_object_pose(self, obj: str, timestamp: float = None) -> Pose:
         if timestamp is None:
             query = f"mem_tf_get({atom(obj)}, Pose)"
         else:
+            cache = self._trajectories()
+            if cache is not None:
+                pose = cache.pose_at(obj, timestamp)
+                if pose is not None:
+                    reference_frame, pos, quat = pose
+                    return Pose(reference_frame, pos, Rotation.from_quat(quat))
             query = f"mem_tf_get({atom(obj)}, Pose, {timestamp})"
         return Pose.from_prolog(self.prolog.ensure_once(query)["Pose"])
 
-    def get_tf_trajectory(self, obj: str, start_timestamp: float, end_timestamp: float) -> List:
+    def get_object_poses(self, obj: str, timestamps) -> TrajectoryArray:
+        """
+        Get the poses of an object at many points in time. With the trajectory cache enabled, they are looked up
+        locally, otherwise with mem_tf_get, in one batch.
+        :param timestamps: (N,) in seconds
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        cache = self._trajectories()
+        if cache is not None:
+            poses = cache.poses_at(obj, timestamps)
+        else:
+            n = len(timestamps)
+            poses = TrajectoryArray(np.full(n, np.nan), np.full((n, 3), np.nan), np.full((n, 4), np.nan), frame=obj)
+        missing = np.flatnonzero(np.isnan(poses.timestamps))
+        if len(missing) > 0:
+            results = self.prolog.batch([f"mem_tf_get({atom(obj)}, Pose, {timestamps[i]!r})" for i in missing])
+            for i, result in zip(missing, results):
+                if not result.ok:
+                    raise result.error
+                if result.solution is None:
+                    raise NEEMError(f"Failed to find the pose of {obj} at {timestamps[i]}")
+                reference_frame, pos, quat = result.solution["Pose"]
+                poses.reference_frame = reference_frame
+                poses.timestamps[i] = timestamps[i]
+                poses.positions[i] = pos
+                poses.quaternions[i] = quat
+        return poses
+
+    def get_tf_trajectory(self, obj: str, start_timestamp: float, end_timestamp: float,
+                          as_array=False) -> Union[List, TrajectoryArray]:
+        """
+        :param as_array: return a TrajectoryArray instead of the raw list of Time-Pose terms
+        """
         res = self.prolog.ensure_once(f"tf_mng_trajectory({atom(obj)}, {start_timestamp}, {end_timestamp}, Trajectory)")
+        if as_array:
+            return TrajectoryArray.from_prolog(res["Trajectory"], frame=obj)
         return res["Trajectory"]
 
     def get_wrench_trajectory(self, obj: str, start_timestamp: float, end_timestamp: float) -> List:
@@ -227,21 +563,101 @@ class NEEMInterface:
             f"wrench_mng_trajectory({atom(obj)}, {start_timestamp}, {end_timestamp}, Trajectory)")
         return res["Trajectory"]
 
+    def iter_tf_trajectory(self, obj: str, start_timestamp: float, end_timestamp: float,
+                           window: float = 10.0) -> Iterator[TrajectoryArray]:
+        """
+        Streaming version of get_tf_trajectory: fetch the trajectory in windows of the given length in seconds and yield
+        one TrajectoryArray per window, in order. The next window is fetched on a separate thread while the caller
+        processes the current one, so at most two windows are held in memory.
+        """
+        return self._iter_windows(
+            lambda start, end: TrajectoryArray.from_prolog(self.get_tf_trajectory(obj, start, end), frame=obj),
+            start_timestamp, end_timestamp, window)
+
+    def iter_wrench_trajectory(self, obj: str, start_timestamp: float, end_timestamp: float,
+                               window: float = 10.0) -> Iterator[TrajectoryArray]:
+        """
+        Streaming version of get_wrench_trajectory, see iter_tf_trajectory and TrajectoryArray.from_prolog_wrenches.
+        """
+        return self._iter_windows(
+            lambda start, end: TrajectoryArray.from_prolog_wrenches(self.get_wrench_trajectory(obj, start, end),
+                                                                    frame=obj),
+            start_timestamp, end_timestamp, window)
+
+    def _iter_windows(self, fetch: Callable[[float, float], TrajectoryArray], start_timestamp: float,
+                      end_timestamp: float, window: float) -> Iterator[TrajectoryArray]:
+        if window <= 0:
+            raise ValueError("window must be positive")
+        bounds = []
+        start = start_timestamp
+        while True:
+            end = min(start + window, end_timestamp)
+            bounds.append((start, end))
+            if end >= end_timestamp:
+                break
+            start = end
+        last = len(bounds) - 1
+
+        def generate():
+            # Prefetching on pool_executor would queue behind pose insertions and could occupy all of its workers
+            prefetcher = ThreadPoolExecutor(max_workers=1)
+            future = prefetcher.submit(fetch, *bounds[0])
+            try:
+                for i in range(len(bounds)):
+                    chunk = future.result()
+                    future = prefetcher.submit(fetch, *bounds[i + 1]) if i < last else None
+                    if i < last:
+                        # The end of a window is the start of the next one
+                        chunk = chunk[chunk.timestamps < bounds[i][1]]
+                    yield chunk
+            finally:
+                if future is not None:
+                    future.cancel()
+                prefetcher.shutdown(wait=False)
+
+        return generate()
+
     def get_tasks_for_action(self, action: str) -> List[str]:
         res = self.prolog.ensure_all_solutions(f"""kb_call([executes_task({atom(action)}, Task), 
                                                            instance_of(Task, TaskType), 
                                                            subclass_of(TaskType, dul:'Task')])""")
         return [dic["Task"] for dic in res]
 
+    def enable_triple_snapshot(self) -> TripleStore:
+        """
+        Copy all triples of the knowledge base into a local TripleStore with one query, and answer get_triple_objects,
+        get_triple_subjects, get_triple_predicate_objects and get_triple_subject_predicates from it instead of
+        querying KnowRob. The snapshot is taken again on the next lookup after the knowledge base has changed, see
+        kb_generation. Writes which do not go through a NEEMInterface are not noticed; call this method again to
+        refresh it. The snapshot holds the asserted triples only, so get_triple_objects and get_triple_subjects still
+        query KnowRob for predicates for which holds/3 infers triples, see TripleStore.complete.
+        """
+        self.triple_snapshot = TripleStore.load(self.prolog)
+        self._triple_snapshot_generation = self.kb_generation
+        return self.triple_snapshot
+
+    def disable_triple_snapshot(self):
+        self.triple_snapshot = None
+
+    def _snapshot(self) -> Optional[TripleStore]:
+        if self.triple_snapshot is not None and self._triple_snapshot_generation != self.kb_generation:
+            self.enable_triple_snapshot()
+        return self.triple_snapshot
+
     def get_triple_objects(self, subject: str, predicate: str) -> List[str]:
         """
         Catch-all function for getting the 'object' values for a subject-predicate-object triple.
         :param subject: IRI of the 'subject' of the triple
         :param predicate: IRI of the 'predicate' of the triple
         """
-        res = self.prolog.ensure_all_solutions(f"""kb_call(holds({atom(subject)}, {atom(predicate)}, X))""")
-        if len(res) > 0:
-            return list(set([dic["X"] for dic in res]))  # Deduplicate
+        snapshot = self._snapshot()
+        if snapshot is not None and snapshot.complete(predicate):
+            objects = snapshot.objects(subject, predicate)
+        else:
+            res = self.prolog.ensure_all_solutions(f"""kb_call(holds({atom(subject)}, {atom(predicate)}, X))""")
+            objects = list(set([dic["X"] for dic in res]))  # Deduplicate
+        if len(objects) > 0:
+            return objects
         else:
             raise NEEMError("Failed to find any objects for triple")
 
@@ -251,12 +667,47 @@ class NEEMInterface:
         :param predicate: IRI of the 'predicate' of the triple
         :param object: IRI of the 'object' of the triple
         """
-        res = self.prolog.ensure_all_solutions(f"""kb_call(holds(X, {atom(predicate)}, {atom(object)}))""")
-        if len(res) > 0:
-            return list(set([dic["X"] for dic in res]))  # Deduplicate
+        snapshot = self._snapshot()
+        if snapshot is not None and snapshot.complete(predicate):
+            subjects = snapshot.subjects(predicate, object)
+        else:
+            res = self.prolog.ensure_all_solutions(f"""kb_call(holds(X, {atom(predicate)}, {atom(object)}))""")
+            subjects = list(set([dic["X"] for dic in res]))  # Deduplicate
+        if len(subjects) > 0:
+            return subjects
         else:
             raise NEEMError("Failed to find any subjects for triple")
 
+    def get_triple_predicate_objects(self, subject: str) -> List[Tuple[str, str]]:
+        """
+        Get the (predicate, object) pairs of all triples with the given subject.
+        """
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            pairs = snapshot.predicate_objects(subject)
+        else:
+            res = self.prolog.ensure_once(f"findall([P, X], kb_call(holds({atom(subject)}, P, X)), Pairs)")
+            pairs = list(dict.fromkeys((p, x) for p, x in res["Pairs"]))
+        if len(pairs) > 0:
+            return pairs
+        else:
+            raise NEEMError("Failed to find any triples for subject")
+
+    def get_triple_subject_predicates(self, object: str) -> List[Tuple[str, str]]:
+        """
+        Get the (subject, predicate) pairs of all triples with the given object.
+        """
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            pairs = snapshot.subject_predicates(object)
+        else:
+            res = self.prolog.ensure_once(f"findall([X, P], kb_call(holds(X, P, {atom(object)})), Pairs)")
+            pairs = list(dict.fromkeys((x, p) for x, p in res["Pairs"]))
+        if len(pairs) > 0:
+            return pairs
+        else:
+            raise NEEMError("Failed to find any triples for object")
+
     ################ VR experiment related calls #################
 
     def create_actor(self):
@@ -292,47 +743,36 @@ class NEEMInterface:
                                    task_type,
                                    start_time, end_time,
                                    objects_participated,
-                                   game_participant) -> str:
-
-        # TODO: get an actor if it exists otherwise create a new one
-        self.create_actor_by_given_name(game_participant)
-        actionQueryResponse = self.prolog.ensure_once(f"""
-                kb_project([
-                    new_iri(SubAction, {atom(sub_action_type)}), has_type(SubAction, {atom(sub_action_type)}),
-                    subclass_of({atom(sub_action_type)}, dul:'Action'),
-                    new_iri(Task, {atom(task_type)}), has_type(Task,{atom(task_type)}), executes_task(SubAction,Task),
-                    holds({atom(task_type)}, rdfs:subClassOf, dul:'PhysicalTask'),
-                    triple({atom(parent_action_iri)}, dul:hasConstituent, SubAction),
-                    new_iri(TimeInterval, dul:'TimeInterval'),
-                    has_type(TimeInterval,dul:'TimeInterval'),
-                    holds(SubAction, dul:'hasTimeInterval', TimeInterval),
-                    holds(TimeInterval, soma:'hasIntervalBegin', {float(start_time)}),
-                    holds(TimeInterval, soma:'hasIntervalEnd', {float(end_time)}),
-                    has_type({atom(game_participant)}, dul:'NaturalPerson'), is_performed_by(SubAction,{atom(game_participant)})
-                ]).
-            """)
-        
-        # for each object do this for the action with iri
-        # print("objects_participated from rest call", objects_participated)
-        objects_participated = objects_participated.replace("[", "")
-        objects_participated = objects_participated.replace("]", "")
-        # here the object_with_class_name is arranged like this somaClassName:IndividualName
-        objects_with_class_name = objects_participated.split(",")
-        # print("objects split: ", objects)
-        for object_with_class_name in objects_with_class_name:
-            objects = object_with_class_name.split(":")
-            if len(objects) > 1 :
-                somifiedClassName = "soma:'" + objects[0] + "'"
-                somifiedIndividualName = "soma:'" + objects[1] + "'"
-                # now write prolog query
-                objParticipateQueryResponse = self.prolog.ensure_once(f"""
-                    kb_project([
-                        has_type({atom(somifiedIndividualName)}, {atom(somifiedClassName)}),
-                        subclass_of({atom(somifiedClassName)}, dul:'PhysicalObject'),
-                        holds({atom(actionQueryResponse['SubAction'])}, dul:'hasParticipant', {atom(somifiedIndividualName)})
-                    ]).
-                """)
-
+                                   game_participant) -> dict:
+        """
+        Assert the subaction, its task, its time interval and all participating objects with a single kb_project.
+        Facts about the actor and about classes which have already been asserted in the current VR episode are not
+        asserted again, see KnownFacts.
+        :param objects_participated: "[ClassName:IndividualName,...]" or a list of "ClassName:IndividualName" strings
+        """
+        # Facts which only need to be asserted once per episode
+        static_facts = [f"has_type({atom(game_participant)}, dul:'NaturalPerson')",
+                        f"subclass_of({atom(sub_action_type)}, dul:'Action')",
+                        f"holds({atom(task_type)}, rdfs:subClassOf, dul:'PhysicalTask')"]
+        participation_facts = []
+        for class_name, individual_name in parse_objects_participated(objects_participated):
+            somified_class_name = atom("soma:'" + class_name + "'")
+            somified_individual_name = atom("soma:'" + individual_name + "'")
+            static_facts.append(f"has_type({somified_individual_name}, {somified_class_name})")
+            static_facts.append(f"subclass_of({somified_class_name}, dul:'PhysicalObject')")
+            participation_facts.append(f"holds(SubAction, dul:'hasParticipant', {somified_individual_name})")
+        new_static_facts = self.known_facts.unknown(static_facts)
+        facts = [f"new_iri(SubAction, {atom(sub_action_type)})", f"has_type(SubAction, {atom(sub_action_type)})",
+                 f"new_iri(Task, {atom(task_type)})", f"has_type(Task, {atom(task_type)})",
+                 "executes_task(SubAction, Task)",
+                 f"triple({atom(parent_action_iri)}, dul:hasConstituent, SubAction)",
+                 "new_iri(TimeInterval, dul:'TimeInterval')", "has_type(TimeInterval, dul:'TimeInterval')",
+                 "holds(SubAction, dul:'hasTimeInterval', TimeInterval)",
+                 f"holds(TimeInterval, soma:'hasIntervalBegin', {float(start_time)})",
+                 f"holds(TimeInterval, soma:'hasIntervalEnd', {float(end_time)})",
+                 f"is_performed_by(SubAction, {atom(game_participant)})"] + new_static_facts + participation_facts
+        actionQueryResponse = self.prolog.ensure_once(f"kb_project([{', '.join(facts)}])")
+        self.known_facts.add(new_static_facts)
         return actionQueryResponse
 
     # this method creates a new episode with suppliment information such as who performs it, 
@@ -344,6 +784,7 @@ class NEEMInterface:
         it(as start time) to the top level action and extra tf frames can be ignored
         """
         # TODO: get an actor if it exists otherwise create a new one
+        self.known_facts.clear()
         self.create_actor_by_given_name(game_participant)
         episodeQueryResponse = self.prolog.ensure_once(f"""
                 tf_logger_enable,
@@ -363,6 +804,7 @@ class NEEMInterface:
                     new_iri(Role, soma:'AgentRole'), has_type(Role, soma:'AgentRole'), has_role({atom(game_participant)},Role)
                 ]).
             """)
+        self.known_facts.add([f"has_type({atom(game_participant)}, dul:'NaturalPerson')"])
         # response include Instances of Episode, Action, TimeInterval, Task, and Role 
         return episodeQueryResponse
 
@@ -382,21 +824,153 @@ class NEEMInterface:
                      holds(TimeInterval, soma:'hasIntervalEnd', Time)
                 ]).
             """)
+        self.known_facts.clear()
         # response include Instances of Action, and TimeInterval
         return episodeQueryResponse
 
     # def hand_participate_in_action(self, hand_type):
         
     
+class TrajectoryInsertion:
+    """
+    Handle of a trajectory which NEEMInterface.assert_object_trajectory inserts in the background.
+    A feeder thread cuts the poses into batches and submits them to the pool executor of the NEEMInterface in trajectory
+    order, blocking while max_in_flight batches are being inserted. Each batch is a single goal which enables the tf
+    logger, inserts every pose under its own catch/3 and disables the logger again, so a failing pose neither aborts
+    the rest of its batch nor gets the poses before it inserted twice. If a batch query fails as a whole, all of its
+    poses are reported as failed, as it is unknown which of them have been inserted.
+    """
+
+    def __init__(self, neem_interface: NEEMInterface, obj_iri: str, poses: Iterable[Tuple[Pose, float, float]],
+                 batch_size: int, max_in_flight: int):
+        """
+        :param poses: (pose, start time, end time) tuples. Missing times default to the time of insertion.
+        """
+        self.obj_iri = obj_iri
+        self._neem_interface = neem_interface
+        self._batch_size = max(batch_size, 1)
+        self._in_flight = threading.BoundedSemaphore(max(max_in_flight, 1))
+        self._lock = threading.Lock()
+        self._futures = []
+        self._errors = {}
+        self._feeder_error = None
+        self._inserted = 0
+        self._cancelled = threading.Event()
+        self._feeder = threading.Thread(target=self._feed, args=(iter(poses),), daemon=True)
+        self._feeder.start()
+
+    @property
+    def inserted(self) -> int:
+        """
+        Number of poses inserted so far
+        """
+        return self._inserted
+
+    @property
+    def errors(self) -> Dict[int, Exception]:
+        """
+        Exceptions of the poses which could not be inserted so far, by index of the pose in the trajectory
+        """
+        with self._lock:
+            return dict(self._errors)
+
+    def done(self) -> bool:
+        return not self._feeder.is_alive()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """
+        Stop submitting batches and drop the batches which have not started yet.
+        Batches which are already being inserted run to completion.
+        """
+        self._cancelled.set()
+        with self._lock:
+            for future in self._futures:
+                future.cancel()
+
+    def wait(self, timeout: float = None) -> int:
+        """
+        Wait until all poses have been inserted or the insertion was cancelled, and return the number of inserted poses.
+        Raise a TrajectoryInsertionError if any pose could not be inserted.
+        """
+        self._feeder.join(timeout)
+        if self._feeder.is_alive():
+            raise futures.TimeoutError(f"Trajectory of {self.obj_iri} was not inserted within {timeout} s")
+        if self._feeder_error is not None:
+            raise self._feeder_error
+        if len(self._errors) > 0:
+            raise TrajectoryInsertionError(self.errors)
+        return self._inserted
+
+    def _feed(self, poses: Iterable[Tuple[Pose, float, float]]):
+        try:
+            index = 0
+            while not self._cancelled.is_set():
+                batch = list(itertools.islice(poses, self._batch_size))
+                if len(batch) == 0:
+                    break
+                self._in_flight.acquire()
+                if self._cancelled.is_set():
+                    self._in_flight.release()
+                    break
+                future = self._neem_interface.pool_executor.submit(self._insert_batch, index, batch)
+                future.add_done_callback(lambda _: self._in_flight.release())
+                with self._lock:
+                    self._futures.append(future)
+                index += len(batch)
+        except Exception as e:
+            self._feeder_error = e
+        finally:
+            # Batches which are already being inserted must finish before the insertion counts as done
+            futures.wait(self._futures)
+
+    def _insert_batch(self, index: int, batch: List[Tuple[Pose, float, float]]):
+        try:
+            rows = [self._pose_row(pose, start_time, end_time) for pose, start_time, end_time in batch]
+            statuses = self._neem_interface.prolog.ensure_once(TF_SET_POSES_WITH_STATUS.format(points=rows))["Statuses"]
+        except Exception as e:
+            with self._lock:
+                for offset in range(len(batch)):
+                    self._errors[index + offset] = e
+            return
+        with self._lock:
+            for offset, status in enumerate(statuses):
+                if status == "true":
+                    self._inserted += 1
+                else:
+                    outcome = "raised an error" if status == "error" else "failed"
+                    self._errors[index + offset] = PrologException(f"Pose {index + offset} of {self.obj_iri} {outcome}")
+
+    def _pose_row(self, pose: Pose, start_time: Optional[float], end_time: Optional[float]) -> List:
+        now = time.time()
+        return [start_time if start_time is not None else now, end_time if end_time is not None else now,
+                self.obj_iri, PrologTerm(pose.to_knowrob_string())]
+
+
 class Episode:
     """
     Convenience object and context manager for NEEM creation. Can be used in a 'with' statement to automatically
     start and end a NEEM context (episode).
+
+    With a checkpoint_interval, the tf poses recorded so far are periodically dumped into a checkpoint directory and
+    removed from the knowledge base, so memory usage during the episode does not grow with its length, and a crash
+    loses at most one interval of poses. At the end of the episode, the NEEM is saved with the poses recorded since the
+    last checkpoint, and the checkpoints are merged into its tf collection on disk, without loading them back into the
+    knowledge base. The checkpoints are written and merged by KnowRob, so checkpoint_path, like neem_output_path, is a
+    path on the KnowRob host.
     """
 
     def __init__(self, neem_interface: NEEMInterface, task_type: str, env_owl: str, env_owl_ind_name: str,
                  env_urdf: str, agent_owl: str, agent_owl_ind_name: str, agent_urdf: str, neem_output_path: str,
-                 start_time=None):
+                 start_time=None, checkpoint_interval: float = None, checkpoint_path: str = None):
+        """
+        :param checkpoint_interval: seconds between two checkpoints, or None to keep everything in the knowledge base
+        until the end of the episode
+        :param checkpoint_path: directory for the checkpoints, defaults to <neem_output_path>/checkpoints. It is
+        deleted after the checkpoints have been merged into the NEEM.
+        """
         self.neem_interface = neem_interface
         self.task_type = task_type
         self.env_owl = env_owl
@@ -411,6 +985,17 @@ class Episode:
         self.episode_iri = None
         self.start_time = start_time if start_time is not None else time.time()
 
+        if checkpoint_interval is not None and checkpoint_interval <= 0:
+            raise ValueError("checkpoint_interval must be positive")
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_path = checkpoint_path if checkpoint_path is not None \
+            else os.path.join(neem_output_path, "checkpoints")
+        self.checkpoints: List[str] = []
+        self.bytes_written = 0
+        self._checkpoint_lock = threading.Lock()
+        self._stop_checkpointing = threading.Event()
+        self._checkpoint_thread = None
+
     def __enter__(self):
         self.top_level_action_iri = self.neem_interface.start_episode(self.task_type, self.env_owl,
                                                                       self.env_owl_ind_name, self.env_urdf,
@@ -421,7 +1006,39 @@ class Episode:
             self.neem_interface.prolog.ensure_once(
                 f"kb_call(is_setting_for(Episode, {atom(self.top_level_action_iri)}))")[
                 "Episode"]
+        if self.checkpoint_interval is not None:
+            self._stop_checkpointing.clear()
+            self._checkpoint_thread = threading.Thread(target=self._checkpoint_periodically, daemon=True)
+            self._checkpoint_thread.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._checkpoint_thread is not None:
+            self._stop_checkpointing.set()
+            self._checkpoint_thread.join()
+            self._checkpoint_thread = None
         self.neem_interface.stop_episode(self.neem_output_path)
+        if len(self.checkpoints) > 0:
+            self.neem_interface.merge_tf_checkpoints(self.neem_output_path, self.checkpoints)
+            self.neem_interface.remove_tf_checkpoints(self.checkpoint_path)
+            self.checkpoints = []
+
+    def checkpoint(self) -> int:
+        """
+        Dump the tf poses recorded since the last checkpoint into a new checkpoint directory and remove them from the
+        knowledge base. Return the number of bytes written.
+        """
+        with self._checkpoint_lock:
+            path = os.path.join(self.checkpoint_path, f"{len(self.checkpoints):06d}")
+            size = self.neem_interface.checkpoint_tf(path, time.time())
+            self.checkpoints.append(path)
+            self.bytes_written += size
+            return size
+
+    def _checkpoint_periodically(self):
+        while not self._stop_checkpointing.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                # The poses stay in the knowledge base and are part of the next checkpoint
+                logger.warning(f"Checkpoint of episode {self.episode_iri} failed: {e}")
@@ -0,0 +1,223 @@
+"""
+Writes the tf and wrench collections of a NEEM directly to disk, without sending every sample through rosbridge and
+KnowRob.
+"""
+
+import json
+import os
+import struct
+import time
+import uuid
+from typing import Dict, List, Union
+
+import numpy as np
+
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+from src.neem_interface_python.utils.utils import Datapoint
+
+_BSON_DOUBLE = 0x01
+_BSON_STRING = 0x02
+_BSON_DOCUMENT = 0x03
+_BSON_ARRAY = 0x04
+_BSON_OBJECT_ID = 0x07
+_BSON_BOOL = 0x08
+_BSON_DATETIME = 0x09
+_BSON_NULL = 0x0A
+_BSON_INT32 = 0x10
+_BSON_INT64 = 0x12
+
+
+class _Slot:
+    def __init__(self, name: str, bson_type: int, size: int):
+        """
+        Placeholder for a value which differs between the documents of a collection, see _DocumentLayout
+        """
+        self.name = name
+        self.bson_type = bson_type
+        self.size = size
+
+
+def _double(name: str) -> _Slot:
+    return _Slot(name, _BSON_DOUBLE, 8)
+
+
+def _datetime(name: str) -> _Slot:
+    return _Slot(name, _BSON_DATETIME, 8)
+
+
+def encode_document(document: Dict, slots: Dict[str, int] = None, offset: int = 0) -> bytes:
+    """
+    Minimal BSON encoder for the types which occur in tf and wrench documents: float, int, str, bool, None, dict and
+    list. _Slots are encoded as zeros, and their byte offsets are stored in slots.
+    """
+    parts = []
+    position = offset + 4
+    for key, value in document.items():
+        element = _encode_element(key, value, slots, position)
+        parts.append(element)
+        position += len(element)
+    body = b"".join(parts)
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+
+def _encode_element(key: str, value, slots: Dict[str, int], offset: int) -> bytes:
+    name = key.encode("utf-8") + b"\x00"
+    if isinstance(value, _Slot):
+        slots[value.name] = offset + 1 + len(name)
+        return bytes([value.bson_type]) + name + bytes(value.size)
+    if isinstance(value, bool):
+        return bytes([_BSON_BOOL]) + name + (b"\x01" if value else b"\x00")
+    if isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            return bytes([_BSON_INT32]) + name + struct.pack("<i", value)
+        return bytes([_BSON_INT64]) + name + struct.pack("<q", value)
+    if isinstance(value, float):
+        return bytes([_BSON_DOUBLE]) + name + struct.pack("<d", value)
+    if isinstance(value, str):
+        encoded = value.encode("utf-8")
+        return bytes([_BSON_STRING]) + name + struct.pack("<i", len(encoded) + 1) + encoded + b"\x00"
+    if value is None:
+        return bytes([_BSON_NULL]) + name
+    if isinstance(value, dict):
+        header = bytes([_BSON_DOCUMENT]) + name
+        return header + encode_document(value, slots, offset + len(header))
+    if isinstance(value, (list, tuple)):
+        header = bytes([_BSON_ARRAY]) + name
+        return header + encode_document({str(i): v for i, v in enumerate(value)}, slots, offset + len(header))
+    raise TypeError(f"Cannot encode {value!r} of type {type(value).__name__} as BSON")
+
+
+class _DocumentLayout:
+    def __init__(self, template: Dict):
+        """
+        The byte layout shared by documents which only differ in the values of their _Slots. Encoding N such documents
+        then amounts to filling the columns of an N x size byte matrix with numpy.
+        """
+        self.slots: Dict[str, int] = {}
+        self.template = np.frombuffer(encode_document(template, self.slots), dtype=np.uint8)
+        self.size = len(self.template)
+
+    def encode(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        :param columns: maps the name of each slot to an array of N values, already in the byte order and type of the
+        slot, e.g. '<f8' for doubles
+        """
+        n = len(next(iter(columns.values())))
+        documents = np.empty((n, self.size), dtype=np.uint8)
+        documents[:] = self.template
+        for name, offset in self.slots.items():
+            column = np.ascontiguousarray(columns[name]).view(np.uint8).reshape(n, -1)
+            documents[:, offset:offset + column.shape[1]] = column
+        return documents
+
+
+class OfflineNEEMWriter:
+    """
+    Writes tf and wrench trajectories into the directory of a NEEM, in the format of mongodump, which is how
+    mem_episode_stop stores NEEMs and how remember/1 loads them: one <collection>.bson file of concatenated BSON
+    documents and one <collection>.metadata.json file per collection, in a subdirectory named after the database.
+
+    The documents follow the layout KnowRob's tf memory uses (geometry_msgs/TransformStamped plus __recorded and
+    __topic). Wrench documents are assumed to be stored as geometry_msgs/WrenchStamped in the same way.
+
+    mem_episode_stop dumps the whole database and replaces the files of all collections, so write the trajectories
+    after stop_episode, or into a NEEM directory of their own. Calling the write methods several times appends to the
+    collection.
+    """
+
+    def __init__(self, neem_dir: str, database: str = "roslog"):
+        self.neem_dir = neem_dir
+        self.database = database
+        self.collection_dir = os.path.join(neem_dir, database)
+        self.bytes_written: Dict[str, int] = {}
+        self._seq: Dict[str, int] = {}
+        self._machine_id = np.frombuffer(uuid.uuid4().bytes[:5], dtype=np.uint8)
+        self._object_id_counter = int.from_bytes(uuid.uuid4().bytes[:3], "big")
+        os.makedirs(self.collection_dir, exist_ok=True)
+
+    def write_tf(self, trajectory: Union[TrajectoryArray, List[Datapoint]], topic: str = "/tf",
+                 collection: str = "tf") -> int:
+        """
+        Append the poses of a trajectory to the tf collection and return the number of bytes written.
+        """
+        if not isinstance(trajectory, TrajectoryArray):
+            trajectory = TrajectoryArray.from_datapoints(trajectory)
+        if len(trajectory) == 0:
+            return 0
+        layout = _DocumentLayout({
+            "_id": _Slot("_id", _BSON_OBJECT_ID, 12),
+            "header": {"seq": _Slot("seq", _BSON_INT32, 4), "stamp": _datetime("stamp"),
+                       "frame_id": trajectory.reference_frame},
+            "child_frame_id": trajectory.frame,
+            "transform": {"translation": {"x": _double("tx"), "y": _double("ty"), "z": _double("tz")},
+                          "rotation": {"x": _double("qx"), "y": _double("qy"), "z": _double("qz"),
+                                       "w": _double("qw")}},
+            "__recorded": _datetime("recorded"),
+            "__topic": topic,
+        })
+        columns = self._common_columns(collection, trajectory.timestamps)
+        for i, name in enumerate(["tx", "ty", "tz"]):
+            columns[name] = trajectory.positions[:, i].astype("<f8")
+        for i, name in enumerate(["qx", "qy", "qz", "qw"]):
+            columns[name] = trajectory.quaternions[:, i].astype("<f8")
+        return self._append(collection, layout.encode(columns), [{"child_frame_id": 1}, {"header.stamp": 1}])
+
+    def write_wrenches(self, trajectory: TrajectoryArray, topic: str = "/wrench", collection: str = "wrench") -> int:
+        """
+        Append the wrenches of a trajectory to the wrench collection and return the number of bytes written.
+        The frame of the trajectory is used as frame_id of the wrenches.
+        """
+        if trajectory.wrenches is None:
+            raise ValueError(f"Trajectory of {trajectory.frame} has no wrenches")
+        if len(trajectory) == 0:
+            return 0
+        layout = _DocumentLayout({
+            "_id": _Slot("_id", _BSON_OBJECT_ID, 12),
+            "header": {"seq": _Slot("seq", _BSON_INT32, 4), "stamp": _datetime("stamp"),
+                       "frame_id": trajectory.frame},
+            "wrench": {"force": {"x": _double("fx"), "y": _double("fy"), "z": _double("fz")},
+                       "torque": {"x": _double("mx"), "y": _double("my"), "z": _double("mz")}},
+            "__recorded": _datetime("recorded"),
+            "__topic": topic,
+        })
+        columns = self._common_columns(collection, trajectory.timestamps)
+        for i, name in enumerate(["fx", "fy", "fz", "mx", "my", "mz"]):
+            columns[name] = trajectory.wrenches[:, i].astype("<f8")
+        return self._append(collection, layout.encode(columns), [{"header.frame_id": 1}, {"header.stamp": 1}])
+
+    def _common_columns(self, collection: str, timestamps: np.ndarray) -> Dict[str, np.ndarray]:
+        n = len(timestamps)
+        seq = self._seq.get(collection, 0)
+        self._seq[collection] = seq + n
+        stamps = np.round(timestamps * 1000.0).astype("<i8")
+        return {"_id": self._object_ids(n), "seq": np.arange(seq, seq + n, dtype="<i4"), "stamp": stamps,
+                "recorded": stamps}
+
+    def _object_ids(self, n: int) -> np.ndarray:
+        """
+        ObjectIds as mongo creates them: 4 byte big-endian timestamp, 5 random bytes, 3 byte big-endian counter
+        """
+        ids = np.empty((n, 12), dtype=np.uint8)
+        ids[:, 0:4] = np.frombuffer(struct.pack(">I", int(time.time())), dtype=np.uint8)
+        ids[:, 4:9] = self._machine_id
+        counters = (self._object_id_counter + np.arange(n, dtype=np.uint32)) & 0xFFFFFF
+        self._object_id_counter = int(counters[-1]) + 1
+        ids[:, 9] = counters >> 16
+        ids[:, 10] = (counters >> 8) & 0xFF
+        ids[:, 11] = counters & 0xFF
+        return ids
+
+    def _append(self, collection: str, documents: np.ndarray, indexes: List[Dict]) -> int:
+        with open(os.path.join(self.collection_dir, f"{collection}.bson"), "ab") as f:
+            f.write(documents.tobytes())
+        metadata_path = os.path.join(self.collection_dir, f"{collection}.metadata.json")
+        if not os.path.exists(metadata_path):
+            namespace = f"{self.database}.{collection}"
+            metadata = {"options": {}, "collectionName": collection, "uuid": uuid.uuid4().hex,
+                        "indexes": [{"v": 2, "key": {"_id": 1}, "name": "_id_", "ns": namespace}] +
+                                   [{"v": 2, "key": key, "name": "_".join(f"{k}_{v}" for k, v in key.items()),
+                                     "ns": namespace} for key in indexes]}
+            with open(metadata_path, "w") as f:
+                json.dump(metadata, f)
+        self.bytes_written[collection] = self.bytes_written.get(collection, 0) + documents.size
+        return documents.size
@@ -2,22 +2,42 @@
 Rosprolog client loosely coupled to ROS and compatible with Python 3
 """
 
+import itertools
 import json
+import logging
 import os
+import queue
+import threading
+import time
+import uuid
+from concurrent import futures
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
 from enum import Enum
-from typing import Optional, Dict, List, Iterator
-from urllib.parse import urlparse
-import re
+from typing import Optional, Dict, List, Iterator, Tuple, Callable
 
 import roslibpy
 
-from src.neem_interface_python.utils.rosbridge import ros_client
+from src.neem_interface_python.utils.instrumentation import PrologInstrumentation
+from src.neem_interface_python.utils.query_cache import QueryCache, is_mutating, is_volatile
+from src.neem_interface_python.utils.rosbridge import RosbridgeConnection, RosbridgeConnectionPool, \
+    get_connection_pool
+from src.neem_interface_python.utils.terms import atom  # Re-exported, most modules import atom from here
+
+logger = logging.getLogger(__name__)
 
 
 class PrologException(Exception):
     pass
 
 
+class PrologQueryRejected(PrologException):
+    """
+    The query service rejected a query before executing any of it, e.g. because of a syntax error.
+    """
+    pass
+
+
 class PrologNextSolutionResponse(Enum):
     NO_SOLUTION = 0
     WRONG_ID = 1
@@ -25,6 +45,111 @@ class PrologNextSolutionResponse(Enum):
     OK = 3
 
 
+class PrologBatchResult(object):
+    def __init__(self, query_str: str, solution: Optional[Dict] = None, error: Optional[PrologException] = None):
+        """
+        Outcome of a single query submitted through Prolog.batch.
+        :param solution: first solution of the query, or None if Prolog returned false or the query failed
+        :param error: the exception raised while executing the query, if any
+        """
+        self.query_str = query_str
+        self.solution = solution
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"PrologBatchResult(query_str={self.query_str!r}, solution={self.solution!r}, error={self.error!r})"
+
+
+_process_token = uuid.uuid4().hex[:12]
+_query_counter = itertools.count()
+
+
+def new_query_id(prefix: str = "PYTHON_QUERY") -> str:
+    """
+    Return a query id which is unique among all queries of all processes talking to rosprolog.
+    The process id and a random token distinguish processes, a counter distinguishes the queries of a process.
+    """
+    # next() on itertools.count is atomic, so no two threads can draw the same number
+    return f"{prefix}_{os.getpid()}_{_process_token}_{next(_query_counter)}"
+
+
+def _rosprolog_services(connection: RosbridgeConnection,
+                        name_space: str) -> Tuple[roslibpy.Service, roslibpy.Service, roslibpy.Service]:
+    """
+    Return the query, next_solution and finish services of the rosprolog node in the given namespace.
+    """
+    simple_query_srv = connection.service(f'{name_space}/query', "json_prolog_msgs/srv/PrologQuery")
+    next_solution_srv = connection.service(f'{name_space}/next_solution', "json_prolog_msgs/srv/PrologNextSolution")
+    finish_srv = connection.service(f'{name_space}/finish', "json_prolog_msgs/srv/PrologFinish")
+    return simple_query_srv, next_solution_srv, finish_srv
+
+
+def _call_service_async(srv: roslibpy.Service, request: Dict) -> Future:
+    """
+    Call a rosbridge service without blocking and return a Future which resolves to the service response.
+    """
+    future = Future()
+
+    def on_error(error):
+        future.set_exception(PrologException(f"Call to service {srv.name} failed: {error}"))
+
+    srv.call(roslibpy.ServiceRequest(request), callback=future.set_result, errback=on_error)
+    return future
+
+
+def _finish_async(finish_srv: roslibpy.Service, query_id: str) -> Future:
+    """
+    Send a finish request without waiting for the reply. Failures are logged, since nobody waits for them.
+    """
+    def log_failure(future: Future):
+        if future.exception() is not None:
+            logger.warning(f"Failed to finish query {query_id}: {future.exception()}")
+
+    future = _call_service_async(finish_srv, {"id": query_id})
+    future.add_done_callback(log_failure)
+    return future
+
+
+def _finish_when_started(start_future: Future, finish_srv: roslibpy.Service, query_id: str):
+    """
+    Finish a query whose query request was given up on (e.g. after a timeout) as soon as rosprolog accepts it, so it
+    does not stay open on the server.
+    """
+    def on_started(future: Future):
+        if future.exception() is None and future.result()["ok"]:
+            _finish_async(finish_srv, query_id)
+
+    start_future.add_done_callback(on_started)
+
+
+def _parse_next_solution(next_solution: Dict, query_id: str,
+                         instrumentation: PrologInstrumentation = None) -> Optional[Dict]:
+    """
+    Convert a response of the next_solution service into a solution dict.
+    Return None if there are no more solutions, raise a PrologException if the query failed.
+    """
+    # Have to compare to .value here because roslibpy msg does not have types
+    if next_solution["status"] == PrologNextSolutionResponse.OK.value:
+        if instrumentation is None:
+            return json.loads(next_solution["solution"])
+        start = time.perf_counter()
+        solution = json.loads(next_solution["solution"])
+        instrumentation.record_decode(time.perf_counter() - start)
+        return solution
+    elif next_solution["status"] == PrologNextSolutionResponse.WRONG_ID.value:
+        raise PrologException(f'Query id {query_id} invalid. Maybe another process terminated our query?')
+    elif next_solution["status"] == PrologNextSolutionResponse.QUERY_FAILED.value:
+        raise PrologException(f'Prolog query failed: {next_solution["solution"]}')
+    elif next_solution["status"] == PrologNextSolutionResponse.NO_SOLUTION.value:
+        return None
+    else:
+        raise PrologException(f'Unknown query status {next_solution["solution"]}')
+
+
 class Upper(object):
     def __init__(self, iterable):
         self._iter = iter(iterable)
@@ -36,23 +161,123 @@ class Upper(object):
         return self
 
 
+class QueryRegistry(object):
+    def __init__(self):
+        """
+        Thread-safe registry of the queries of a client which have been started but not finished yet.
+        """
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def register(self, query: "PrologQuery"):
+        with self._lock:
+            if query.get_id() in self._queries:
+                raise PrologException(f"Query id {query.get_id()} is already in use")
+            self._queries[query.get_id()] = query
+
+    def unregister(self, query_id: str):
+        with self._lock:
+            self._queries.pop(query_id, None)
+
+    def get(self, query_id: str) -> Optional["PrologQuery"]:
+        with self._lock:
+            return self._queries.get(query_id)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._queries.keys())
+
+    def finish_all(self):
+        with self._lock:
+            queries = list(self._queries.values())
+        for query in queries:
+            query.finish()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._queries)
+
+
+class _FusedQuery(object):
+    def __init__(self, query_id: str, finish_srv: roslibpy.Service, registry: QueryRegistry):
+        """
+        Registry entry of a query run by Prolog.once_fused, which is finished without waiting for the reply.
+        """
+        self._query_id = query_id
+        self._finish_srv = finish_srv
+        self._registry = registry
+        self._finish_future: Optional[Future] = None
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def get_id(self) -> str:
+        return self._query_id
+
+    def finish_async(self):
+        """
+        Send the finish request and unregister the query once it has been answered
+        """
+        with self._lock:
+            if self._finish_future is None:
+                self._finish_future = _finish_async(self._finish_srv, self._query_id)
+                self._finish_future.add_done_callback(lambda _: self._registry.unregister(self._query_id))
+
+    def finish(self):
+        """
+        Send the finish request if that has not happened yet, and wait for its reply
+        """
+        self.finish_async()
+        self._finish_future.result()
+
+    def forget(self):
+        self._registry.unregister(self._query_id)
+
+
+def _check_prefetch(prefetch: int, unordered: bool):
+    if prefetch < 1:
+        raise ValueError(f"prefetch must be at least 1, got {prefetch}")
+    if prefetch > 1 and not unordered:
+        raise ValueError("With prefetch > 1, solutions are yielded in the order their replies arrive. Pass "
+                         "unordered=True if the order of the solutions does not matter.")
+
+
 class PrologQuery(object):
     def __init__(self, query_str: str, simple_query_srv: roslibpy.Service, next_solution_srv: roslibpy.Service,
-                 finish_srv: roslibpy.Service, iterative=True):
+                 finish_srv: roslibpy.Service, iterative=True, prefetch: int = 1, unordered=False,
+                 registry: QueryRegistry = None, instrumentation: PrologInstrumentation = None):
         """
         This class wraps around the different rosprolog services to provide a convenient python interface.
         :param iterative: if False, all solutions will be calculated by rosprolog during the first service call
+        :param prefetch: number of next_solution requests kept outstanding while iterating over the solutions.
+        With prefetch > 1, rosbridge may serve the outstanding requests in any order, so solutions are yielded in
+        the order their replies arrive, which can differ from the order of sequential iteration. The order in which
+        rosprolog handled the requests is not known to the client, so it cannot be restored.
+        :param unordered: must be True for prefetch > 1, to acknowledge that the solutions may arrive in any order
+        :param registry: registry which tracks this query until it is finished
+        :param instrumentation: records the time spent decoding solutions
         """
+        _check_prefetch(prefetch, unordered)
         self._simple_query_srv = simple_query_srv
         self._next_solution_srv = next_solution_srv
         self._finish_query_srv = finish_srv
+        self._prefetch = prefetch
+        self._registry = registry
+        self._instrumentation = instrumentation
 
         self._finished = False
+        self._finish_lock = threading.Lock()
         self._query_id = None
-        result = self._simple_query_srv.call(roslibpy.ServiceRequest({"id": self.get_id(), "query": query_str,
-                                                                      "mode": 1 if iterative else 0}))
+        if self._registry is not None:
+            self._registry.register(self)
+        try:
+            result = self._simple_query_srv.call(roslibpy.ServiceRequest({"id": self.get_id(), "query": query_str,
+                                                                          "mode": 1 if iterative else 0}))
+        except Exception:
+            self._forget()
+            raise
         if not result["ok"]:
-            raise PrologException('Prolog query failed: {}'.format(result["message"]))
+            self._forget()
+            raise PrologQueryRejected('Prolog query failed: {}'.format(result["message"]))
 
     def __enter__(self):
         return self
@@ -62,68 +287,201 @@ class PrologQuery(object):
 
     def solutions(self) -> Iterator[Dict]:
         try:
+            if self._prefetch > 1:
+                yield from self._prefetched_solutions()
+                return
             while not self._finished:
                 next_solution = self._next_solution_srv.call(roslibpy.ServiceRequest({"id": self.get_id()}))
-                if next_solution[
-                    "status"] == PrologNextSolutionResponse.OK.value:  # Have to compare to .value here because roslibpy msg does not have types
-                    yield self._json_to_dict(next_solution["solution"])
-                elif next_solution["status"] == PrologNextSolutionResponse.WRONG_ID.value:
-                    raise PrologException(
-                        f'Query id {self.get_id()} invalid. Maybe another process terminated our query?')
-                elif next_solution["status"] == PrologNextSolutionResponse.QUERY_FAILED.value:
-                    raise PrologException(f'Prolog query failed: {next_solution["solution"]}')
-                elif next_solution["status"] == PrologNextSolutionResponse.NO_SOLUTION.value:
+                solution = _parse_next_solution(next_solution, self.get_id(), self._instrumentation)
+                if solution is None:
                     break
-                else:
-                    raise PrologException(f'Unknown query status {next_solution["solution"]}')
+                yield solution
         finally:
             self.finish()
 
+    def _prefetched_solutions(self) -> Iterator[Dict]:
+        """
+        Keep up to prefetch next_solution requests outstanding and yield the solutions in the order their replies
+        arrive. Replies can arrive in a different order than the requests were sent, so a NO_SOLUTION reply only
+        stops sending new requests: the replies to all outstanding requests are still collected.
+        """
+        completed = queue.Queue()
+        outstanding = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and outstanding < self._prefetch:
+                    _call_service_async(self._next_solution_srv, {"id": self.get_id()}).add_done_callback(
+                        completed.put)
+                    outstanding += 1
+                if outstanding == 0:
+                    break
+                future = completed.get()
+                outstanding -= 1
+                solution = _parse_next_solution(future.result(), self.get_id(), self._instrumentation)
+                if solution is None:
+                    exhausted = True
+                else:
+                    yield solution
+        finally:
+            # Wait for the outstanding requests, so they are not answered after the query has been finished
+            for _ in range(outstanding):
+                completed.get()
+
     def finish(self):
-        if not self._finished:
-            try:
-                self._finish_query_srv.call(roslibpy.ServiceRequest({"id": self.get_id()}))
-            finally:
-                self._finished = True
+        with self._finish_lock:
+            if not self._finished:
+                try:
+                    self._finish_query_srv.call(roslibpy.ServiceRequest({"id": self.get_id()}))
+                finally:
+                    self._forget()
+
+    def _forget(self):
+        self._finished = True
+        if self._registry is not None:
+            self._registry.unregister(self.get_id())
 
     def get_id(self):
         """
         :rtype: str
         """
         if self._query_id is None:
-            self._query_id = 'PYTHON_QUERY_{}'.format(roslibpy.Time.now().to_nsec())
+            self._query_id = new_query_id()
         return self._query_id
 
-    def _json_to_dict(self, json_text):
+
+class _RosprologClient(object):
+    def __init__(self, name_space: str, connection: RosbridgeConnection = None,
+                 pool: RosbridgeConnectionPool = None):
         """
-        :type json_text: str
-        :rtype: dict
+        Common base of Prolog and AsyncProlog, which hands out rosbridge connections to the individual queries.
+        :param connection: connection used for all queries. If None, every query leases a connection from the pool.
+        :param pool: pool to lease connections from. Defaults to the pool returned by get_connection_pool().
         """
-        return json.loads(json_text)
+        self._name_space = name_space
+        self._connection = connection
+        self._pool = pool
 
+    @contextmanager
+    def _connection_lease(self) -> Iterator[RosbridgeConnection]:
+        if self._connection is not None:
+            yield self._connection
+            return
+        pool = self._pool if self._pool is not None else get_connection_pool()
+        connection = pool.acquire()
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+
+    def _services(self, connection: RosbridgeConnection) -> Tuple[roslibpy.Service, roslibpy.Service,
+                                                                  roslibpy.Service]:
+        return _rosprolog_services(connection, self._name_space)
 
-class Prolog(object):
-    def __init__(self, name_space='rosprolog'):
+
+class Prolog(_RosprologClient):
+    def __init__(self, name_space='rosprolog', prefetch: int = 1, cache: QueryCache = None,
+                 connection: RosbridgeConnection = None, pool: RosbridgeConnectionPool = None, fused_once=False,
+                 instrumentation: PrologInstrumentation = None, unordered=False, on_write: Callable[[], None] = None):
         """
         :type name_space: str
-        :param timeout: Amount of time in seconds spend waiting for rosprolog to become available.
-        :type timeout: int
+        :param prefetch: number of next_solution requests kept outstanding when iterating over the solutions of
+        query() and all_solutions(). See PrologQuery. Values above 1 require unordered=True.
+        :param cache: optional cache for the results of read-only queries sent through once, all_solutions and batch.
+        It is invalidated whenever a query which changes the knowledge base is sent through this client.
+        :param connection: rosbridge connection used for all queries. By default, each query leases a connection
+        from the connection pool, so concurrent queries are spread over the pooled connections.
+        :param pool: connection pool to use instead of the default one. See utils.rosbridge.
+        :param fused_once: if True, once and ensure_once only wait for two round trips instead of three, see
+        once_fused. Off by default until it has been verified against a real rosprolog.
+        :param instrumentation: optional collector of latency histograms, round trips and payload sizes of all
+        service calls and operations of this client. See utils.instrumentation.
+        :param unordered: if True, query() and all_solutions() may return the solutions in a different order than
+        Prolog finds them. Required for prefetch > 1, since rosbridge may answer the outstanding requests in any order.
+        :param on_write: called after each query which changes the knowledge base (see query_cache.is_mutating) has
+        been sent through this client, even if it failed
+        """
+        _check_prefetch(prefetch, unordered)
+        super().__init__(name_space, connection=connection, pool=pool)
+        self._live_queries = QueryRegistry()
+        self._prefetch = prefetch
+        self._unordered = unordered
+        self._cache = cache
+        self._fused_once = fused_once
+        self._instrumentation = instrumentation
+        self._on_write = on_write
+
+    @property
+    def instrumentation(self) -> Optional[PrologInstrumentation]:
+        return self._instrumentation
+
+    def _services(self, connection: RosbridgeConnection) -> Tuple[roslibpy.Service, roslibpy.Service,
+                                                                  roslibpy.Service]:
+        services = super()._services(connection)
+        if self._instrumentation is None:
+            return services
+        return tuple(self._instrumentation.wrap_service(srv) for srv in services)
+
+    def _operation(self, name: str):
+        if self._instrumentation is None:
+            return nullcontext()
+        return self._instrumentation.operation(name)
+
+    @contextmanager
+    def _writes(self, query_strs: List[str]):
+        if self._on_write is None or not any(is_mutating(query_str) for query_str in query_strs):
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._on_write()
+
+    @property
+    def cache(self) -> Optional[QueryCache]:
+        return self._cache
+
+    def enable_cache(self, max_size: int = 1024, ttl: float = 60.0) -> QueryCache:
+        """
+        Cache the results of read-only queries. See QueryCache.
         """
-        ros_hostname = urlparse(os.environ["ROS_MASTER_URI"]).hostname
-        self._simple_query_srv = roslibpy.Service(ros_client, f'{name_space}/query', "json_prolog_msgs/srv/PrologQuery")
-        self._next_solution_srv = roslibpy.Service(ros_client, f'{name_space}/next_solution',
-                                                   "json_prolog_msgs/srv/PrologNextSolution")
-        self._finish_query_srv = roslibpy.Service(ros_client, f'{name_space}/finish',
-                                                  "json_prolog_msgs/srv/PrologFinish")
+        self._cache = QueryCache(max_size=max_size, ttl=ttl)
+        return self._cache
+
+    def disable_cache(self):
+        self._cache = None
+
+    def _new_query(self, connection: RosbridgeConnection, query_str: str, iterative=True,
+                   prefetch: int = 1) -> PrologQuery:
+        simple_query_srv, next_solution_srv, finish_srv = self._services(connection)
+        return PrologQuery(query_str, simple_query_srv=simple_query_srv, next_solution_srv=next_solution_srv,
+                           finish_srv=finish_srv, iterative=iterative, prefetch=prefetch, unordered=self._unordered,
+                           registry=self._live_queries, instrumentation=self._instrumentation)
+
+    @property
+    def live_queries(self) -> QueryRegistry:
+        """
+        Queries started through this client which have not been finished yet.
+        """
+        return self._live_queries
+
+    def finish_all(self):
+        """
+        Finish all queries of this client which are still running.
+        """
+        self._live_queries.finish_all()
 
     def query(self, query_str):
         """
         Returns an Object which asks rosprolog for one solution at a time.
+        The query stays on the connection it was started on.
         :type query_str: str
         :rtype: PrologQuery
         """
-        return PrologQuery(query_str, simple_query_srv=self._simple_query_srv,
-                           next_solution_srv=self._next_solution_srv, finish_srv=self._finish_query_srv)
+        if self._cache is not None and is_mutating(query_str):
+            self._cache.invalidate()
+        with self._operation("query"), self._writes([query_str]), self._connection_lease() as connection:
+            return self._new_query(connection, query_str, prefetch=self._prefetch)
 
     def once(self, query_str: str) -> Optional[Dict]:
         """
@@ -132,22 +490,68 @@ class Prolog(object):
         Return a Dict mapping all variables in the query to atoms if the query succeeded.
         Throw an exception if query execution failed (syntax errors, connection errors etc.)
         """
-        q = None
-        try:
-            q = PrologQuery(query_str, simple_query_srv=self._simple_query_srv,
-                            next_solution_srv=self._next_solution_srv, finish_srv=self._finish_query_srv)
-            return next(Upper(q.solutions()))
-        except StopIteration:
-            return None
-        finally:
-            if q is not None:
-                q.finish()
+        with self._operation("once"), self._writes([query_str]):
+            if self._cache is not None:
+                return self._cache.cached_call("once", query_str, lambda: self._once(query_str))
+            return self._once(query_str)
+
+    def _once(self, query_str: str) -> Optional[Dict]:
+        if self._fused_once:
+            return self.once_fused(query_str)
+        return self.once_iterative(query_str)
+
+    def once_fused(self, query_str: str) -> Optional[Dict]:
+        """
+        Same as once, but with the fewest round trips the rosprolog protocol allows.
+        The goal is wrapped in once/1 and sent in non-iterative mode, so rosprolog computes the only solution while
+        handling the query request. The solution is fetched with one next_solution request, and the finish request
+        is sent without waiting for its reply. This takes two round trips instead of three.
+        The query stays in live_queries until the finish request has been answered, failures to finish it are logged.
+        Does not use the cache.
+        """
+        goal = query_str.strip().rstrip(".")
+        with self._connection_lease() as connection:
+            simple_query_srv, next_solution_srv, finish_srv = self._services(connection)
+            query = _FusedQuery(new_query_id(), finish_srv, self._live_queries)
+            try:
+                # The newline ends a trailing line comment in the goal, which would otherwise swallow the closing
+                # brackets
+                result = simple_query_srv.call(roslibpy.ServiceRequest({"id": query.get_id(),
+                                                                        "query": f"once(({goal}\n))", "mode": 0}))
+            except Exception:
+                query.forget()
+                raise
+            if not result["ok"]:
+                query.forget()
+                raise PrologQueryRejected('Prolog query failed: {}'.format(result["message"]))
+            try:
+                next_solution = next_solution_srv.call(roslibpy.ServiceRequest({"id": query.get_id()}))
+                return _parse_next_solution(next_solution, query.get_id(), self._instrumentation)
+            finally:
+                query.finish_async()
+
+    def once_iterative(self, query_str: str) -> Optional[Dict]:
+        """
+        Same as once, but opens an iterative query, requests one solution and waits for the query to be finished.
+        This takes three round trips. Does not use the cache.
+        """
+        with self._connection_lease() as connection:
+            q = None
+            try:
+                q = self._new_query(connection, query_str)
+                return next(Upper(q.solutions()))
+            except StopIteration:
+                return None
+            finally:
+                if q is not None:
+                    q.finish()
 
     def ensure_once(self, query_str) -> Dict:
         """
         Same as once, but throws an exception if Prolog returns false.
         """
-        res = self.once(query_str)
+        with self._operation("ensure_once"):
+            res = self.once(query_str)
         if res is None:
             raise PrologException(f"Prolog returned false.\nQuery: {query_str}")
         return res
@@ -159,28 +563,111 @@ class Prolog(object):
         Return a List of Dicts mapping all variables in the query to atoms if the query succeeded.
         Throw an exception if query execution failed (syntax errors, connection errors etc.)
         """
-        return list(PrologQuery(query_str,
-                                iterative=False,
-                                simple_query_srv=self._simple_query_srv,
-                                next_solution_srv=self._next_solution_srv,
-                                finish_srv=self._finish_query_srv).solutions())
+        with self._operation("all_solutions"), self._writes([query_str]):
+            if self._cache is not None:
+                return self._cache.cached_call("all_solutions", query_str, lambda: self._all_solutions(query_str))
+            return self._all_solutions(query_str)
+
+    def _all_solutions(self, query_str: str) -> List[Dict]:
+        with self._connection_lease() as connection:
+            return list(self._new_query(connection, query_str, iterative=False, prefetch=self._prefetch).solutions())
+
+    def batch(self, query_strs: List[str], max_in_flight: int = 256,
+              timeout: float = None) -> List[PrologBatchResult]:
+        """
+        Run many independent queries with the semantics of once, pipelining them over the rosbridge connection.
+        Instead of three round trips per query, the query, next_solution and finish requests of up to max_in_flight
+        queries are sent together, so a chunk of queries costs three round trips in total.
+        Return one PrologBatchResult per query, in the order of query_strs. Failing queries do not raise, their
+        exception is reported in PrologBatchResult.error instead.
+        :param max_in_flight: maximum number of queries sent to rosprolog at the same time
+        :param timeout: Amount of time in seconds to wait for each service response
+        """
+        with self._operation("batch"), self._writes(query_strs):
+            return self._batch(query_strs, max_in_flight, timeout)
+
+    def _batch(self, query_strs: List[str], max_in_flight: int, timeout: Optional[float]) -> List[PrologBatchResult]:
+        results = [PrologBatchResult(query_str) for query_str in query_strs]
+        if self._cache is not None and any(is_mutating(query_str) for query_str in query_strs):
+            self._cache.invalidate()
+            try:
+                self._run_batch(results, max_in_flight, timeout)
+            finally:
+                self._cache.invalidate()
+        elif self._cache is not None:
+            generation = self._cache.generation()
+            missing = object()
+            uncached = []
+            for result in results:
+                if is_volatile(result.query_str):
+                    uncached.append(result)
+                    continue
+                solution = self._cache.get("once", result.query_str, missing)
+                if solution is missing:
+                    uncached.append(result)
+                else:
+                    result.solution = solution
+            self._run_batch(uncached, max_in_flight, timeout)
+            for result in uncached:
+                if result.ok and not is_volatile(result.query_str):
+                    self._cache.put("once", result.query_str, result.solution, generation)
+        else:
+            self._run_batch(results, max_in_flight, timeout)
+        return results
+
+    def _run_batch(self, results: List[PrologBatchResult], max_in_flight: int, timeout: Optional[float]):
+        for chunk_start in range(0, len(results), max_in_flight):
+            chunk = results[chunk_start:chunk_start + max_in_flight]
+            query_ids = [new_query_id("PYTHON_BATCH") for _ in chunk]
+            with self._connection_lease() as connection:
+                self._run_batch_chunk(connection, chunk, query_ids, timeout)
+
+    def _run_batch_chunk(self, connection: RosbridgeConnection, chunk: List[PrologBatchResult], query_ids: List[str],
+                         timeout: Optional[float]):
+        simple_query_srv, next_solution_srv, finish_srv = self._services(connection)
+        query_futures = [_call_service_async(simple_query_srv, {"id": query_id, "query": result.query_str,
+                                                                "mode": 1})
+                         for result, query_id in zip(chunk, query_ids)]
+        started = []
+        for result, query_id, future in zip(chunk, query_ids, query_futures):
+            try:
+                response = future.result(timeout)
+            except futures.TimeoutError as e:
+                result.error = e
+                # rosprolog may still start the query after the timeout
+                _finish_when_started(future, finish_srv, query_id)
+                continue
+            except Exception as e:
+                result.error = e
+                continue
+            if response["ok"]:
+                started.append((result, query_id))
+            else:
+                result.error = PrologQueryRejected('Prolog query failed: {}'.format(response["message"]))
+
+        solution_futures = [_call_service_async(next_solution_srv, {"id": query_id})
+                            for _, query_id in started]
+        for (result, query_id), future in zip(started, solution_futures):
+            try:
+                result.solution = _parse_next_solution(future.result(timeout), query_id, self._instrumentation)
+            except Exception as e:
+                result.error = e
+
+        finish_futures = [_call_service_async(finish_srv, {"id": query_id}) for _, query_id in started]
+        for (result, _), future in zip(started, finish_futures):
+            try:
+                future.result(timeout)
+            except Exception as e:
+                if result.error is None:
+                    result.error = e
 
     def ensure_all_solutions(self, query_str) -> List[Dict]:
         """
         Same as all_solutions, but raise an exception if Prolog returns false.
         """
-        res = self.all_solutions(query_str)
+        with self._operation("ensure_all_solutions"):
+            res = self.all_solutions(query_str)
         if len(res) == 0:
             raise PrologException(f"Prolog returned false.\nQuery: {query_str}")
         return res
 
-
-def atom(string: str):
-    try:
-        if re.match(".+:'.+'", string):
-            # Has namespace prefix --> don't wrap in quotes
-            return string
-        return f"'{string}'"
-    except:
-        print(string)
-        raise RuntimeError()
@@ -0,0 +1,136 @@
+"""
+Error-bounded decimation of trajectories, to avoid storing and inserting redundant samples.
+"""
+
+from collections import deque
+from typing import Tuple, Deque
+
+import numpy as np
+
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+
+
+class DecimationReport:
+    def __init__(self, original_points: int, kept_points: int, max_translation_error: float,
+                 max_rotation_error: float):
+        """
+        :param max_translation_error: largest distance in m between a dropped sample and the interpolated trajectory
+        :param max_rotation_error: largest angle in rad between a dropped sample and the interpolated trajectory
+        """
+        self.original_points = original_points
+        self.kept_points = kept_points
+        self.max_translation_error = max_translation_error
+        self.max_rotation_error = max_rotation_error
+
+    @property
+    def ratio(self) -> float:
+        """
+        Fraction of the samples which were kept
+        """
+        return self.kept_points / self.original_points if self.original_points > 0 else 1.0
+
+    def __str__(self):
+        return f"Kept {self.kept_points} of {self.original_points} points ({100 * self.ratio:.1f}%), max error " \
+               f"{self.max_translation_error:.6f} m / {np.rad2deg(self.max_rotation_error):.4f} deg"
+
+
+class Decimation:
+    """
+    Drops the samples of a trajectory which can be reconstructed within the given tolerances by interpolating between
+    the kept samples: linearly for positions, with slerp for orientations. This is the Douglas-Peucker algorithm, with
+    the timestamps as parameter of the interpolation and the error of a sample being the larger of its translation and
+    rotation error relative to their tolerances. The first and last sample are always kept.
+    """
+
+    def __init__(self, translation_tolerance: float = 0.001, rotation_tolerance: float = 0.01, max_reports: int = 100):
+        """
+        :param translation_tolerance: maximum distance in m between a dropped sample and the interpolated trajectory
+        :param rotation_tolerance: maximum angle in rad between a dropped sample and the interpolated trajectory
+        :param max_reports: number of reports of the most recent runs which are kept in reports
+        """
+        if translation_tolerance <= 0 or rotation_tolerance <= 0:
+            raise ValueError("Decimation tolerances must be positive")
+        self.translation_tolerance = translation_tolerance
+        self.rotation_tolerance = rotation_tolerance
+        self.reports: Deque[DecimationReport] = deque(maxlen=max_reports)
+
+    @property
+    def last_report(self) -> DecimationReport:
+        return self.reports[-1]
+
+    def apply(self, trajectory: TrajectoryArray) -> TrajectoryArray:
+        return trajectory[self.indices(trajectory.timestamps, trajectory.positions, trajectory.quaternions)]
+
+    def indices(self, timestamps, positions, quaternions) -> np.ndarray:
+        """
+        Return the sorted indices of the samples to keep and append a DecimationReport to reports.
+        :param timestamps: (N,), sorted. All samples need a timestamp.
+        :param positions: (N, 3)
+        :param quaternions: (N, 4) [qx,qy,qz,qw]
+        """
+        if not isinstance(timestamps, np.ndarray) and any(timestamp is None for timestamp in timestamps):
+            raise ValueError("Decimation needs a timestamp for every sample")
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        n = len(timestamps)
+        if n <= 2:
+            self.reports.append(DecimationReport(n, n, 0.0, 0.0))
+            return np.arange(n)
+        quaternions = np.asarray(quaternions, dtype=np.float64)
+        quaternions = quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+        keep = np.zeros(n, dtype=bool)
+        keep[[0, n - 1]] = True
+        max_translation_error = 0.0
+        max_rotation_error = 0.0
+        segments = [(0, n - 1)]
+        while len(segments) > 0:
+            first, last = segments.pop()
+            if last - first < 2:
+                continue
+            translation_errors, rotation_errors = self._segment_errors(timestamps, positions, quaternions, first, last)
+            scores = np.maximum(translation_errors / self.translation_tolerance,
+                                rotation_errors / self.rotation_tolerance)
+            worst = int(np.argmax(scores))
+            if scores[worst] <= 1.0:
+                max_translation_error = max(max_translation_error, float(translation_errors.max()))
+                max_rotation_error = max(max_rotation_error, float(rotation_errors.max()))
+                continue
+            split = first + 1 + worst
+            keep[split] = True
+            segments.append((first, split))
+            segments.append((split, last))
+        indices = np.flatnonzero(keep)
+        self.reports.append(DecimationReport(n, len(indices), max_translation_error, max_rotation_error))
+        return indices
+
+    @staticmethod
+    def _segment_errors(timestamps: np.ndarray, positions: np.ndarray, quaternions: np.ndarray, first: int,
+                        last: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Errors of the samples between first and last when interpolating between first and last.
+        Slerp is computed on the unit quaternions directly, which is much faster than going through Rotation objects.
+        """
+        inner = np.arange(first + 1, last)
+        duration = timestamps[last] - timestamps[first]
+        if duration > 0:
+            alpha = (timestamps[inner] - timestamps[first]) / duration
+        else:
+            alpha = np.zeros(len(inner))
+        interpolated_positions = positions[first] + alpha[:, None] * (positions[last] - positions[first])
+        translation_errors = np.linalg.norm(positions[inner] - interpolated_positions, axis=1)
+        q_first = quaternions[first]
+        q_last = quaternions[last]
+        cos_angle = np.dot(q_first, q_last)
+        if cos_angle < 0:
+            # Interpolate along the shorter arc
+            q_last = -q_last
+            cos_angle = -cos_angle
+        angle = np.arccos(min(cos_angle, 1.0))
+        if angle < 1e-9:
+            interpolated = np.broadcast_to(q_first, (len(inner), 4))
+        else:
+            interpolated = (np.sin((1 - alpha) * angle)[:, None] * q_first +
+                            np.sin(alpha * angle)[:, None] * q_last) / np.sin(angle)
+        cos_errors = np.abs(np.einsum("ij,ij->i", interpolated, quaternions[inner]))
+        rotation_errors = 2 * np.arccos(np.minimum(cos_errors, 1.0))
+        return translation_errors, rotation_errors
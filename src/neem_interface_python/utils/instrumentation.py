@@ -0,0 +1,241 @@
+"""
+Optional latency and round-trip instrumentation for the Prolog client.
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence
+
+import roslibpy
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Histogram with fixed upper bucket bounds, like a Prometheus histogram.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)   # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return result
+
+    def snapshot(self) -> Dict:
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count > 0 else None,
+                "buckets": dict(self.cumulative_counts())}
+
+
+class _OperationStats:
+    def __init__(self, buckets: Sequence[float]):
+        self.latency = Histogram(buckets)
+        self.round_trips = 0
+        self.solutions = 0
+
+
+class _CurrentOperation:
+    def __init__(self):
+        self.round_trips = 0
+        self.solutions = 0
+
+
+class PrologInstrumentation:
+    """
+    Collects per-call latency histograms of a Prolog client:
+    - the round-trip time of each rosprolog service call,
+    - the excess of each round trip over the fastest round trip seen so far for the same service. This is only a
+      heuristic for the time spent on the server (rosbridge does not report it): the first call of a service always
+      shows 0, and the values are too low while the fastest round trip is still dropping,
+    - the time spent decoding solutions,
+    - the latency, number of round trips and number of solutions of each logical operation (once, all_solutions, ...),
+    - the request and response payload sizes.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.round_trip = defaultdict(lambda: Histogram(self.buckets))
+        self.rtt_excess = defaultdict(lambda: Histogram(self.buckets))
+        self.decode = Histogram(self.buckets)
+        self.operations = defaultdict(lambda: _OperationStats(self.buckets))
+        self.request_bytes = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+        self._fastest_round_trip = {}
+
+    @contextmanager
+    def operation(self, name: str):
+        """
+        Attribute all service calls and decoded solutions of the current thread to the logical operation `name`.
+        Nested operations are counted as part of the outermost one.
+        """
+        if getattr(self._local, "current", None) is not None:
+            yield
+            return
+        current = self._local.current = _CurrentOperation()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._local.current = None
+            with self._lock:
+                stats = self.operations[name]
+                stats.latency.observe(elapsed)
+                stats.round_trips += current.round_trips
+                stats.solutions += current.solutions
+
+    def wrap_service(self, srv: roslibpy.Service) -> "InstrumentedService":
+        return InstrumentedService(srv, self)
+
+    def count_round_trip(self):
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current.round_trips += 1
+
+    def record_call(self, service: str, seconds: float, request_bytes: int, response_bytes: int):
+        with self._lock:
+            fastest = min(self._fastest_round_trip.get(service, seconds), seconds)
+            self._fastest_round_trip[service] = fastest
+            self.round_trip[service].observe(seconds)
+            self.rtt_excess[service].observe(seconds - fastest)
+            self.request_bytes[service] += request_bytes
+            self.response_bytes[service] += response_bytes
+
+    def record_decode(self, seconds: float):
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current.solutions += 1
+        with self._lock:
+            self.decode.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.round_trip.clear()
+            self.rtt_excess.clear()
+            self.decode = Histogram(self.buckets)
+            self.operations.clear()
+            self.request_bytes.clear()
+            self.response_bytes.clear()
+            self._fastest_round_trip.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "services": {service: {"round_trip": self.round_trip[service].snapshot(),
+                                       "rtt_excess": self.rtt_excess[service].snapshot(),
+                                       "request_bytes": self.request_bytes[service],
+                                       "response_bytes": self.response_bytes[service]}
+                             for service in self.round_trip},
+                "decode": self.decode.snapshot(),
+                "operations": {name: {"latency": stats.latency.snapshot(), "round_trips": stats.round_trips,
+                                      "round_trips_per_call": stats.round_trips / stats.latency.count
+                                      if stats.latency.count > 0 else None,
+                                      "solutions": stats.solutions}
+                               for name, stats in self.operations.items()},
+            }
+
+    def to_prometheus(self, prefix: str = "neem_prolog") -> str:
+        """
+        Export the collected data in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, f"{prefix}_service_round_trip_seconds", "Round-trip time of rosprolog service calls",
+                             "service", self.round_trip)
+            _histogram_lines(lines, f"{prefix}_service_rtt_excess_seconds",
+                             "Heuristic for the server-side time of rosprolog service calls: round-trip time minus the "
+                             "fastest round trip seen so far for the service", "service", self.rtt_excess)
+            _histogram_lines(lines, f"{prefix}_decode_seconds", "Time spent decoding solutions", None,
+                             {None: self.decode})
+            _histogram_lines(lines, f"{prefix}_operation_seconds", "Latency of logical Prolog operations",
+                             "operation", {name: stats.latency for name, stats in self.operations.items()})
+            _counter_lines(lines, f"{prefix}_operation_round_trips_total", "Service calls per logical operation",
+                           "operation", {name: stats.round_trips for name, stats in self.operations.items()})
+            _counter_lines(lines, f"{prefix}_operation_solutions_total", "Solutions decoded per logical operation",
+                           "operation", {name: stats.solutions for name, stats in self.operations.items()})
+            _counter_lines(lines, f"{prefix}_request_bytes_total", "Request payload bytes", "service",
+                           self.request_bytes)
+            _counter_lines(lines, f"{prefix}_response_bytes_total", "Response payload bytes", "service",
+                           self.response_bytes)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(label: str, value, extra: str = None) -> str:
+    pairs = []
+    if label is not None:
+        pairs.append(f'{label}="{value}"')
+    if extra is not None:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _histogram_lines(lines: List[str], name: str, help_text: str, label: str, histograms: Dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for value, histogram in histograms.items():
+        for bound, count in histogram.cumulative_counts():
+            bound_label = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_labels(label, value, bound_label)} {count}")
+        lines.append(f"{name}_sum{_labels(label, value)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(label, value)} {histogram.count}")
+
+
+def _counter_lines(lines: List[str], name: str, help_text: str, label: str, counters: Dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for value, count in counters.items():
+        lines.append(f"{name}{_labels(label, value)} {count}")
+
+
+def _payload_size(message) -> int:
+    try:
+        return len(json.dumps(dict(message)))
+    except (TypeError, ValueError):
+        return 0
+
+
+class InstrumentedService:
+    def __init__(self, srv: roslibpy.Service, instrumentation: PrologInstrumentation):
+        """
+        Wraps a roslibpy.Service (or anything with the same call interface) and reports each call to the
+        instrumentation.
+        """
+        self._srv = srv
+        self._instrumentation = instrumentation
+        self.name = srv.name
+        self._service = srv.name.rsplit("/", 1)[-1]
+
+    def call(self, request, callback=None, errback=None, timeout=None):
+        request_bytes = _payload_size(request)
+        self._instrumentation.count_round_trip()
+        start = time.perf_counter()
+        if callback is None:
+            response = self._srv.call(request, timeout=timeout)
+            self._instrumentation.record_call(self._service, time.perf_counter() - start, request_bytes,
+                                              _payload_size(response))
+            return response
+
+        def on_response(response):
+            self._instrumentation.record_call(self._service, time.perf_counter() - start, request_bytes,
+                                              _payload_size(response))
+            callback(response)
+
+        self._srv.call(request, callback=on_response, errback=errback, timeout=timeout)
@@ -0,0 +1,129 @@
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Any, Dict
+
+# Predicates which change the knowledge base or the files it is loaded from. A query calling any of them invalidates
+# all cached results. Queries which only call other predicates are treated as read-only, so predicates which change the
+# knowledge base must be listed here before their queries are sent through a client with a cache.
+MUTATING_PREDICATES = re.compile(r"(?<![\w'])(kb_project|kb_unproject|tell|untell|remember|memorize|knowrob_load_neem|"
+                                 r"load_owl|mem_clear_memory|mem_episode_\w+|mem_add_\w+|tf_set_pose|tf_logger_\w+|"
+                                 r"tf_mem_clear|ensure_loaded|consult|assert[az]?|retract(?:all)?|mng_\w+|"
+                                 r"delete_directory_and_contents|delete_file)(?![\w'])")
+
+# Predicates whose results change without the knowledge base changing. Queries calling them are never cached.
+VOLATILE_PREDICATES = re.compile(r"(?<![\w'])(get_time|random\w*|gensym)(?![\w'])")
+
+_QUOTED_OR_WHITESPACE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|\s*([(),\[\]|])\s*|\s+")
+
+_MISSING = object()
+
+
+def normalize_query(query_str: str) -> str:
+    """
+    Normalize a query for use as a cache key: outside of quoted atoms and strings, drop whitespace around brackets and
+    commas and collapse all other whitespace. Also drop the trailing full stop.
+    """
+    normalized = _QUOTED_OR_WHITESPACE.sub(lambda m: m.group(1) or m.group(2) or " ", query_str)
+    return normalized.strip().rstrip(".").rstrip()
+
+
+def is_mutating(query_str: str) -> bool:
+    return MUTATING_PREDICATES.search(query_str) is not None
+
+
+def is_volatile(query_str: str) -> bool:
+    return VOLATILE_PREDICATES.search(query_str) is not None
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with time-to-live for results of read-only Prolog queries.
+    A query counts as read-only unless it calls one of the MUTATING_PREDICATES. Results of queries which change the
+    knowledge base through other predicates are cached like reads and other cached results are not invalidated, so
+    such queries must not be sent through a client with a cache, or be followed by invalidate().
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        """
+        :param max_size: maximum number of cached results. The least recently used result is evicted first.
+        :param ttl: time in seconds after which a cached result expires. None disables expiry.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, query_str: str, default=None):
+        key = (kind, normalize_query(query_str))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, kind: str, query_str: str, value, generation: int = None):
+        """
+        :param generation: value of generation() before the query was sent. The result is not cached if the cache has
+        been invalidated since.
+        """
+        key = (kind, normalize_query(query_str))
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def generation(self) -> int:
+        return self._generation
+
+    def cached_call(self, kind: str, query_str: str, call: Callable[[], Any]):
+        """
+        Return the cached result of the query, or run call() and cache its result.
+        Queries which mutate the knowledge base invalidate the cache instead, volatile queries bypass it.
+        :param kind: distinguishes results of different calls for the same query, e.g. 'once' and 'all_solutions'
+        """
+        if is_mutating(query_str):
+            self.invalidate()
+            try:
+                return call()
+            finally:
+                # Drop results which concurrent readers may have cached while the query was running
+                self.invalidate()
+        if is_volatile(query_str):
+            return call()
+        value = self.get(kind, query_str, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self.generation()
+        value = call()
+        self.put(kind, query_str, value, generation)
+        return value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations, "size": len(self._entries), "max_size": self.max_size,
+                    "ttl": self.ttl}
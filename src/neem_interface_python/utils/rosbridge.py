@@ -1,10 +1,180 @@
+"""
+Lazily established, pooled connections to rosbridge servers.
+"""
+
+import itertools
 import os
+import threading
+import time
+from typing import List, Tuple, Dict, Optional, Callable
 from urllib.parse import urlparse
 
 import roslibpy
 
-ros_host = urlparse(os.environ["ROS_MASTER_URI"]).hostname
 rosbridge_port = 9090
 
-ros_client = roslibpy.Ros(ros_host, rosbridge_port)
-ros_client.run()
+
+def default_endpoints() -> List[Tuple[str, int]]:
+    """
+    The rosbridge server on the host of the ROS master, on the port given by ROSBRIDGE_PORT (default: 9090).
+    """
+    ros_host = urlparse(os.environ["ROS_MASTER_URI"]).hostname
+    return [(ros_host, int(os.environ.get("ROSBRIDGE_PORT", rosbridge_port)))]
+
+
+class RosbridgeConnection:
+    """
+    Connection to a rosbridge server. The websocket is opened on first use and re-established if it was dropped.
+    """
+
+    def __init__(self, host: str, port: int = rosbridge_port, connect_timeout: float = 10.0):
+        """
+        :param connect_timeout: Amount of time in seconds spent waiting for the connection to be (re-)established.
+        """
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.leases = 0
+        self._client = None
+        self._services = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> roslibpy.Ros:
+        with self._lock:
+            if self._client is None:
+                self._connect()
+            elif not self._client.is_connected and not self._wait_for_reconnect():
+                self._connect()
+            return self._client
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    def service(self, name: str, service_type: str) -> roslibpy.Service:
+        client = self.client
+        with self._lock:
+            srv = self._services.get(name)
+            if srv is None or srv.ros is not client:
+                srv = roslibpy.Service(client, name, service_type)
+                self._services[name] = srv
+            return srv
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                finally:
+                    self._client = None
+                    self._services = {}
+
+    def _wait_for_reconnect(self) -> bool:
+        # roslibpy reconnects dropped websockets by itself, give it a chance before opening a new connection
+        deadline = time.monotonic() + self.connect_timeout
+        while time.monotonic() < deadline:
+            if self._client.is_connected:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def _connect(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+        client = roslibpy.Ros(self.host, self.port)
+        client.run(timeout=self.connect_timeout)
+        self._client = client
+        self._services = {}
+
+    def __repr__(self):
+        return f"RosbridgeConnection(host={self.host!r}, port={self.port}, leases={self.leases})"
+
+
+class RosbridgeConnectionPool:
+    """
+    A fixed number of lazily established connections to one or several rosbridge endpoints.
+    Clients acquire a connection for each operation and release it afterwards.
+    """
+    STRATEGIES = ("round_robin", "least_loaded")
+
+    def __init__(self, endpoints: List[Tuple[str, int]] = None, size: int = 1, strategy: str = "round_robin",
+                 connection_factory: Callable[[str, int], RosbridgeConnection] = RosbridgeConnection):
+        """
+        :param endpoints: (host, port) tuples of rosbridge servers. Defaults to default_endpoints().
+        :param size: number of connections, distributed over the endpoints in turn
+        :param strategy: 'round_robin' hands out the connections in turn, 'least_loaded' hands out the connection
+        with the fewest active leases
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy}, expected one of {self.STRATEGIES}")
+        if size < 1:
+            raise ValueError(f"size must be at least 1, got {size}")
+        self.endpoints = endpoints if endpoints is not None else default_endpoints()
+        self.strategy = strategy
+        self.connections = [connection_factory(*self.endpoints[i % len(self.endpoints)]) for i in range(size)]
+        self._round_robin = itertools.cycle(self.connections)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> RosbridgeConnection:
+        with self._lock:
+            if self.strategy == "least_loaded":
+                connection = min(self.connections, key=lambda c: c.leases)
+            else:
+                connection = next(self._round_robin)
+            connection.leases += 1
+            return connection
+
+    def release(self, connection: RosbridgeConnection):
+        with self._lock:
+            connection.leases -= 1
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+    def stats(self) -> Dict:
+        return {f"{c.host}:{c.port}#{i}": {"leases": c.leases, "connected": c.is_connected}
+                for i, c in enumerate(self.connections)}
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> RosbridgeConnectionPool:
+    """
+    Return the pool used by all clients which were not given an explicit pool or connection.
+    It is created on first use with a single connection to default_endpoints().
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = RosbridgeConnectionPool()
+        return _connection_pool
+
+
+def set_connection_pool(pool: Optional[RosbridgeConnectionPool]):
+    """
+    Replace the default pool. Clients created afterwards use the new pool, existing connections are not closed.
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        _connection_pool = pool
+
+
+def configure_connection_pool(endpoints: List[Tuple[str, int]] = None, size: int = 1,
+                              strategy: str = "round_robin") -> RosbridgeConnectionPool:
+    pool = RosbridgeConnectionPool(endpoints, size=size, strategy=strategy)
+    set_connection_pool(pool)
+    return pool
+
+
+def __getattr__(name):
+    # ros_client used to be a connection opened at import time, keep it available for existing importers
+    if name == "ros_client":
+        return get_connection_pool().connections[0].client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,111 @@
+"""
+Serialization of Python values to Prolog terms, for building rosprolog queries.
+"""
+
+import re
+import string
+from functools import lru_cache
+from typing import Iterable, Sequence, Dict, Any
+
+# Prefixed names like soma:'State' are expanded by KnowRob and must not be wrapped in quotes
+_PREFIXED_NAME = re.compile(r".+:'.+'", re.DOTALL)
+
+
+class PrologTerm(str):
+    """
+    A string which already is a serialized Prolog term (e.g. a variable or a compound term).
+    to_term and QueryTemplate insert it verbatim instead of quoting it as an atom.
+    """
+    pass
+
+
+@lru_cache(maxsize=8192)
+def atom(string: str) -> str:
+    """
+    Serialize a string as a quoted Prolog atom, escaping backslashes and single quotes.
+    Prefixed names like soma:'State' are returned unchanged.
+    """
+    if not isinstance(string, str):
+        raise TypeError(f"Cannot convert {string!r} of type {type(string).__name__} to a Prolog atom")
+    if _PREFIXED_NAME.match(string):
+        return string
+    return "'" + string.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def number(value) -> str:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return repr(float(value))
+
+
+def number_list(values: Iterable[float]) -> str:
+    """
+    Serialize a sequence of numbers (or a 1D numpy array) as a Prolog list of floats.
+    """
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    return "[" + ",".join(map(repr, map(float, values))) + "]"
+
+
+def atom_list(values: Iterable[str]) -> str:
+    return "[" + ",".join(map(atom, values)) + "]"
+
+
+def to_term(value: Any) -> str:
+    """
+    Serialize a Python value as a Prolog term: strings become atoms, numbers become numbers, lists, tuples and numpy
+    arrays become Prolog lists and PrologTerms are inserted verbatim.
+    """
+    if isinstance(value, PrologTerm):
+        return value
+    if isinstance(value, str):
+        return atom(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return number(value)
+    if hasattr(value, "tolist"):
+        return to_term(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(map(to_term, value)) + "]"
+    raise TypeError(f"Cannot convert {value!r} of type {type(value).__name__} to a Prolog term")
+
+
+def pose_term(reference_frame: str, pos: Sequence[float], quat: Sequence[float]) -> str:
+    """
+    Serialize a KnowRob pose "[reference_cs, [x,y,z],[qx,qy,qz,qw]]"
+    """
+    return f"[{atom(reference_frame)},{number_list(pos)},{number_list(quat)}]"
+
+
+class QueryTemplate:
+    """
+    A query with named placeholders in str.format syntax, e.g. "tf_set_pose({frame}, {pose}, QS)".
+    The template is parsed once, format() only serializes the arguments with to_term and joins the pieces.
+    Braces which are part of the query must be doubled.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._pieces = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(template):
+            if format_spec or conversion:
+                raise ValueError(f"Format specs and conversions are not supported in query templates: {template}")
+            self._pieces.append((literal, field))
+
+    def format(self, **kwargs) -> str:
+        parts = []
+        for literal, field in self._pieces:
+            parts.append(literal)
+            if field is not None:
+                parts.append(to_term(kwargs[field]))
+        return "".join(parts)
+
+    def format_many(self, rows: Iterable[Dict[str, Any]], separator: str = ", ") -> str:
+        """
+        Format the template once per row and join the results, e.g. into a conjunction of goals.
+        """
+        return separator.join(self.format(**row) for row in rows)
+
+    def __repr__(self):
+        return f"QueryTemplate({self.template!r})"
@@ -0,0 +1,248 @@
+"""
+Columnar storage of trajectories, as an alternative to lists of Datapoint objects.
+"""
+
+from collections import defaultdict
+from typing import List, Union, Iterator, Tuple, Sequence, Dict
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from src.neem_interface_python.utils.terms import atom
+from src.neem_interface_python.utils.utils import Datapoint, parse_timestamp
+
+# Mirrors the x and z axes of a quaternion to convert between left- and right-handed coordinate systems
+_HANDEDNESS_FLIP = np.array([-1.0, 1.0, -1.0, 1.0])
+
+
+class TrajectoryArray:
+    """
+    A trajectory of one frame, stored as numpy arrays instead of one Datapoint per sample:
+    - timestamps: (N,) in seconds
+    - positions: (N, 3) [x,y,z] in m
+    - quaternions: (N, 4) [qx,qy,qz,qw] in a right-handed coordinate system
+    - wrenches: (N, 6) [fx,fy,fz,mx,my,mz] in N / Nm, or None
+    Indexing with an int returns a Datapoint. Indexing with a slice returns a TrajectoryArray whose arrays are views into
+    the arrays of this one, other indices (index arrays, boolean masks) return a copy, as in numpy.
+    """
+
+    def __init__(self, timestamps, positions, quaternions, frame: str = "", reference_frame: str = "world",
+                 wrenches=None, copy=False):
+        """
+        :param copy: if False, arrays which already have the right dtype are used without copying them
+        """
+        self.timestamps = np.array(timestamps, dtype=np.float64, copy=True) if copy \
+            else np.asarray(timestamps, dtype=np.float64)
+        self.positions = np.array(positions, dtype=np.float64, copy=True) if copy \
+            else np.asarray(positions, dtype=np.float64)
+        self.quaternions = np.array(quaternions, dtype=np.float64, copy=True) if copy \
+            else np.asarray(quaternions, dtype=np.float64)
+        self.wrenches = None
+        if wrenches is not None:
+            self.wrenches = np.array(wrenches, dtype=np.float64, copy=True) if copy \
+                else np.asarray(wrenches, dtype=np.float64)
+        self.frame = frame
+        self.reference_frame = reference_frame
+        n = len(self.timestamps)
+        _check_shape("timestamps", self.timestamps, (n,))
+        _check_shape("positions", self.positions, (n, 3))
+        _check_shape("quaternions", self.quaternions, (n, 4))
+        if self.wrenches is not None:
+            _check_shape("wrenches", self.wrenches, (n, 6))
+
+    @staticmethod
+    def empty(frame: str = "", reference_frame: str = "world") -> "TrajectoryArray":
+        return TrajectoryArray(np.empty(0), np.empty((0, 3)), np.empty((0, 4)), frame, reference_frame)
+
+    @staticmethod
+    def from_datapoints(points: Sequence[Datapoint]) -> "TrajectoryArray":
+        """
+        All points must belong to the same frame and reference frame. Wrenches are kept if all points have one.
+        """
+        if len(points) == 0:
+            return TrajectoryArray.empty()
+        frame = _single_value("frame", (point.frame for point in points))
+        reference_frame = _single_value("reference frame", (point.reference_frame for point in points))
+        wrenches = None
+        if all(point.wrench is not None for point in points):
+            wrenches = [point.wrench for point in points]
+        return TrajectoryArray([point.timestamp for point in points], [point.pos for point in points],
+                               Rotation.concatenate([point.ori for point in points]).as_quat(), frame,
+                               reference_frame, wrenches)
+
+    @staticmethod
+    def from_prolog(trajectory: List, frame: str = "") -> "TrajectoryArray":
+        """
+        Convert the result of tf_mng_trajectory, a list of Time-[ReferenceFrame, Position, Quaternion] terms.
+        """
+        if len(trajectory) == 0:
+            return TrajectoryArray.empty(frame)
+        terms = [dp["term"] for dp in trajectory]
+        poses = [term[2] for term in terms]
+        reference_frame = _single_value("reference frame", (pose[0] for pose in poses))
+        return TrajectoryArray([term[1] for term in terms], [pose[1] for pose in poses],
+                               normalized_quaternions([pose[2] for pose in poses]), frame, reference_frame)
+
+    @staticmethod
+    def from_prolog_wrenches(trajectory: List, frame: str = "") -> "TrajectoryArray":
+        """
+        Convert the result of wrench_mng_trajectory, a list of Time-[ReferenceFrame, Force, Torque] terms with
+        Force = [fx,fy,fz] and Torque = [mx,my,mz], as in the header.frame_id, wrench.force and wrench.torque fields of
+        the wrench documents. Positions and quaternions of the returned TrajectoryArray are NaN.
+        """
+        if len(trajectory) == 0:
+            return TrajectoryArray(np.empty(0), np.empty((0, 3)), np.empty((0, 4)), frame, wrenches=np.empty((0, 6)))
+        terms = [dp["term"] for dp in trajectory]
+        wrenches = [_wrench(term[2]) for term in terms]
+        reference_frame = _single_value("reference frame", (wrench[0] for wrench in wrenches))
+        n = len(terms)
+        return TrajectoryArray([term[1] for term in terms], np.full((n, 3), np.nan), np.full((n, 4), np.nan), frame,
+                               reference_frame, wrenches=[wrench[1] + wrench[2] for wrench in wrenches])
+
+    @staticmethod
+    def from_tf_messages(tf_msgs: Sequence[dict]) -> "TrajectoryArray":
+        """
+        Batch version of Datapoint.from_tf for tf messages from mongo, which must all have the same child frame and
+        reference frame. See tf_trajectories for messages of several frames.
+        """
+        if len(tf_msgs) == 0:
+            return TrajectoryArray.empty()
+        frame = _single_value("frame", (msg["child_frame_id"] for msg in tf_msgs))
+        reference_frame = _single_value("reference frame", (msg["header"]["frame_id"] for msg in tf_msgs))
+        translations = [msg["transform"]["translation"] for msg in tf_msgs]
+        rotations = [msg["transform"]["rotation"] for msg in tf_msgs]
+        return TrajectoryArray(parse_timestamps([msg["header"]["stamp"]["$date"] for msg in tf_msgs]),
+                               [(trans["x"], trans["y"], trans["z"]) for trans in translations],
+                               normalized_quaternions([(rot["x"], rot["y"], rot["z"], rot["w"]) for rot in rotations]),
+                               frame, reference_frame)
+
+    @staticmethod
+    def from_unreal(timestamps, frame: str, reference_frame: str, positions_cm, orientations_lhs) -> "TrajectoryArray":
+        """
+        Batch version of Datapoint.from_unreal.
+        :param timestamps: (N,) in seconds
+        :param positions_cm: (N, 3) [x,y,z] in cm
+        :param orientations_lhs: (N, 4) [qx,qy,qz,qw] in a left-handed coordinate system
+        """
+        positions_cm = np.asarray(positions_cm, dtype=np.float64)
+        orientations_lhs = np.asarray(orientations_lhs, dtype=np.float64)
+        return TrajectoryArray(timestamps, positions_cm[:, [1, 0, 2]] / 100.0,
+                               normalized_quaternions(orientations_lhs * _HANDEDNESS_FLIP), frame, reference_frame)
+
+    @staticmethod
+    def concatenate(trajectories: Sequence["TrajectoryArray"]) -> "TrajectoryArray":
+        if len(trajectories) == 0:
+            return TrajectoryArray.empty()
+        wrenches = None
+        if all(trajectory.wrenches is not None for trajectory in trajectories):
+            wrenches = np.concatenate([trajectory.wrenches for trajectory in trajectories])
+        return TrajectoryArray(np.concatenate([trajectory.timestamps for trajectory in trajectories]),
+                               np.concatenate([trajectory.positions for trajectory in trajectories]),
+                               np.concatenate([trajectory.quaternions for trajectory in trajectories]),
+                               trajectories[0].frame, trajectories[0].reference_frame, wrenches)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index) -> Union[Datapoint, "TrajectoryArray"]:
+        if isinstance(index, (int, np.integer)):
+            return Datapoint(float(self.timestamps[index]), self.frame, self.reference_frame,
+                             self.positions[index].tolist(), Rotation.from_quat(self.quaternions[index]),
+                             self.wrenches[index].tolist() if self.wrenches is not None else None)
+        return TrajectoryArray(self.timestamps[index], self.positions[index], self.quaternions[index], self.frame,
+                               self.reference_frame, self.wrenches[index] if self.wrenches is not None else None)
+
+    def __iter__(self) -> Iterator[Datapoint]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"TrajectoryArray(frame={self.frame!r}, reference_frame={self.reference_frame!r}, " \
+               f"samples={len(self)}, wrenches={self.wrenches is not None})"
+
+    @property
+    def rotations(self) -> Rotation:
+        """
+        All orientations as a single Rotation object
+        """
+        return Rotation.from_quat(self.quaternions)
+
+    def between(self, start_time: float, end_time: float) -> "TrajectoryArray":
+        """
+        Return a view of the samples with start_time <= timestamp <= end_time. The timestamps must be sorted.
+        """
+        start = np.searchsorted(self.timestamps, start_time, side="left")
+        end = np.searchsorted(self.timestamps, end_time, side="right")
+        return self[start:end]
+
+    def to_datapoints(self) -> List[Datapoint]:
+        return list(self)
+
+    def pose_terms(self) -> Iterator[Tuple[float, str]]:
+        """
+        Yield the timestamp and the KnowRob pose "[reference_cs, [x,y,z],[qx,qy,qz,qw]]" of each sample
+        """
+        reference_frame = atom(self.reference_frame)
+        for timestamp, pos, quat in zip(self.timestamps.tolist(), self.positions.tolist(), self.quaternions.tolist()):
+            yield timestamp, f"[{reference_frame},[{pos[0]!r},{pos[1]!r},{pos[2]!r}]," \
+                             f"[{quat[0]!r},{quat[1]!r},{quat[2]!r},{quat[3]!r}]]"
+
+
+def _check_shape(name: str, array: np.ndarray, shape: Tuple):
+    if array.shape != shape:
+        raise ValueError(f"Expected {name} of shape {shape}, got {array.shape}")
+
+
+def _single_value(name: str, values) -> str:
+    distinct = set(values)
+    if len(distinct) != 1:
+        raise ValueError(f"All samples of a TrajectoryArray must have the same {name}, got {sorted(distinct)}")
+    return distinct.pop()
+
+
+def normalized_quaternions(quaternions) -> np.ndarray:
+    """
+    Scale (N, 4) quaternions to unit length, as Rotation.from_quat does for the per-point conversions
+    """
+    quaternions = np.asarray(quaternions, dtype=np.float64)
+    if quaternions.size == 0:
+        return np.empty((0, 4))
+    norms = np.linalg.norm(quaternions, axis=-1, keepdims=True)
+    if np.any(norms == 0):
+        raise ValueError("Found zero norm quaternions")
+    return quaternions / norms
+
+
+def _wrench(term) -> Tuple[str, List[float], List[float]]:
+    if not (isinstance(term, list) and len(term) == 3 and isinstance(term[0], str)
+            and all(_is_vector3(vector) for vector in term[1:])):
+        raise ValueError(f"Expected a wrench [ReferenceFrame, [fx,fy,fz], [mx,my,mz]], got {term}")
+    return term[0], term[1], term[2]
+
+
+def _is_vector3(term) -> bool:
+    return isinstance(term, list) and len(term) == 3 and all(isinstance(number, (int, float)) for number in term)
+
+
+def parse_timestamps(dates: Sequence[Union[str, int, float]]) -> np.ndarray:
+    """
+    Batch version of parse_timestamp. UTC dates like 2021-05-03T12:34:56.789Z, as written by mongo, are parsed by numpy
+    in one go, everything else falls back to parse_timestamp.
+    """
+    if all(isinstance(date, str) and date.endswith("Z") for date in dates):
+        try:
+            return np.array([date[:-1] for date in dates], dtype="datetime64[us]").astype(np.int64) / 1e6
+        except ValueError:
+            pass
+    return np.array([parse_timestamp(date) for date in dates], dtype=np.float64)
+
+
+def tf_trajectories(tf_msgs: Sequence[dict]) -> Dict[str, TrajectoryArray]:
+    """
+    Convert tf messages of any number of frames, e.g. a dump of the tf collection of a NEEM, into one TrajectoryArray
+    per child frame.
+    """
+    by_frame = defaultdict(list)
+    for msg in tf_msgs:
+        by_frame[msg["child_frame_id"]].append(msg)
+    return {frame: TrajectoryArray.from_tf_messages(msgs) for frame, msgs in by_frame.items()}
@@ -0,0 +1,203 @@
+"""
+Local cache of recorded trajectories, for looking up the poses of objects at many points in time without a round trip
+per lookup.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+
+
+class TrajectoryCache:
+    """
+    Fetches the trajectory of an object in windows of fixed length and answers pose-at-time queries locally, by
+    binary search in the samples. Like mem_tf_get, it returns the latest sample at or before the requested time. With
+    interpolate=True, it interpolates between the samples before and after the requested time instead: linearly for
+    positions, with slerp for orientations.
+
+    A time can only be answered if the latest sample before it lies in its window or the window before. With
+    interpolation, the time must also lie between two samples in these windows or the window after, or be the time of
+    a sample. Other times (before the first sample of the object, in gaps in the trajectory which are longer than a
+    window and, with interpolation, after its last sample) are returned as NaN, so that the caller can fall back to
+    KnowRob.
+
+    Whenever a window is inserted while the cache holds more than max_samples samples, the least recently used windows
+    are evicted. The cache assumes that the trajectories do not change any more, as in a loaded NEEM: windows which
+    were fetched while poses were still being recorded do not contain the later poses.
+    """
+
+    def __init__(self, fetch: Callable[[str, float, float], TrajectoryArray], window: float = 10.0,
+                 max_samples: int = 1000000, interpolate=False):
+        """
+        :param fetch: returns the samples of an object between a start and an end time, e.g.
+        NEEMInterface.get_tf_trajectory with as_array=True
+        :param window: length of the windows in seconds
+        :param max_samples: maximum number of samples kept in the cache, the least recently used windows are evicted
+        to stay below it
+        :param interpolate: interpolate between samples instead of returning the latest sample before a time
+        """
+        if window <= 0:
+            raise ValueError("window must be positive")
+        self.fetch = fetch
+        self.window = window
+        self.max_samples = max_samples
+        self.interpolate = interpolate
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._windows: "OrderedDict[Tuple[str, int], TrajectoryArray]" = OrderedDict()
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    @property
+    def samples(self) -> int:
+        return self._samples
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._samples = 0
+
+    def pose_at(self, obj: str, timestamp: float) -> Optional[Tuple[str, List[float], List[float]]]:
+        """
+        Return the reference frame, position [x,y,z] and orientation [qx,qy,qz,qw] of obj at the given time, or None
+        if the cache cannot answer it.
+        """
+        poses = self.poses_at(obj, [timestamp])
+        if np.isnan(poses.timestamps[0]):
+            return None
+        return poses.reference_frame, poses.positions[0].tolist(), poses.quaternions[0].tolist()
+
+    def poses_at(self, obj: str, timestamps) -> TrajectoryArray:
+        """
+        Return the poses of obj at the given times. Rows which the cache cannot answer are NaN, including their
+        timestamp.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(timestamps)
+        result = TrajectoryArray(np.full(n, np.nan), np.full((n, 3), np.nan), np.full((n, 4), np.nan), frame=obj)
+        if n == 0:
+            return result
+        keys = np.floor(timestamps / self.window).astype(np.int64)
+        with self._lock:
+            for first, last in _runs(np.unique(keys)):
+                selected = (keys >= first) & (keys <= last)
+                self._answer(obj, first, last, timestamps[selected], result, np.flatnonzero(selected))
+        return result
+
+    def _answer(self, obj: str, first: int, last: int, timestamps: np.ndarray, result: TrajectoryArray,
+                rows: np.ndarray):
+        """
+        Write the poses at timestamps, which lie in the windows first..last, into the given rows of result.
+        Windows next to the run are only fetched if some timestamps lie before the first or, with interpolation, after
+        the last sample.
+        """
+        trajectory = self._samples_of(obj, first, last)
+        extend_before = len(trajectory) == 0 or timestamps.min() < trajectory.timestamps[0]
+        extend_after = self.interpolate and (len(trajectory) == 0 or timestamps.max() > trajectory.timestamps[-1])
+        if extend_before or extend_after:
+            trajectory = self._samples_of(obj, first - extend_before, last + extend_after)
+        if len(trajectory) == 0:
+            return
+        result.reference_frame = trajectory.reference_frame
+        after = np.searchsorted(trajectory.timestamps, timestamps, side="right")
+        before = after - 1
+        if not self.interpolate:
+            answered = before >= 0
+            before = before[answered]
+            rows = rows[answered]
+            result.timestamps[rows] = timestamps[answered]
+            result.positions[rows] = trajectory.positions[before]
+            result.quaternions[rows] = trajectory.quaternions[before]
+            return
+        exact = (before >= 0) & (trajectory.timestamps[np.maximum(before, 0)] == timestamps)
+        bracketed = (before >= 0) & (after < len(trajectory))
+        answered = exact | bracketed
+        before = np.maximum(before[answered], 0)
+        after = np.minimum(after[answered], len(trajectory) - 1)
+        t0 = trajectory.timestamps[before]
+        duration = trajectory.timestamps[after] - t0
+        alpha = np.zeros(len(before))
+        np.divide(timestamps[answered] - t0, duration, out=alpha, where=duration > 0)
+        alpha = np.clip(alpha, 0.0, 1.0)
+        rows = rows[answered]
+        result.timestamps[rows] = timestamps[answered]
+        result.positions[rows] = trajectory.positions[before] + \
+            alpha[:, None] * (trajectory.positions[after] - trajectory.positions[before])
+        result.quaternions[rows] = slerp(trajectory.quaternions[before], trajectory.quaternions[after], alpha)
+
+    def _samples_of(self, obj: str, first: int, last: int) -> TrajectoryArray:
+        windows = [self._window_of(obj, key) for key in range(first, last + 1)]
+        windows = [window for window in windows if len(window) > 0]
+        if len(windows) == 1:
+            return windows[0]
+        return TrajectoryArray.concatenate(windows)
+
+    def _window_of(self, obj: str, key: int) -> TrajectoryArray:
+        window = self._windows.get((obj, key))
+        if window is not None:
+            self.hits += 1
+            self._windows.move_to_end((obj, key))
+            return window
+        self.misses += 1
+        start = key * self.window
+        end = (key + 1) * self.window
+        window = self.fetch(obj, start, end)
+        order = np.argsort(window.timestamps, kind="stable")
+        # The end of a window is the start of the next one
+        order = order[window.timestamps[order] < end]
+        window = window[order]
+        self._windows[(obj, key)] = window
+        self._samples += len(window)
+        self._evict()
+        return window
+
+    def _evict(self):
+        while self._samples > self.max_samples and len(self._windows) > 0:
+            _, window = self._windows.popitem(last=False)
+            self._samples -= len(window)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "windows": len(self._windows), "samples": self._samples, "max_samples": self.max_samples,
+                    "window": self.window, "interpolate": self.interpolate}
+
+
+def _runs(keys: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Split sorted window keys into runs of consecutive keys
+    """
+    runs = []
+    for key in keys.tolist():
+        if len(runs) > 0 and runs[-1][1] == key - 1:
+            runs[-1] = (runs[-1][0], key)
+        else:
+            runs.append((key, key))
+    return runs
+
+
+def slerp(q0: np.ndarray, q1: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    Row-wise spherical linear interpolation between unit quaternions [qx,qy,qz,qw], along the shorter arc
+    :param q0: (N, 4)
+    :param q1: (N, 4)
+    :param alpha: (N,) in [0, 1]
+    """
+    q0 = q0 / np.linalg.norm(q0, axis=1, keepdims=True)
+    q1 = q1 / np.linalg.norm(q1, axis=1, keepdims=True)
+    cos_angle = np.einsum("ij,ij->i", q0, q1)
+    q1 = np.where(cos_angle[:, None] < 0, -q1, q1)
+    angle = np.arccos(np.clip(np.abs(cos_angle), 0.0, 1.0))
+    sin_angle = np.sin(angle)
+    small = sin_angle < 1e-9
+    safe_sin = np.where(small, 1.0, sin_angle)
+    w0 = np.where(small, 1 - alpha, np.sin((1 - alpha) * angle) / safe_sin)
+    w1 = np.where(small, alpha, np.sin(alpha * angle) / safe_sin)
+    result = w0[:, None] * q0 + w1[:, None] * q1
+    return result / np.linalg.norm(result, axis=1, keepdims=True)
@@ -0,0 +1,193 @@
+"""
+In-process snapshot of the triples in the knowledge base, for answering many triple lookups without round trips.
+"""
+
+import copy
+import re
+from typing import Dict, List, Tuple, Set, Iterator, Hashable, Iterable
+
+from src.neem_interface_python.rosprolog_client import Prolog
+
+_PREFIXED_NAME = re.compile(r"^(\w+):'?([^']*)'?$")
+
+# index -> first key -> second key -> set of third keys, all interned term ids
+_Index = Dict[int, Dict[int, Set[int]]]
+
+
+class TripleStore:
+    """
+    Triples indexed by subject, predicate and object (SPO, POS and OSP), so that any lookup with at least one bound
+    position is a few dict accesses. IRIs and literals are interned: every distinct term is stored once and the
+    indexes only hold integer ids.
+
+    Terms can be given as full IRIs or as prefixed names like dul:'hasParticipant' or dul:hasParticipant, using the
+    prefixes of the knowledge base the snapshot was taken from. Literals are returned as they arrive from rosprolog,
+    compound literals as lists or dicts.
+
+    A snapshot only holds the asserted triples. holds/3 also infers triples for predicates with sub-properties or an
+    inverse and for transitive and symmetric predicates, so lookups by such a predicate are only complete if it is one
+    of complete_predicates.
+    """
+
+    def __init__(self, prefixes: Dict[str, str] = None, complete_predicates: Iterable[str] = None):
+        """
+        :param prefixes: maps namespace prefixes like 'dul' to the IRI they stand for
+        :param complete_predicates: predicates for which holds/3 yields no triples besides the asserted ones
+        """
+        self.prefixes = dict(prefixes) if prefixes is not None else dict()
+        self.complete_predicates: Set[str] = set(complete_predicates) if complete_predicates is not None else set()
+        self._ids: Dict[Hashable, int] = dict()
+        self._terms: List = []
+        self._spo: _Index = dict()
+        self._pos: _Index = dict()
+        self._osp: _Index = dict()
+        self._size = 0
+
+    @staticmethod
+    def load(prolog: Prolog) -> "TripleStore":
+        """
+        Take a snapshot of all triples in the knowledge base, with a single query.
+        """
+        res = prolog.ensure_once("""
+            findall([Prefix, URI], rdf_prefixes:rdf_current_prefix(Prefix, URI), Prefixes),
+            findall([S, P, O], kb_call(holds(S, P, O)), Triples),
+            findall(P, member([_, P, _], Triples), AllPredicates), sort(AllPredicates, Predicates),
+            findall(P,
+                (member(P, Predicates),
+                 \\+ (kb_call(subproperty_of(Sub, P)), Sub \\== P),
+                 \\+ kb_call(inverse_of(P, _)), \\+ kb_call(inverse_of(_, P)),
+                 \\+ kb_call(is_transitive_property(P)), \\+ kb_call(is_symmetric_property(P))),
+                CompletePredicates)
+        """)
+        store = TripleStore(dict(res["Prefixes"]), res["CompletePredicates"])
+        for subject, predicate, obj in res["Triples"]:
+            store.add(subject, predicate, obj)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, triple: Tuple) -> bool:
+        subject, predicate, obj = (self._id(term) for term in triple)
+        return obj in self._spo.get(subject, {}).get(predicate, ())
+
+    @property
+    def term_count(self) -> int:
+        return len(self._terms)
+
+    def complete(self, predicate) -> bool:
+        """
+        True if the snapshot holds all triples which holds/3 yields for the predicate
+        """
+        return self.expand(predicate) in self.complete_predicates
+
+    def expand(self, term):
+        """
+        Expand a prefixed name to a full IRI. Other terms are returned unchanged.
+        """
+        if isinstance(term, str) and "://" not in term:
+            match = _PREFIXED_NAME.match(term)
+            if match is not None and match.group(1) in self.prefixes:
+                return self.prefixes[match.group(1)] + match.group(2)
+        return term
+
+    def add(self, subject, predicate, obj) -> bool:
+        """
+        Add a triple and return whether it was new
+        """
+        s, p, o = self._intern(subject), self._intern(predicate), self._intern(obj)
+        objects = self._spo.setdefault(s, dict()).setdefault(p, set())
+        if o in objects:
+            return False
+        objects.add(o)
+        self._pos.setdefault(p, dict()).setdefault(o, set()).add(s)
+        self._osp.setdefault(o, dict()).setdefault(s, set()).add(p)
+        self._size += 1
+        return True
+
+    def objects(self, subject, predicate) -> List:
+        return self._lookup(self._spo, subject, predicate)
+
+    def subjects(self, predicate, obj) -> List:
+        return self._lookup(self._pos, predicate, obj)
+
+    def predicates(self, subject, obj) -> List:
+        return self._lookup(self._osp, obj, subject)
+
+    def predicate_objects(self, subject) -> List[Tuple]:
+        """
+        All (predicate, object) pairs of a subject
+        """
+        return [(self._terms[p], _value(self._terms[o]))
+                for p, objects in self._spo.get(self._id(subject), {}).items() for o in objects]
+
+    def subject_predicates(self, obj) -> List[Tuple]:
+        """
+        All (subject, predicate) pairs of an object
+        """
+        return [(self._terms[s], self._terms[p])
+                for s, predicates in self._osp.get(self._id(obj), {}).items() for p in predicates]
+
+    def triples(self, subject=None, predicate=None, obj=None) -> Iterator[Tuple]:
+        """
+        Yield all triples matching the pattern, None being a wildcard
+        """
+        s, p, o = (self._id(term) if term is not None else None for term in (subject, predicate, obj))
+        if -1 in (s, p, o):
+            return
+        terms = self._terms
+        if s is not None:
+            for p2, objects in self._spo.get(s, {}).items():
+                if p is None or p2 == p:
+                    for o2 in objects:
+                        if o is None or o2 == o:
+                            yield terms[s], terms[p2], _value(terms[o2])
+        elif o is not None:
+            for s2, predicates in self._osp.get(o, {}).items():
+                for p2 in predicates:
+                    if p is None or p2 == p:
+                        yield terms[s2], terms[p2], _value(terms[o])
+        elif p is not None:
+            for o2, subjects in self._pos.get(p, {}).items():
+                for s2 in subjects:
+                    yield terms[s2], terms[p], _value(terms[o2])
+        else:
+            for s2, by_predicate in self._spo.items():
+                for p2, objects in by_predicate.items():
+                    for o2 in objects:
+                        yield terms[s2], terms[p2], _value(terms[o2])
+
+    def _lookup(self, index: _Index, first, second) -> List:
+        ids = index.get(self._id(first), {}).get(self._id(second), ())
+        return [_value(self._terms[i]) for i in ids]
+
+    def _id(self, term) -> int:
+        """
+        Id of an interned term, -1 if the term does not occur in any triple
+        """
+        return self._ids.get(_hashable(self.expand(term)), -1)
+
+    def _intern(self, term) -> int:
+        key = _hashable(term)
+        i = self._ids.get(key)
+        if i is None:
+            i = len(self._terms)
+            self._ids[key] = i
+            self._terms.append(term)
+        return i
+
+
+def _hashable(term) -> Hashable:
+    # Compound literals arrive as JSON lists and objects
+    if isinstance(term, list):
+        return tuple(_hashable(t) for t in term)
+    if isinstance(term, dict):
+        return tuple(sorted((key, _hashable(value)) for key, value in term.items()))
+    return term
+
+
+def _value(term):
+    # Compound literals are returned as copies, so callers cannot change the snapshot
+    if isinstance(term, (list, dict)):
+        return copy.deepcopy(term)
+    return term
@@ -1,9 +1,11 @@
-from typing import List
+from datetime import datetime
+from typing import List, Union
 
 from scipy.spatial.transform import Rotation
 import dateutil.parser
 
 from src.neem_interface_python.rosprolog_client import atom, Prolog
+from src.neem_interface_python.utils.terms import pose_term
 
 
 class Pose:
@@ -20,9 +22,7 @@ class Pose:
         """
         Convert to a KnowRob pose "[reference_cs, [x,y,z],[qx,qy,qz,qw]]"
         """
-        quat = self.ori.as_quat()   # qxyzw
-        return f"[{atom(self.reference_frame)}, [{self.pos[0]},{self.pos[1]},{self.pos[2]}], [{quat[0]}," \
-               f"{quat[1]},{quat[2]},{quat[3]}]]"
+        return pose_term(self.reference_frame, self.pos, self.ori.as_quat())   # qxyzw
 
 
 class Datapoint:
@@ -52,13 +52,11 @@ class Datapoint:
         """
         Convert to a KnowRob pose "[reference_cs, [x,y,z],[qx,qy,qz,qw]]"
         """
-        quat = self.ori.as_quat()   # qxyzw
-        return f"[{atom(self.reference_frame)}, [{self.pos[0]},{self.pos[1]},{self.pos[2]}], [{quat[0]}," \
-               f"{quat[1]},{quat[2]},{quat[3]}]]"
+        return pose_term(self.reference_frame, self.pos, self.ori.as_quat())   # qxyzw
 
     @staticmethod
     def from_tf(tf_msg: dict):
-        timestamp = dateutil.parser.parse(tf_msg["header"]["stamp"]["$date"]).timestamp()
+        timestamp = parse_timestamp(tf_msg["header"]["stamp"]["$date"])
         frame = tf_msg["child_frame_id"]
         reference_frame = tf_msg["header"]["frame_id"]
         trans = tf_msg["transform"]["translation"]
@@ -88,6 +86,19 @@ class Datapoint:
         return Datapoint(timestamp, frame, reference_frame, pos_rhs, ori_rhs)
 
 
+def parse_timestamp(date: Union[str, int, float]) -> float:
+    """
+    Convert a date from mongo's extended JSON (ISO 8601 string or milliseconds since the epoch) to a unix timestamp.
+    datetime.fromisoformat is much faster than dateutil, which is only used for strings it does not understand.
+    """
+    if isinstance(date, (int, float)):
+        return date / 1000.0
+    try:
+        return datetime.fromisoformat(date[:-1] + "+00:00" if date.endswith("Z") else date).timestamp()
+    except ValueError:
+        return dateutil.parser.parse(date).timestamp()
+
+
 def expand_rdf_namespace(prolog: Prolog, short_namespace: str) -> str:
     return prolog.ensure_once(f"rdf_prefixes:rdf_current_prefix({atom(short_namespace)}, URI)")["URI"]
 
@@ -0,0 +1,194 @@
+"""
+Write-behind queue which sends assertions to rosprolog from a background thread, in coalesced batches.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Tuple, Dict
+
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException, PrologQueryRejected
+from src.neem_interface_python.utils.utils import expand_rdf_namespace
+
+_PREFIXED_CLASS = re.compile(r"^(\w+):'?([^':]+)'?$")
+
+
+class IriAllocator:
+    def __init__(self, prolog: Prolog):
+        """
+        Creates IRIs of new individuals on the client, so they are known before the individuals are asserted.
+        The IRIs follow the scheme of KnowRob's new_iri/2: the namespace and name of the class, followed by a random
+        suffix.
+        """
+        self.prolog = prolog
+        self._namespaces: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, prefix: str) -> str:
+        """
+        Expand an RDF prefix like 'soma' into its namespace IRI. Costs a round trip the first time a prefix is used.
+        """
+        with self._lock:
+            namespace = self._namespaces.get(prefix)
+        if namespace is None:
+            namespace = expand_rdf_namespace(self.prolog, prefix)
+            with self._lock:
+                self._namespaces[prefix] = namespace
+        return namespace
+
+    def new_iri(self, class_term: str) -> str:
+        """
+        :param class_term: the class of the individual, either as prefixed name (soma:'State') or as full IRI
+        """
+        match = _PREFIXED_CLASS.match(class_term)
+        if match is not None and not class_term.startswith("http"):
+            namespace, name = self.namespace(match.group(1)), match.group(2)
+        else:
+            separator = "#" if "#" in class_term else "/"
+            namespace, _, name = class_term.rpartition(separator)
+            namespace += separator
+        return f"{namespace}{name}_{uuid.uuid4().hex[:16]}"
+
+
+class WriteBehindQueue:
+    """
+    Executes goals which only assert knowledge (kb_project, tf_set_pose, ...) in the background.
+    submit() returns immediately with a Future. A background thread collects the queued goals and sends up to
+    max_batch_size of them as a single query, in submission order, so goals may depend on the goals submitted before
+    them. The goals of a batch do not share variables and a failing goal does not stop the goals after it.
+    """
+
+    def __init__(self, prolog: Prolog, max_batch_size: int = 100, flush_interval: float = 0.05):
+        """
+        :param max_batch_size: maximum number of goals sent in one query
+        :param flush_interval: time in seconds the background thread waits for more goals before it sends a batch
+        """
+        self.prolog = prolog
+        self.max_batch_size = max(max_batch_size, 1)
+        self.flush_interval = flush_interval
+        self._queue: deque = deque()     # (goal, future), goal is None for flush barriers
+        self._barriers = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="WriteBehindQueue", daemon=True)
+        self._thread.start()
+
+    def submit(self, goal: str) -> Future:
+        """
+        Queue a goal. The Future resolves to None once the goal succeeded, or to a PrologException if it failed.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit goals to a closed WriteBehindQueue")
+            self._queue.append((goal, future))
+            self._condition.notify()
+        return future
+
+    def flush(self, timeout: float = None):
+        """
+        Block until all goals submitted before this call have been executed.
+        """
+        barrier = Future()
+        with self._condition:
+            if self._closed and not self._thread.is_alive():
+                return
+            self._queue.append((None, barrier))
+            self._barriers += 1
+            self._condition.notify()
+        barrier.result(timeout)
+
+    def close(self, timeout: float = None):
+        """
+        Execute the remaining goals and stop the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue) - self._barriers
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._closed:
+                    self._condition.wait()
+                if len(self._queue) == 0:
+                    return
+                # Give the caller a chance to submit more goals which can go into the same query
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.max_batch_size and self._barriers == 0 and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                items = []
+                while len(self._queue) > 0 and len(items) < self.max_batch_size:
+                    item = self._queue.popleft()
+                    if item[0] is None:
+                        self._barriers -= 1
+                    items.append(item)
+            goals = [item for item in items if item[0] is not None]
+            try:
+                self._execute(goals)
+            except Exception as e:
+                # Never leave a future unresolved, or flush() would block forever
+                for _, future in goals:
+                    if not future.done():
+                        future.set_exception(e)
+            for goal, future in items:
+                if goal is None:
+                    future.set_result(None)
+
+    def _execute(self, items: List[Tuple[str, Future]]):
+        if len(items) == 0:
+            return
+        try:
+            solution = self.prolog.ensure_once(coalesce(goal for goal, _ in items))
+        except PrologQueryRejected:
+            # The query as a whole was rejected, e.g. because one goal is malformed. Nothing has been executed yet.
+            self._execute_one_by_one(items)
+            return
+        except Exception as e:
+            # After a transport error or a timeout, some goals may have been executed, so they are not retried
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for i, (goal, future) in enumerate(items):
+            status = solution.get(_status_variable(i))
+            if status == "true":
+                future.set_result(None)
+            else:
+                future.set_exception(PrologException(f"Goal {'raised an error' if status == 'error' else 'failed'}: "
+                                                     f"{goal}"))
+
+    def _execute_one_by_one(self, items: List[Tuple[str, Future]]):
+        for goal, future in items:
+            try:
+                self.prolog.ensure_once(goal)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+
+def _status_variable(i: int) -> str:
+    return f"WriteBehindStatus{i}"
+
+
+def coalesce(goals) -> str:
+    """
+    Combine goals into one query which executes all of them in order. The double negation executes each goal with its
+    own variable bindings, and the outcome of goal i is bound to WriteBehindStatus<i> as true, false or error.
+    """
+    parts = []
+    for i, goal in enumerate(goals):
+        status = _status_variable(i)
+        parts.append(f"catch((\\+ \\+ ({goal}\n) -> {status} = true ; {status} = false), _, {status} = error)")
+    return ",\n".join(parts)
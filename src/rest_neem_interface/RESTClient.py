@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import threading
 from flask import Flask, render_template, jsonify, request
 from flask_restful import Resource, Api, reqparse
 import pandas as pd
@@ -10,6 +11,19 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__)
 api = Api(app)
 
+# The VR episode endpoints share one NEEMData, so that the facts which are asserted once per episode are remembered
+# across requests, see KnownFacts
+_vr_neem_data = None
+_vr_neem_data_lock = threading.Lock()
+
+
+def vr_neem_data() -> NEEMData:
+    global _vr_neem_data
+    with _vr_neem_data_lock:
+        if _vr_neem_data is None:
+            _vr_neem_data = NEEMData()
+        return _vr_neem_data
+
 
 @app.route("/")
 def get_hello_world():
@@ -239,7 +253,7 @@ def post_add_subaction_with_task():
     
     print("create sub action call parent_action: %s , sub_action_type : %s , task_type: %s , start_time: %s , end_time: %s , objects_participated: %s , game_participant: %s "
           %(parent_action_iri, sub_action_type, task_type, start_time, end_time, objects_participated, game_participant))
-    response = NEEMData().add_subaction_with_task(parent_action_iri, sub_action_type, task_type, start_time, end_time, objects_participated, game_participant)
+    response = vr_neem_data().add_subaction_with_task(parent_action_iri, sub_action_type, task_type, start_time, end_time, objects_participated, game_participant)
     if response is not None:
         return jsonify(response), 200
     else:
@@ -251,7 +265,7 @@ def create_episode():
     print("create an episode with game_participant: %s "
           %(game_participant))
 
-    response = NEEMData().create_episode(game_participant)
+    response = vr_neem_data().create_episode(game_participant)
     if response is not None:
         return jsonify(response), 200
     else:
@@ -262,7 +276,7 @@ def create_episode():
 def post_finish_episode():
     episode_iri = request.json['episode_iri']
     print("finish an episode with iri: %s " %(episode_iri))
-    response = NEEMData().finish_episode(episode_iri)
+    response = vr_neem_data().finish_episode(episode_iri)
     if response is not None:
         return jsonify(response), 200
     else:
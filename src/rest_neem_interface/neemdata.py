@@ -29,11 +29,13 @@ class NEEMData(object):
     def load_neem_to_kb(self):
         # prolog exception will be raised if response is none
         response = self.prolog.ensure_once(f"remember({atom(neem_uri)})")
+        NEEMInterface.knowledge_base_replaced()
         return response
 
     def insert_fact_to_kb(self):
         # prolog exception will be raised if response is none
         response = self.prolog.ensure_once(f"remember({atom(neem_uri)})")
+        NEEMInterface.knowledge_base_replaced()
         return response
 
     def get_all_actions(self):
@@ -0,0 +1,20 @@
+import pytest
+
+from tests.fake_rosprolog import FakeRosprolog
+from src.neem_interface_python.utils.rosbridge import set_connection_pool
+
+
+@pytest.fixture
+def server():
+    server = FakeRosprolog()
+    server.install()
+    yield server
+    set_connection_pool(None)
+
+
+@pytest.fixture
+def out_of_order_server():
+    server = FakeRosprolog(out_of_order=True)
+    server.install()
+    yield server
+    set_connection_pool(None)
@@ -0,0 +1,214 @@
+"""
+In-process stand-in for the rosprolog services, to exercise and benchmark the Prolog client without ROS, rosbridge
+and KnowRob.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import List, Dict, Union, Callable, Pattern
+
+from src.neem_interface_python.rosprolog_client import PrologNextSolutionResponse
+from src.neem_interface_python.utils.rosbridge import RosbridgeConnectionPool, set_connection_pool
+
+Solutions = Union[List[Dict], Callable[[str], List[Dict]]]
+
+_ONCE_WRAPPER = re.compile(r"^once\(\((.*)\n\)\)$", re.DOTALL)
+
+
+class FakeRosprolog:
+    """
+    Answers query, next_solution and finish requests like rosprolog does, with canned solutions.
+    Every service call takes `latency` seconds: half of it before the request is handled, half of it before the
+    response is delivered.
+    """
+
+    def __init__(self, latency: float = 0.0, default_solutions: Solutions = None, out_of_order=False):
+        """
+        :param latency: simulated round-trip time of a service call in seconds
+        :param default_solutions: solutions of queries which do not match any rule. Defaults to a single solution
+        without bindings, i.e. every query succeeds.
+        :param out_of_order: if True, non-blocking calls which are outstanding at the same time are handled and
+        answered in the reverse order of their arrival, as rosbridge is allowed to do
+        """
+        self.latency = latency
+        self.default_solutions = default_solutions if default_solutions is not None else [{}]
+        self.out_of_order = out_of_order
+        self._deferred = []
+        self._dispatch_scheduled = False
+        self.calls = Counter()
+        self.received_queries = []
+        self._rules = []
+        self._open_queries = {}
+        self._lock = threading.Lock()
+
+    def add_solutions(self, pattern: Union[str, Pattern], solutions: Solutions):
+        """
+        Answer queries matching the regular expression with the given solutions. solutions may be a callable which
+        maps the query string to the solutions. Rules added later take precedence.
+        """
+        self._rules.insert(0, (re.compile(pattern, re.DOTALL), solutions))
+
+    def add_failure(self, pattern: Union[str, Pattern], message: str = "error"):
+        """
+        Reject queries matching the regular expression, like rosprolog rejects malformed queries.
+        """
+        self._rules.insert(0, (re.compile(pattern, re.DOTALL), PrologFailure(message)))
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.received_queries = []
+
+    @property
+    def service_calls(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def open_queries(self) -> List[str]:
+        with self._lock:
+            return list(self._open_queries.keys())
+
+    def handle(self, service_name: str, request: Dict) -> Dict:
+        service = service_name.rsplit("/", 1)[-1]
+        with self._lock:
+            self.calls[service] += 1
+            if service == "query":
+                return self._handle_query(request)
+            elif service == "next_solution":
+                return self._handle_next_solution(request)
+            elif service == "finish":
+                self._open_queries.pop(request["id"], None)
+                return {}
+        raise ValueError(f"Unknown rosprolog service {service_name}")
+
+    def _handle_query(self, request: Dict) -> Dict:
+        query_str = request["query"]
+        self.received_queries.append(query_str)
+        if request["id"] in self._open_queries:
+            return {"ok": False, "message": f"Query id {request['id']} is already in use"}
+        once = _ONCE_WRAPPER.match(query_str)
+        goal = once.group(1) if once is not None else query_str
+        solutions = self._solutions_for(goal)
+        if isinstance(solutions, PrologFailure):
+            return {"ok": False, "message": solutions.message}
+        if once is not None:
+            solutions = solutions[:1]
+        self._open_queries[request["id"]] = deque(solutions)
+        return {"ok": True, "message": ""}
+
+    def _handle_next_solution(self, request: Dict) -> Dict:
+        solutions = self._open_queries.get(request["id"])
+        if solutions is None:
+            return {"status": PrologNextSolutionResponse.WRONG_ID.value, "solution": ""}
+        if len(solutions) == 0:
+            return {"status": PrologNextSolutionResponse.NO_SOLUTION.value, "solution": ""}
+        return {"status": PrologNextSolutionResponse.OK.value, "solution": solutions.popleft()}
+
+    def _solutions_for(self, goal: str):
+        solutions = self.default_solutions
+        for pattern, rule_solutions in self._rules:
+            if pattern.search(goal):
+                solutions = rule_solutions
+                break
+        if isinstance(solutions, PrologFailure):
+            return solutions
+        if callable(solutions):
+            solutions = solutions(goal)
+        return [json.dumps(solution) for solution in solutions]
+
+    def defer(self, respond: Callable[[], None]):
+        """
+        Queue a non-blocking call in out-of-order mode. All calls queued within the same latency window are handled
+        together, last one first.
+        """
+        with self._lock:
+            self._deferred.append(respond)
+            if self._dispatch_scheduled:
+                return
+            self._dispatch_scheduled = True
+        timer = threading.Timer(max(self.latency, 0.01), self._dispatch)
+        timer.daemon = True
+        timer.start()
+
+    def _dispatch(self):
+        with self._lock:
+            deferred = self._deferred
+            self._deferred = []
+            self._dispatch_scheduled = False
+        for respond in reversed(deferred):
+            respond()
+
+    def connection(self) -> "FakeRosbridgeConnection":
+        return FakeRosbridgeConnection(self)
+
+    def pool(self, size: int = 1, strategy: str = "round_robin") -> RosbridgeConnectionPool:
+        return RosbridgeConnectionPool([("fake-rosbridge", 0)], size=size, strategy=strategy,
+                                       connection_factory=lambda host, port: FakeRosbridgeConnection(self))
+
+    def install(self, size: int = 1, strategy: str = "round_robin") -> RosbridgeConnectionPool:
+        """
+        Make a pool of connections to this fake the default connection pool, so all Prolog clients created without an
+        explicit connection or pool talk to it. set_connection_pool(None) restores the real default pool.
+        """
+        pool = self.pool(size, strategy)
+        set_connection_pool(pool)
+        return pool
+
+
+class PrologFailure:
+    def __init__(self, message: str):
+        self.message = message
+
+
+class FakeService:
+    def __init__(self, server: FakeRosprolog, name: str):
+        """
+        Mimics roslibpy.Service.call for a service of FakeRosprolog.
+        """
+        self.server = server
+        self.name = name
+
+    def call(self, request, callback=None, errback=None, timeout=None):
+        request = dict(request)
+        if callback is None:
+            time.sleep(self.server.latency / 2)
+            response = self.server.handle(self.name, request)
+            time.sleep(self.server.latency / 2)
+            return response
+
+        def respond(delay: float):
+            time.sleep(delay)
+            try:
+                response = self.server.handle(self.name, request)
+            except Exception as e:
+                if errback is not None:
+                    errback(str(e))
+                return
+            time.sleep(delay)
+            callback(response)
+
+        if self.server.out_of_order:
+            self.server.defer(lambda: respond(0.0))
+        else:
+            threading.Thread(target=respond, args=(self.server.latency / 2,), daemon=True).start()
+
+
+class FakeRosbridgeConnection:
+    def __init__(self, server: FakeRosprolog):
+        """
+        Drop-in replacement for RosbridgeConnection which serves the services of a FakeRosprolog.
+        """
+        self.server = server
+        self.host = "fake-rosbridge"
+        self.port = 0
+        self.leases = 0
+        self.is_connected = True
+
+    def service(self, name: str, service_type: str) -> FakeService:
+        return FakeService(self.server, name)
+
+    def close(self):
+        pass
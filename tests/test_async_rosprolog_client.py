@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.neem_interface_python.async_rosprolog_client import AsyncProlog
+from src.neem_interface_python.rosprolog_client import PrologException
+from src.neem_interface_python.utils.rosbridge import RosbridgeConnectionPool
+from tests.fake_rosprolog import FakeRosbridgeConnection
+
+
+def test_once_and_all_solutions(server):
+    server.add_solutions(r"is_state", [{"State": f"state_{i}"} for i in range(3)])
+    prolog = AsyncProlog()
+
+    async def run():
+        return await prolog.once("is_state(State)"), await prolog.all_solutions("is_state(State)")
+
+    first, solutions = asyncio.run(run())
+    assert first == {"State": "state_0"}
+    assert solutions == [{"State": f"state_{i}"} for i in range(3)]
+    assert server.open_queries == []
+
+
+def test_failures(server):
+    server.add_solutions(r"is_state", [])
+    server.add_failure(r"syntax_error")
+    prolog = AsyncProlog()
+    assert asyncio.run(prolog.once("is_state(State)")) is None
+    with pytest.raises(PrologException):
+        asyncio.run(prolog.ensure_once("is_state(State)"))
+    with pytest.raises(PrologException):
+        asyncio.run(prolog.once("syntax_error("))
+    assert server.open_queries == []
+
+
+def test_concurrent_queries(server):
+    server.latency = 0.05
+    server.add_solutions(r"is_state", lambda query_str: [{"State": query_str[9:-8]}])
+    prolog = AsyncProlog()
+
+    async def run():
+        return await asyncio.gather(*(prolog.ensure_once(f"is_state({i}, State)") for i in range(50)))
+
+    start = time.monotonic()
+    solutions = asyncio.run(run())
+    # 50 queries of three round trips each, which would take 7.5 s one after the other
+    assert time.monotonic() - start < 2.0
+    assert [solution["State"] for solution in solutions] == [str(i) for i in range(50)]
+    assert server.open_queries == []
+
+
+@pytest.mark.parametrize("cancel_after", [0.01, 0.15])
+def test_cancelled_query_is_finished(server, cancel_after):
+    server.latency = 0.2
+    prolog = AsyncProlog()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(prolog.once("is_state(State)"), cancel_after)
+        await asyncio.sleep(0.6)
+
+    asyncio.run(run())
+    assert server.calls["query"] == 1
+    assert server.open_queries == []
+
+
+class _SlowConnection(FakeRosbridgeConnection):
+    """
+    A connection which has not been established yet, so getting a service blocks while connecting
+    """
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.is_connected = False
+        self.connecting_threads = []
+
+    def service(self, name: str, service_type: str):
+        self.connecting_threads.append(threading.current_thread())
+        time.sleep(0.1)
+        return super().service(name, service_type)
+
+
+def test_connecting_does_not_block_the_event_loop(server):
+    connection = _SlowConnection(server)
+    prolog = AsyncProlog(pool=RosbridgeConnectionPool([("fake-rosbridge", 0)],
+                                                      connection_factory=lambda host, port: connection))
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        await prolog.once("is_state(State)")
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(run()) > 10
+    assert threading.main_thread() not in connection.connecting_threads
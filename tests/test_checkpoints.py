@@ -0,0 +1,79 @@
+import logging
+import time
+
+import pytest
+
+from src.neem_interface_python.neem_interface import Episode, NEEMInterface
+from src.neem_interface_python.rosprolog_client import PrologException
+
+
+@pytest.fixture
+def knowrob(server):
+    server.add_solutions(r"^mem_episode_start", [{"Action": "Action_0"}])
+    server.add_solutions(r"is_setting_for", [{"Episode": "Episode_0"}])
+    server.add_solutions(r"mng_dump_collection", [{"Bytes": 1000}])
+    return server
+
+
+def _episode(neem_interface: NEEMInterface, **kwargs) -> Episode:
+    return Episode(neem_interface, "soma:'Pouring'", "env.owl", "Kitchen_0", "env.urdf", "agent.owl", "PR2_0",
+                   "agent.urdf", "/neems/pouring", start_time=100.0, **kwargs)
+
+
+def _queries(server, pattern: str):
+    return [query for query in server.received_queries if pattern in query]
+
+
+def test_checkpoint_removes_only_poses_inserted_before_the_dump(knowrob):
+    assert NEEMInterface().checkpoint_tf("/neems/pouring/checkpoints/000000", 200.0) == 1000
+    query, = _queries(knowrob, "mng_dump_collection")
+    assert query.index("get_time(Now)") < query.index("mng_dump_collection") < query.index("mng_remove")
+    assert "['_id', ['$lt', id(BoundId)]]" in query
+    assert "['header.stamp', ['$lt', time(200.0)]]" in query
+    # No marker field is written into the tf documents
+    assert "mng_update" not in query and "$set" not in query
+
+
+def test_checkpoints_are_merged_into_the_neem_and_removed(knowrob):
+    with _episode(NEEMInterface()) as episode:
+        assert episode.checkpoint() == 1000
+        assert episode.checkpoint() == 1000
+        assert episode.bytes_written == 2000
+        knowrob.reset_stats()
+    stop, merge, remove = knowrob.received_queries
+    assert stop.startswith("mem_episode_stop('/neems/pouring'")
+    assert "['/neems/pouring/checkpoints/000000','/neems/pouring/checkpoints/000001','/neems/pouring']" in merge
+    assert "rename_file(Merged, Target)" in merge
+    assert remove == "delete_directory_and_contents('/neems/pouring/checkpoints')"
+    assert len(_queries(knowrob, "mng_restore")) == 0
+    assert episode.checkpoints == []
+
+
+def test_checkpoints_are_kept_if_merging_fails(knowrob):
+    knowrob.add_failure(r"rename_file")
+    episode = _episode(NEEMInterface())
+    with pytest.raises(PrologException):
+        with episode:
+            episode.checkpoint()
+    assert len(_queries(knowrob, "mem_episode_stop")) == 1
+    assert len(_queries(knowrob, "delete_directory_and_contents")) == 0
+    assert episode.checkpoints == ["/neems/pouring/checkpoints/000000"]
+
+
+def test_episode_without_checkpoints_is_only_stopped(knowrob):
+    with _episode(NEEMInterface()):
+        knowrob.reset_stats()
+    assert len(knowrob.received_queries) == 1
+    assert knowrob.received_queries[0].startswith("mem_episode_stop")
+
+
+def test_failing_periodic_checkpoints_are_logged(knowrob, caplog):
+    knowrob.add_failure(r"mng_dump_collection", "mongodump failed")
+    with caplog.at_level(logging.WARNING, logger="src.neem_interface_python.neem_interface"):
+        with _episode(NEEMInterface(), checkpoint_interval=0.01) as episode:
+            deadline = time.monotonic() + 5
+            while len(caplog.records) == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+    assert "mongodump failed" in caplog.records[0].getMessage()
+    assert episode.checkpoints == []
+    assert len(_queries(knowrob, "rename_file")) == 0
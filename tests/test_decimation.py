@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation, Slerp
+
+from src.neem_interface_python.utils.decimation import Decimation
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+
+
+def _noisy_trajectory(n=500, seed=0) -> TrajectoryArray:
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(rng.uniform(0.0, 10.0, n))
+    positions = np.stack([np.sin(timestamps), np.cos(timestamps), 0.1 * timestamps], axis=1)
+    positions += rng.normal(scale=0.0005, size=positions.shape)
+    rotvecs = np.stack([0.1 * timestamps, np.sin(timestamps), np.zeros(n)], axis=1)
+    rotvecs += rng.normal(scale=0.002, size=rotvecs.shape)
+    return TrajectoryArray(timestamps, positions, Rotation.from_rotvec(rotvecs).as_quat())
+
+
+def test_dropped_samples_are_within_tolerances():
+    trajectory = _noisy_trajectory()
+    decimation = Decimation(translation_tolerance=0.002, rotation_tolerance=0.01)
+    indices = decimation.indices(trajectory.timestamps, trajectory.positions, trajectory.quaternions)
+    assert indices[0] == 0 and indices[-1] == len(trajectory) - 1
+    assert len(indices) < len(trajectory)
+
+    # Reconstruct the dropped samples independently of the implementation, with np.interp and scipy's Slerp
+    kept_timestamps = trajectory.timestamps[indices]
+    positions = np.stack([np.interp(trajectory.timestamps, kept_timestamps, trajectory.positions[indices, axis])
+                          for axis in range(3)], axis=1)
+    rotations = Slerp(kept_timestamps, Rotation.from_quat(trajectory.quaternions[indices]))(trajectory.timestamps)
+    translation_errors = np.linalg.norm(positions - trajectory.positions, axis=1)
+    rotation_errors = (rotations.inv() * Rotation.from_quat(trajectory.quaternions)).magnitude()
+    assert translation_errors.max() <= 0.002 + 1e-9
+    assert rotation_errors.max() <= 0.01 + 1e-9
+
+    report = decimation.last_report
+    assert report.original_points == len(trajectory)
+    assert report.kept_points == len(indices)
+    assert report.max_translation_error == pytest.approx(translation_errors.max(), abs=1e-9)
+    assert report.max_translation_error <= 0.002
+    assert report.max_rotation_error <= 0.01
+
+
+def test_apply_returns_kept_samples():
+    trajectory = _noisy_trajectory(n=100)
+    decimation = Decimation(translation_tolerance=0.002, rotation_tolerance=0.01)
+    decimated = decimation.apply(trajectory)
+    indices = decimation.indices(trajectory.timestamps, trajectory.positions, trajectory.quaternions)
+    np.testing.assert_array_equal(decimated.timestamps, trajectory.timestamps[indices])
+    np.testing.assert_array_equal(decimated.quaternions, trajectory.quaternions[indices])
+
+
+def test_quaternion_sign_flips_are_the_same_rotation():
+    n = 50
+    quaternions = np.tile(Rotation.from_euler("z", 0.3).as_quat(), (n, 1))
+    quaternions[1::2] *= -1
+    indices = Decimation().indices(np.arange(n, dtype=float), np.zeros((n, 3)), quaternions)
+    np.testing.assert_array_equal(indices, [0, n - 1])
+
+
+def test_slerp_uses_the_shorter_arc():
+    # A constant rotation about z from 170 to 190 degrees, the last quaternion having the opposite sign
+    n = 21
+    angles = np.deg2rad(np.linspace(170.0, 190.0, n))
+    quaternions = Rotation.from_euler("z", angles[:, None]).as_quat()
+    quaternions[-1] *= -1
+    decimation = Decimation(rotation_tolerance=1e-6)
+    indices = decimation.indices(np.arange(n, dtype=float), np.zeros((n, 3)), quaternions)
+    np.testing.assert_array_equal(indices, [0, n - 1])
+    assert decimation.last_report.max_rotation_error < 1e-6
+
+
+def test_short_trajectories_are_kept():
+    decimation = Decimation()
+    indices = decimation.indices([0.0, 1.0], np.zeros((2, 3)), [[0, 0, 0, 1], [0, 0, 0, 1]])
+    np.testing.assert_array_equal(indices, [0, 1])
+    assert decimation.last_report.ratio == 1.0
+
+
+def test_reports_keep_the_most_recent_runs():
+    decimation = Decimation(max_reports=3)
+    for n in range(3, 8):
+        decimation.indices(np.arange(n, dtype=float), np.zeros((n, 3)), np.tile([0.0, 0.0, 0.0, 1.0], (n, 1)))
+    assert len(decimation.reports) == 3
+    assert [report.original_points for report in decimation.reports] == [5, 6, 7]
+    assert decimation.last_report.original_points == 7
+
+
+def test_missing_timestamps_are_rejected():
+    with pytest.raises(ValueError):
+        Decimation().indices([0.0, None, 2.0], np.zeros((3, 3)), np.tile([0.0, 0.0, 0.0, 1.0], (3, 1)))
+
+
+def test_tolerances_must_be_positive():
+    with pytest.raises(ValueError):
+        Decimation(translation_tolerance=0.0)
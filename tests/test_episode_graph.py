@@ -0,0 +1,97 @@
+import re
+
+import pytest
+
+from src.neem_interface_python.episode_graph import EpisodeGraph
+from src.neem_interface_python.neem_interface import NEEMInterface
+from src.neem_interface_python.rosprolog_client import Prolog
+from src.neem_interface_python.utils.write_behind import IriAllocator
+
+_NEW_IRI = re.compile(r"new_iri\((\w+), ([^)]+)\)")
+
+
+@pytest.fixture
+def projected(server):
+    """
+    Queries of kb_project calls, whose new_iri variables are bound to the class followed by the variable name
+    """
+    projected = []
+
+    def project(query_str: str):
+        projected.append(query_str)
+        return [{variable: f"{iri_class}#{variable}" for variable, iri_class in _NEW_IRI.findall(query_str)}]
+
+    server.add_solutions(r"^kb_project\(", project)
+    server.add_solutions(r"rdf_current_prefix\('soma'", [{"URI": "http://www.ease-crc.org/ont/SOMA.owl#"}])
+    server.add_solutions(r"rdf_current_prefix\('dul'",
+                         [{"URI": "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"}])
+    return projected
+
+
+def test_graph_is_committed_in_one_round_trip(server, projected):
+    graph = EpisodeGraph()
+    state = graph.state(["Cup_0"], 1.0, 2.0)
+    situation = graph.situation("Agent_0", ["Cup_0", "Table_0"])
+    transition, initial_state, terminal_state = graph.transition("Agent_0", "Cup_0", 1.0, 2.0)
+    server.reset_stats()
+    iris = graph.commit(Prolog())
+    assert server.calls["query"] == 1
+    assert projected == [graph.query()]
+    assert iris[state] == f"soma:'State'#{state}"
+    assert iris[situation] == f"dul:'Situation'#{situation}"
+    assert iris[transition] == f"dul:'Transition'#{transition}"
+    assert {iris[initial_state], iris[terminal_state]} == {f"soma:'State'#{initial_state}",
+                                                           f"soma:'State'#{terminal_state}"}
+    assert not graph.allocated()
+
+
+def test_nodes_are_distinct_variables():
+    graph = EpisodeGraph()
+    nodes = [graph.node("State", "soma:'State'") for _ in range(3)]
+    assert len(set(nodes)) == 3
+    assert all(re.fullmatch(r"State_\d+", node) for node in nodes)
+
+
+def test_facts_reference_nodes_and_quote_iris():
+    graph = EpisodeGraph()
+    action = graph.subaction("http://example.org#Action_0", "soma:'Grasping'", "soma:'Grasp'", 1.0, 2.5)
+    graph.participant_with_role(action, "http://example.org#Cup_0", "soma:'Patient'")
+    query = graph.query()
+    assert query.startswith("kb_project([") and query.endswith("])")
+    assert f"triple('http://example.org#Action_0', dul:hasConstituent, {action})" in query
+    assert f"has_time_interval({action}, 1.0, 2.5)" in query
+    assert f"has_participant({action}, 'http://example.org#Cup_0')" in query
+
+
+def test_time_interval_needs_start_and_end():
+    graph = EpisodeGraph()
+    graph.state(["Cup_0"], start_time=1.0)
+    assert not any(fact.startswith("has_time_interval") for fact in graph.facts)
+
+
+def test_allocated_graph_knows_its_iris_before_commit(server, projected):
+    graph = EpisodeGraph(IriAllocator(Prolog()))
+    state = graph.state(["Cup_0"], 1.0, 2.0)
+    role = graph.participant_with_role("Action_0", "Cup_0")
+    assert graph.allocated()
+    iris = graph.iris()
+    assert iris[state].startswith("http://www.ease-crc.org/ont/SOMA.owl#State_")
+    assert iris[role].startswith("http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#Role_")
+    assert "new_iri" not in graph.query()
+    assert graph.commit(Prolog()) == iris
+    assert projected == [graph.query()]
+
+
+def test_commit_graph_queues_allocated_graphs_in_write_behind_mode(server, projected):
+    server.add_solutions(r"WriteBehindStatus0", [{"WriteBehindStatus0": "true"}])
+    neem_interface = NEEMInterface()
+    neem_interface.enable_write_behind(flush_interval=0.01)
+    graph = neem_interface.episode_graph()
+    state = graph.state(["Cup_0"], 1.0, 2.0)
+    iris = neem_interface.commit_graph(graph)
+    assert iris[state].startswith("http://www.ease-crc.org/ont/SOMA.owl#State_")
+    neem_interface.flush(timeout=5)
+    # Sent by the write-behind queue, as part of a batch
+    assert len(projected) == 0
+    assert any(graph.query() in query and "WriteBehindStatus0" in query for query in server.received_queries)
+    neem_interface.disable_write_behind()
@@ -0,0 +1,56 @@
+from src.neem_interface_python.rosprolog_client import Prolog
+from src.neem_interface_python.utils.instrumentation import Histogram, PrologInstrumentation
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [("0.1", 2), ("1.0", 4), ("+Inf", 5)]
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5 and abs(snapshot["sum"] - 3.65) < 1e-9 and abs(snapshot["mean"] - 0.73) < 1e-9
+
+
+def test_empty_histogram():
+    assert Histogram().snapshot()["mean"] is None
+
+
+def test_round_trips_per_operation(server):
+    server.add_solutions(r"is_state", [{"State": f"state_{i}"} for i in range(3)])
+    instrumentation = PrologInstrumentation()
+    prolog = Prolog(instrumentation=instrumentation)
+    prolog.once("is_state(State)")
+    prolog.all_solutions("is_state(State)")
+    snapshot = instrumentation.snapshot()
+    assert snapshot["operations"]["once"]["round_trips"] == 3
+    # query, one next_solution per solution, the final next_solution and finish
+    assert snapshot["operations"]["all_solutions"]["round_trips"] == 6
+    assert snapshot["operations"]["all_solutions"]["solutions"] == 3
+    assert snapshot["services"]["query"]["round_trip"]["count"] == 2
+    assert snapshot["services"]["query"]["request_bytes"] > 0
+    assert snapshot["decode"]["count"] == 4
+
+
+def test_prometheus_export():
+    instrumentation = PrologInstrumentation(buckets=(0.1,))
+    instrumentation.record_call("query", 0.2, 10, 20)
+    instrumentation.record_call("query", 0.05, 10, 20)
+    lines = instrumentation.to_prometheus(prefix="test").splitlines()
+    assert "# TYPE test_service_round_trip_seconds histogram" in lines
+    assert 'test_service_round_trip_seconds_bucket{service="query",le="0.1"} 1' in lines
+    assert 'test_service_round_trip_seconds_bucket{service="query",le="+Inf"} 2' in lines
+    assert 'test_service_round_trip_seconds_count{service="query"} 2' in lines
+    assert 'test_decode_seconds_count 0' in lines
+    assert 'test_request_bytes_total{service="query"} 20' in lines
+    assert 'test_response_bytes_total{service="query"} 40' in lines
+
+
+def test_rtt_excess_is_relative_to_the_fastest_round_trip():
+    instrumentation = PrologInstrumentation(buckets=(0.01, 0.1))
+    for seconds in (0.05, 0.02, 0.1):
+        instrumentation.record_call("next_solution", seconds, 0, 0)
+    excess = instrumentation.snapshot()["services"]["next_solution"]["rtt_excess"]
+    # 0 for the first call, 0 for the new fastest one, 0.08 for the last one
+    assert excess["buckets"] == {"0.01": 2, "0.1": 3, "+Inf": 3}
+    instrumentation.reset()
+    assert instrumentation.snapshot()["services"] == {}
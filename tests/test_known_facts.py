@@ -0,0 +1,69 @@
+import pytest
+
+from src.neem_interface_python.neem_interface import KnownFacts, NEEMInterface
+
+
+@pytest.fixture
+def projected(server):
+    """
+    Queries of the kb_project calls of add_vr_subaction_with_task
+    """
+    projected = []
+
+    def project(query_str: str):
+        projected.append(query_str)
+        return [{"SubAction": "SubAction_0", "Task": "Task_0", "TimeInterval": "TimeInterval_0"}]
+
+    server.add_solutions(r"^kb_project\(", project)
+    return projected
+
+
+def _add_subaction(neem_interface: NEEMInterface, objects_participated="[Cup:Cup_0]"):
+    return neem_interface.add_vr_subaction_with_task("Action_0", "soma:'Grasping'", "soma:'Grasp'", 1.0, 2.0,
+                                                     objects_participated, "Player_0")
+
+
+def test_unknown_facts_keep_their_order_without_duplicates():
+    known_facts = KnownFacts()
+    known_facts.add(["b"])
+    assert known_facts.unknown(["c", "b", "a", "c"]) == ["c", "a"]
+
+
+def test_facts_are_forgotten_when_the_generation_changes():
+    generation = [0]
+    known_facts = KnownFacts(lambda: generation[0])
+    known_facts.add(["a"])
+    assert known_facts.unknown(["a"]) == []
+    generation[0] += 1
+    assert known_facts.unknown(["a"]) == ["a"]
+
+
+def test_static_facts_are_asserted_once(server, projected):
+    neem_interface = NEEMInterface()
+    _add_subaction(neem_interface)
+    _add_subaction(neem_interface, "[Cup:Cup_0, Bowl:Bowl_0]")
+    assert "has_type('Player_0', dul:'NaturalPerson')" in projected[0]
+    assert "has_type('Player_0', dul:'NaturalPerson')" not in projected[1]
+    assert "subclass_of(soma:'Cup', dul:'PhysicalObject')" not in projected[1]
+    assert "subclass_of(soma:'Bowl', dul:'PhysicalObject')" in projected[1]
+    # Facts about the subaction itself are asserted every time
+    assert all("holds(SubAction, dul:'hasParticipant', soma:'Cup_0')" in query for query in projected)
+
+
+def test_known_facts_belong_to_one_instance(server, projected):
+    _add_subaction(NEEMInterface())
+    _add_subaction(NEEMInterface())
+    assert all("has_type('Player_0', dul:'NaturalPerson')" in query for query in projected)
+
+
+@pytest.mark.parametrize("replace", [
+    lambda neem_interface: neem_interface.load_neem("/tmp/neem"),
+    lambda neem_interface: neem_interface.clear_beliefstate(),
+    lambda neem_interface: NEEMInterface.knowledge_base_replaced(),
+])
+def test_replacing_the_knowledge_base_forgets_known_facts(server, projected, replace):
+    neem_interface = NEEMInterface()
+    _add_subaction(neem_interface)
+    replace(neem_interface)
+    _add_subaction(neem_interface)
+    assert "has_type('Player_0', dul:'NaturalPerson')" in projected[1]
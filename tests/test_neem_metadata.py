@@ -0,0 +1,97 @@
+import pytest
+
+from src.neem_interface_python import neem as neem_module
+from src.neem_interface_python.neem import NEEM
+from src.neem_interface_python.neem_interface import NEEMInterface
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException
+
+
+def _metadata_solution(start_time, end_time):
+    return [{"Action": "Action_0", "StartTime": start_time, "EndTime": end_time, "Subactions": ["Subaction_0"],
+             "Participants": ["Cup_0", "Cup_0"], "Tasks": [["Action_0", "Task_0"], ["Subaction_0", "Task_1"]]}]
+
+
+@pytest.fixture
+def knowrob(server):
+    server.add_solutions(r"is_episode\(Episode\)", [{"Episode": "Episode_0"}])
+    server.add_solutions(r"is_setting_for\('Episode_0', Action\)", _metadata_solution(10.0, 20.0))
+    server.add_solutions(r"^tf_mng_trajectory", [{"Trajectory": []}])
+    return server
+
+
+def _metadata_queries(server) -> int:
+    return sum("is_setting_for('Episode_0', Action)" in query for query in server.received_queries)
+
+
+def _trajectory_query(server) -> str:
+    return [query for query in server.received_queries if query.startswith("tf_mng_trajectory")][-1]
+
+
+def test_metadata_is_parsed(knowrob):
+    metadata = NEEM().metadata
+    assert (metadata.top_level_action, metadata.start_time, metadata.end_time) == ("Action_0", 10.0, 20.0)
+    assert metadata.participants == ["Cup_0"]
+    assert metadata.tasks == {"Action_0": ["Task_0"], "Subaction_0": ["Task_1"]}
+
+
+def test_metadata_without_time_interval(knowrob, monkeypatch):
+    knowrob.add_solutions(r"is_setting_for\('Episode_0', Action\)", _metadata_solution("none", "none"))
+    monkeypatch.setattr(neem_module.time, "time", lambda: 1234.5)
+    neem = NEEM()
+    assert neem.metadata.start_time is None and neem.metadata.end_time is None
+    neem.get_trajectory("Cup_0")
+    assert _trajectory_query(knowrob) == "tf_mng_trajectory('Cup_0', 0.0, 1234.5, Trajectory)"
+
+
+def test_trajectory_of_a_running_episode_ends_now(knowrob, monkeypatch):
+    knowrob.add_solutions(r"is_setting_for\('Episode_0', Action\)", _metadata_solution(10.0, "_G123"))
+    monkeypatch.setattr(neem_module.time, "time", lambda: 1234.5)
+    NEEM().get_trajectory("Cup_0")
+    assert _trajectory_query(knowrob) == "tf_mng_trajectory('Cup_0', 10.0, 1234.5, Trajectory)"
+
+
+def test_trajectory_of_an_ended_episode(knowrob):
+    NEEM().get_trajectory("Cup_0")
+    assert _trajectory_query(knowrob) == "tf_mng_trajectory('Cup_0', 10.0, 20.0, Trajectory)"
+
+
+def test_metadata_is_reused_until_the_knowledge_base_changes(knowrob):
+    neem = NEEM()
+    metadata = neem.metadata
+    neem.get_participants()
+    neem.neem_interface.get_tf_trajectory("Cup_0", 0.0, 1.0)
+    assert metadata.valid and _metadata_queries(knowrob) == 1
+    neem.neem_interface.assert_agent_with_effector("Hand_0", agent_iri="Agent_0")
+    assert not metadata.valid
+    neem.get_subactions()
+    neem.get_subactions()
+    assert _metadata_queries(knowrob) == 2
+
+
+@pytest.mark.parametrize("replace", [
+    lambda neem_interface: neem_interface.load_neem("/tmp/neem"),
+    lambda neem_interface: NEEMInterface.knowledge_base_replaced(),
+    lambda neem_interface: NEEMInterface.knowledge_base_changed(),
+])
+def test_metadata_is_rebuilt_after_the_knowledge_base_changed(knowrob, replace):
+    neem = NEEM()
+    metadata = neem.metadata
+    replace(neem.neem_interface)
+    assert not metadata.valid
+    neem.get_tasks()
+    assert _metadata_queries(knowrob) == 2
+
+
+def test_on_write_is_called_for_mutating_queries(server):
+    server.add_failure(r"tell\(")
+    writes = []
+    prolog = Prolog(on_write=lambda: writes.append(len(server.received_queries)))
+    prolog.ensure_once("kb_call(holds(a, b, X))")
+    prolog.all_solutions("is_action(A)")
+    assert writes == []
+    prolog.ensure_once("kb_project(holds(a, b, c))")
+    prolog.batch(["is_action(a)", "mem_add_subaction_with_task(a, b, c, D)"])
+    with pytest.raises(PrologException):
+        prolog.once("tell(holds(a, b, c))")
+    # Each write is reported after its query has been sent
+    assert writes == [3, 5, 6]
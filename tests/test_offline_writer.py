@@ -0,0 +1,165 @@
+import datetime
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from src.neem_interface_python.offline_writer import OfflineNEEMWriter, encode_document
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+
+
+def _decode_document(data: bytes, offset: int = 0):
+    """
+    Decode one BSON document, independently of the encoder. Return the document and the offset after it.
+    ObjectIds are returned as bytes and datetimes as milliseconds since the epoch.
+    """
+    size, = struct.unpack_from("<i", data, offset)
+    end = offset + size
+    assert data[end - 1] == 0
+    document = {}
+    position = offset + 4
+    while position < end - 1:
+        bson_type = data[position]
+        name_end = data.index(b"\x00", position + 1)
+        name = data[position + 1:name_end].decode("utf-8")
+        position = name_end + 1
+        if bson_type == 0x01:
+            value, = struct.unpack_from("<d", data, position)
+            position += 8
+        elif bson_type == 0x02:
+            length, = struct.unpack_from("<i", data, position)
+            value = data[position + 4:position + 4 + length - 1].decode("utf-8")
+            position += 4 + length
+        elif bson_type in (0x03, 0x04):
+            value, position = _decode_document(data, position)
+            if bson_type == 0x04:
+                value = [value[str(i)] for i in range(len(value))]
+        elif bson_type == 0x07:
+            value = data[position:position + 12]
+            position += 12
+        elif bson_type == 0x08:
+            value = data[position] == 1
+            position += 1
+        elif bson_type == 0x09:
+            value, = struct.unpack_from("<q", data, position)
+            position += 8
+        elif bson_type == 0x0A:
+            value = None
+        elif bson_type == 0x10:
+            value, = struct.unpack_from("<i", data, position)
+            position += 4
+        elif bson_type == 0x12:
+            value, = struct.unpack_from("<q", data, position)
+            position += 8
+        else:
+            raise ValueError(f"Unexpected BSON type {bson_type:#x}")
+        document[name] = value
+    return document, end
+
+
+def _decode_all(path: str):
+    with open(path, "rb") as f:
+        data = f.read()
+    documents = []
+    offset = 0
+    while offset < len(data):
+        document, offset = _decode_document(data, offset)
+        documents.append(document)
+    return documents
+
+
+def _trajectory(n: int, start: float = 1600000000.0, wrenches=False) -> TrajectoryArray:
+    timestamps = start + 0.01 * np.arange(n)
+    positions = np.stack([np.arange(n), 2.0 * np.arange(n), np.zeros(n)], axis=1)
+    quaternions = Rotation.from_euler("z", 0.1 * np.arange(n)[:, None]).as_quat()
+    return TrajectoryArray(timestamps, positions, quaternions, "Cup_0", "map",
+                           np.tile(np.arange(6.0), (n, 1)) if wrenches else None)
+
+
+def test_encode_document_round_trip():
+    document = {"a": 1.5, "b": "text", "c": {"d": [1, 2 ** 40]}, "e": True, "f": None}
+    data = encode_document(document)
+    assert struct.unpack_from("<i", data)[0] == len(data)
+    assert _decode_document(data) == (document, len(data))
+
+
+def test_encode_document_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        encode_document({"a": object()})
+
+
+def test_tf_documents_have_the_layout_of_the_tf_memory(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path))
+    trajectory = _trajectory(5)
+    written = writer.write_tf(trajectory)
+    path = os.path.join(str(tmp_path), "roslog", "tf.bson")
+    assert written == os.path.getsize(path) == writer.bytes_written["tf"]
+    documents = _decode_all(path)
+    assert len(documents) == 5
+    for i, document in enumerate(documents):
+        assert list(document.keys()) == ["_id", "header", "child_frame_id", "transform", "__recorded", "__topic"]
+        assert document["child_frame_id"] == "Cup_0"
+        assert document["header"]["frame_id"] == "map"
+        assert document["header"]["seq"] == i
+        assert document["header"]["stamp"] == round(trajectory.timestamps[i] * 1000)
+        assert document["__recorded"] == document["header"]["stamp"]
+        assert document["__topic"] == "/tf"
+        translation = document["transform"]["translation"]
+        np.testing.assert_array_equal([translation["x"], translation["y"], translation["z"]], trajectory.positions[i])
+        rotation = document["transform"]["rotation"]
+        np.testing.assert_array_equal([rotation["x"], rotation["y"], rotation["z"], rotation["w"]],
+                                      trajectory.quaternions[i])
+    assert len({document["_id"] for document in documents}) == 5
+
+
+def test_object_ids_start_with_the_creation_time(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path))
+    before = int(datetime.datetime.now().timestamp())
+    writer.write_tf(_trajectory(3))
+    after = int(datetime.datetime.now().timestamp())
+    for document in _decode_all(os.path.join(str(tmp_path), "roslog", "tf.bson")):
+        assert before <= struct.unpack(">I", document["_id"][:4])[0] <= after
+
+
+def test_writes_append_and_continue_the_sequence(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path))
+    first = writer.write_tf(_trajectory(3))
+    second = writer.write_tf(_trajectory(4, start=1600000010.0))
+    documents = _decode_all(os.path.join(str(tmp_path), "roslog", "tf.bson"))
+    assert [document["header"]["seq"] for document in documents] == list(range(7))
+    assert len({document["_id"] for document in documents}) == 7
+    assert writer.bytes_written["tf"] == first + second
+
+
+def test_metadata_lists_the_indexes(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path), database="neem_db")
+    writer.write_tf(_trajectory(2))
+    with open(os.path.join(str(tmp_path), "neem_db", "tf.metadata.json")) as f:
+        metadata = json.load(f)
+    assert metadata["collectionName"] == "tf"
+    assert [index["key"] for index in metadata["indexes"]] == [{"_id": 1}, {"child_frame_id": 1}, {"header.stamp": 1}]
+    assert all(index["ns"] == "neem_db.tf" for index in metadata["indexes"])
+
+
+def test_wrench_documents(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path))
+    writer.write_wrenches(_trajectory(3, wrenches=True))
+    documents = _decode_all(os.path.join(str(tmp_path), "roslog", "wrench.bson"))
+    assert len(documents) == 3
+    assert documents[0]["header"]["frame_id"] == "Cup_0"
+    assert documents[0]["wrench"] == {"force": {"x": 0.0, "y": 1.0, "z": 2.0}, "torque": {"x": 3.0, "y": 4.0, "z": 5.0}}
+    assert documents[0]["__topic"] == "/wrench"
+
+
+def test_wrenches_are_required(tmp_path):
+    with pytest.raises(ValueError):
+        OfflineNEEMWriter(str(tmp_path)).write_wrenches(_trajectory(3))
+
+
+def test_empty_trajectories_write_nothing(tmp_path):
+    writer = OfflineNEEMWriter(str(tmp_path))
+    assert writer.write_tf(_trajectory(0)) == 0
+    assert not os.path.exists(os.path.join(str(tmp_path), "roslog", "tf.bson"))
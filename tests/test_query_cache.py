@@ -0,0 +1,62 @@
+import pytest
+
+from src.neem_interface_python.utils.query_cache import QueryCache, is_mutating
+
+
+@pytest.mark.parametrize("query_str", [
+    "tell(holds(a, b, c))",
+    "knowrob_load_neem('neem_id')",
+    "delete_directory_and_contents('/tmp/checkpoints')",
+    "kb_project(holds(a, b, c))",
+    "mng_remove(DB, Collection, [])",
+])
+def test_mutating_queries(query_str):
+    assert is_mutating(query_str)
+
+
+@pytest.mark.parametrize("query_str", [
+    "kb_call(holds(a, b, X))",
+    "is_told(X)",
+    "Goal = 'tell'",
+    "tf_mng_trajectory(a)",
+])
+def test_read_only_queries(query_str):
+    assert not is_mutating(query_str)
+
+
+def test_expired_results_are_not_returned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.neem_interface_python.utils.query_cache.time.monotonic", lambda: now[0])
+    cache = QueryCache(ttl=10.0)
+    cache.put("once", "is_state(State)", {"State": "state_0"})
+    now[0] += 9.9
+    assert cache.get("once", "is_state(State)") == {"State": "state_0"}
+    now[0] += 0.2
+    assert cache.get("once", "is_state(State)") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_result_is_evicted():
+    cache = QueryCache(max_size=2, ttl=None)
+    cache.put("once", "a(X)", 1)
+    cache.put("once", "b(X)", 2)
+    assert cache.get("once", "a(X)") == 1
+    cache.put("once", "c(X)", 3)
+    assert cache.get("once", "b(X)") is None
+    assert cache.get("once", "a(X)") == 1 and cache.get("once", "c(X)") == 3
+    assert cache.evictions == 1
+
+
+def test_results_of_invalidated_generation_are_dropped():
+    cache = QueryCache()
+    generation = cache.generation()
+    cache.invalidate()
+    cache.put("once", "a(X)", 1, generation)
+    assert cache.get("once", "a(X)") is None
+
+
+def test_cached_values_are_copies():
+    cache = QueryCache()
+    cache.put("all_solutions", "a(X)", [{"X": 1}])
+    cache.get("all_solutions", "a(X)").append({"X": 2})
+    assert cache.get("all_solutions", "a(X)") == [{"X": 1}]
@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException, QueryRegistry, new_query_id
+
+
+class _Query:
+    def __init__(self, query_id: str):
+        self.query_id = query_id
+        self.finished = False
+
+    def get_id(self) -> str:
+        return self.query_id
+
+    def finish(self):
+        self.finished = True
+
+
+def test_query_ids_are_unique_across_threads():
+    ids = []
+    lock = threading.Lock()
+
+    def draw():
+        drawn = [new_query_id() for _ in range(1000)]
+        with lock:
+            ids.extend(drawn)
+
+    threads = [threading.Thread(target=draw) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == len(ids) == 16000
+
+
+def test_registry_rejects_ids_in_use():
+    registry = QueryRegistry()
+    query = _Query("q1")
+    registry.register(query)
+    with pytest.raises(PrologException):
+        registry.register(_Query("q1"))
+    assert registry.get("q1") is query
+    registry.finish_all()
+    assert query.finished
+    registry.unregister("q1")
+    assert len(registry) == 0 and registry.ids() == []
+
+
+def test_concurrent_queries_on_one_client(server):
+    server.latency = 0.002
+    server.add_solutions(r"is_state", lambda query_str: [{"State": query_str[9:-8]}])
+    prolog = Prolog()
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        solutions = list(executor.map(lambda i: prolog.ensure_once(f"is_state({i}, State)"), range(500)))
+    assert [solution["State"] for solution in solutions] == [str(i) for i in range(500)]
+    assert len(prolog.live_queries) == 0
+    assert server.open_queries == []
@@ -0,0 +1,94 @@
+import pytest
+
+from src.neem_interface_python.utils import rosbridge
+from src.neem_interface_python.utils.rosbridge import RosbridgeConnection, RosbridgeConnectionPool
+
+
+class FakeRos:
+    """
+    Stands in for roslibpy.Ros and records every websocket that is opened
+    """
+    instances = []
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.is_connected = False
+        self.closed = False
+        FakeRos.instances.append(self)
+
+    def run(self, timeout=None):
+        self.is_connected = True
+
+    def close(self):
+        self.closed = True
+        self.is_connected = False
+
+
+class FakeService:
+    def __init__(self, ros, name, service_type):
+        self.ros = ros
+        self.name = name
+
+
+@pytest.fixture
+def fake_ros(monkeypatch):
+    FakeRos.instances = []
+    monkeypatch.setattr(rosbridge.roslibpy, "Ros", FakeRos)
+    monkeypatch.setattr(rosbridge.roslibpy, "Service", FakeService)
+    return FakeRos.instances
+
+
+def test_connection_is_opened_on_first_use(fake_ros):
+    connection = RosbridgeConnection("robot", 9091)
+    assert fake_ros == [] and not connection.is_connected
+    srv = connection.service("/rosprolog/query", "json_prolog_msgs/PrologQuery")
+    assert len(fake_ros) == 1 and (fake_ros[0].host, fake_ros[0].port) == ("robot", 9091)
+    assert connection.service("/rosprolog/query", "json_prolog_msgs/PrologQuery") is srv
+    assert len(fake_ros) == 1
+
+
+def test_dropped_connection_is_reopened(fake_ros):
+    connection = RosbridgeConnection("robot", connect_timeout=0.1)
+    srv = connection.service("/rosprolog/query", "json_prolog_msgs/PrologQuery")
+    fake_ros[0].is_connected = False
+    new_srv = connection.service("/rosprolog/query", "json_prolog_msgs/PrologQuery")
+    assert len(fake_ros) == 2 and fake_ros[0].closed
+    assert new_srv is not srv and new_srv.ros is fake_ros[1]
+
+
+def test_round_robin_hands_out_connections_in_turn(fake_ros):
+    pool = RosbridgeConnectionPool([("a", 1), ("b", 2)], size=3)
+    assert [(c.host, c.port) for c in pool.connections] == [("a", 1), ("b", 2), ("a", 1)]
+    assert [pool.acquire() for _ in range(4)] == pool.connections + pool.connections[:1]
+    assert fake_ros == []
+
+
+def test_least_loaded_hands_out_connection_with_fewest_leases(fake_ros):
+    pool = RosbridgeConnectionPool([("a", 1)], size=3, strategy="least_loaded")
+    first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+    assert len({id(first), id(second), id(third)}) == 3
+    pool.release(second)
+    assert pool.acquire() is second
+    assert [c.leases for c in pool.connections] == [1, 1, 1]
+
+
+def test_invalid_pool_configuration(fake_ros):
+    with pytest.raises(ValueError):
+        RosbridgeConnectionPool([("a", 1)], strategy="random")
+    with pytest.raises(ValueError):
+        RosbridgeConnectionPool([("a", 1)], size=0)
+
+
+def test_default_pool_is_created_lazily(fake_ros, monkeypatch):
+    monkeypatch.setenv("ROS_MASTER_URI", "http://robot:11311")
+    monkeypatch.setenv("ROSBRIDGE_PORT", "9092")
+    rosbridge.set_connection_pool(None)
+    try:
+        pool = rosbridge.get_connection_pool()
+        assert rosbridge.get_connection_pool() is pool
+        assert pool.endpoints == [("robot", 9092)]
+        assert fake_ros == []
+        assert rosbridge.ros_client is fake_ros[0]
+    finally:
+        rosbridge.set_connection_pool(None)
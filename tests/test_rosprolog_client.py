@@ -0,0 +1,93 @@
+import time
+from concurrent import futures
+
+import pytest
+
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException
+from src.neem_interface_python.utils.query_cache import QueryCache
+
+
+@pytest.mark.parametrize("prefetch", [1, 2, 4, 16])
+def test_all_solutions_with_out_of_order_replies(out_of_order_server, prefetch):
+    out_of_order_server.add_solutions(r"is_state", [{"State": f"state_{i}"} for i in range(3)])
+    solutions = Prolog(prefetch=prefetch, unordered=prefetch > 1).all_solutions("is_state(State)")
+    assert sorted(solution["State"] for solution in solutions) == ["state_0", "state_1", "state_2"]
+    assert out_of_order_server.open_queries == []
+
+
+def test_all_solutions_in_order(server):
+    server.add_solutions(r"is_state", [{"State": f"state_{i}"} for i in range(10)])
+    solutions = Prolog(prefetch=1).all_solutions("is_state(State)")
+    assert [solution["State"] for solution in solutions] == [f"state_{i}" for i in range(10)]
+    assert server.open_queries == []
+
+
+def test_all_solutions_of_failing_query(server):
+    server.add_solutions(r"is_state", [])
+    assert Prolog(prefetch=4, unordered=True).all_solutions("is_state(State)") == []
+    with pytest.raises(PrologException):
+        Prolog().ensure_all_solutions("is_state(State)")
+
+
+def test_once_fused_finishes_query(server):
+    server.add_solutions(r"is_action", [{"Action": "action_0"}, {"Action": "action_1"}])
+    prolog = Prolog(fused_once=True)
+    assert prolog.once("is_action(Action)") == {"Action": "action_0"}
+    prolog.finish_all()
+    assert len(prolog.live_queries) == 0
+    assert server.open_queries == []
+
+
+def test_once_fused_is_opt_in(server):
+    prolog = Prolog()
+    prolog.once("is_action(Action)")
+    assert server.calls["finish"] == 1
+    assert server.received_queries == ["is_action(Action)"]
+
+
+def test_batch_keeps_query_order_and_reports_failures(out_of_order_server):
+    out_of_order_server.add_solutions(r"is_state", lambda query_str: [{"State": query_str[9:-8]}])
+    out_of_order_server.add_solutions(r"is_state\(broken", [])
+    out_of_order_server.add_failure(r"syntax_error")
+    query_strs = [f"is_state({i}, State)" for i in range(5)] + ["is_state(broken, State)", "syntax_error("]
+    results = Prolog().batch(query_strs, max_in_flight=3)
+    assert [result.query_str for result in results] == query_strs
+    assert [result.solution for result in results[:5]] == [{"State": str(i)} for i in range(5)]
+    assert results[5].ok and results[5].solution is None
+    assert isinstance(results[6].error, PrologException)
+    assert out_of_order_server.open_queries == []
+
+
+def test_batch_finishes_queries_which_start_after_the_timeout(server):
+    server.latency = 0.2
+    results = Prolog().batch(["is_state(State)"] * 3, timeout=0.01)
+    assert all(isinstance(result.error, futures.TimeoutError) for result in results)
+    time.sleep(0.6)
+    assert server.open_queries == []
+
+
+def test_cache_answers_repeated_queries(server):
+    server.add_solutions(r"is_state", [{"State": "state_0"}])
+    prolog = Prolog(cache=QueryCache())
+    assert prolog.once("is_state(State)") == prolog.once("is_state( State )") == {"State": "state_0"}
+    assert prolog.batch(["is_state(State)"])[0].solution == {"State": "state_0"}
+    assert server.received_queries == ["is_state(State)"]
+
+
+def test_mutating_queries_invalidate_the_cache(server):
+    server.add_solutions(r"is_state", [{"State": "state_0"}])
+    prolog = Prolog(cache=QueryCache())
+    prolog.once("is_state(State)")
+    server.add_solutions(r"is_state", [{"State": "state_1"}])
+    assert prolog.once("is_state(State)") == {"State": "state_0"}
+    prolog.once("kb_project(holds(a, b, c))")
+    assert prolog.once("is_state(State)") == {"State": "state_1"}
+    prolog.batch(["tf_set_pose(a, b, c)"])
+    assert prolog.all_solutions("is_state(State)") == [{"State": "state_1"}]
+    assert server.received_queries.count("is_state(State)") == 3
+
+
+def test_prefetch_requires_unordered(server):
+    with pytest.raises(ValueError):
+        Prolog(prefetch=4)
+    Prolog(prefetch=4, unordered=True)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+from src.neem_interface_python.utils.utils import Datapoint
+
+
+def _tf_message(stamp: str, rotation) -> dict:
+    x, y, z, w = rotation
+    return {"child_frame_id": "Cup_0", "header": {"frame_id": "world", "stamp": {"$date": stamp}},
+            "transform": {"translation": {"x": 1.0, "y": 2.0, "z": 3.0}, "rotation": {"x": x, "y": y, "z": z, "w": w}}}
+
+
+def test_from_tf_messages_normalizes_quaternions():
+    messages = [_tf_message("2021-05-03T12:34:56.000Z", (0.1, 0.2, 0.3, 0.9)),
+                _tf_message("2021-05-03T12:34:57.000Z", (0.0, 0.0, 0.0, 2.0))]
+    trajectory = TrajectoryArray.from_tf_messages(messages)
+    np.testing.assert_allclose(np.linalg.norm(trajectory.quaternions, axis=1), 1.0)
+    np.testing.assert_allclose(trajectory.quaternions[0], Datapoint.from_tf(messages[0]).ori.as_quat())
+
+
+def test_from_unreal_normalizes_quaternions():
+    trajectory = TrajectoryArray.from_unreal([0.0], "Cup_0", "world", [[1.0, 2.0, 3.0]], [[0.1, 0.2, 0.3, 0.9]])
+    np.testing.assert_allclose(trajectory.quaternions[0], [-0.1026, 0.2052, -0.3078, 0.9234], atol=1e-4)
+
+
+def _wrench_term(t: float, wrench) -> dict:
+    return {"term": ["-", t, wrench]}
+
+
+def test_from_prolog_wrenches():
+    trajectory = TrajectoryArray.from_prolog_wrenches(
+        [_wrench_term(1.0, ["Hand_0", [1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]),
+         _wrench_term(2.0, ["Hand_0", [0, 0, -9.81], [0.5, 0, 0]])], frame="Hand_0")
+    np.testing.assert_array_equal(trajectory.timestamps, [1.0, 2.0])
+    np.testing.assert_array_equal(trajectory.wrenches, [[1.0, 2.0, 3.0, 4.0, 5.0, 6.0], [0, 0, -9.81, 0.5, 0, 0]])
+    assert np.isnan(trajectory.positions).all() and np.isnan(trajectory.quaternions).all()
+    assert (trajectory.frame, trajectory.reference_frame) == ("Hand_0", "Hand_0")
+    assert TrajectoryArray.from_prolog_wrenches([]).wrenches.shape == (0, 6)
+
+
+@pytest.mark.parametrize("wrench", [
+    [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]],
+    ["Hand_0", [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]],
+    ["Hand_0", [1.0, 2.0, 3.0], [4.0, 5.0]],
+    ["Hand_0", [1.0, 2.0, 3.0], [4.0, 5.0, "x"]],
+])
+def test_from_prolog_wrenches_rejects_other_terms(wrench):
+    with pytest.raises(ValueError):
+        TrajectoryArray.from_prolog_wrenches([_wrench_term(1.0, wrench)])
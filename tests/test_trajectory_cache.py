@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from src.neem_interface_python.neem_interface import NEEMInterface
+from src.neem_interface_python.utils.trajectory import TrajectoryArray
+from src.neem_interface_python.utils.trajectory_cache import TrajectoryCache, slerp
+
+
+class _Recording:
+    """
+    Samples at the given times, at x = time, rotating about z by 0.1 rad per second
+    """
+
+    def __init__(self, timestamps):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.fetched = []
+
+    def __call__(self, obj: str, start: float, end: float) -> TrajectoryArray:
+        self.fetched.append((start, end))
+        selected = self.timestamps[(self.timestamps >= start) & (self.timestamps <= end)]
+        positions = np.stack([selected, np.zeros(len(selected)), np.zeros(len(selected))], axis=1)
+        quaternions = Rotation.from_euler("z", 0.1 * selected[:, None]).as_quat()
+        return TrajectoryArray(selected, positions, quaternions, obj, "map")
+
+
+def test_latest_sample_at_or_before_the_time_by_default():
+    cache = TrajectoryCache(_Recording(np.arange(0.0, 30.0, 1.0)), window=10.0)
+    poses = cache.poses_at("Cup_0", [1.5, 2.0, 10.2, 29.9])
+    np.testing.assert_array_equal(poses.timestamps, [1.5, 2.0, 10.2, 29.9])
+    np.testing.assert_array_equal(poses.positions[:, 0], [1.0, 2.0, 10.0, 29.0])
+    np.testing.assert_allclose(Rotation.from_quat(poses.quaternions).as_euler("xyz")[:, 2], [0.1, 0.2, 1.0, 2.9])
+    assert poses.reference_frame == "map"
+
+
+def test_preceding_sample_in_the_window_before():
+    recording = _Recording([0.0, 5.0, 9.5])
+    cache = TrajectoryCache(recording, window=10.0)
+    reference_frame, position, _ = cache.pose_at("Cup_0", 12.0)
+    assert reference_frame == "map" and position[0] == 9.5
+    # Nothing after the time has to be fetched
+    assert recording.fetched == [(10.0, 20.0), (0.0, 10.0)]
+
+
+def test_unanswerable_times_are_nan():
+    cache = TrajectoryCache(_Recording([5.0, 6.0, 35.0]), window=10.0)
+    poses = cache.poses_at("Cup_0", [4.0, 25.0, 5.5])
+    assert np.isnan(poses.timestamps[0]) and np.isnan(poses.positions[0]).all()
+    # The gap between 6 s and 35 s is longer than a window
+    assert np.isnan(poses.timestamps[1])
+    assert poses.positions[2, 0] == 5.0
+    assert cache.pose_at("Cup_0", 4.0) is None
+
+
+def test_interpolation_is_opt_in():
+    cache = TrajectoryCache(_Recording(np.arange(0.0, 30.0, 1.0)), window=10.0, interpolate=True)
+    poses = cache.poses_at("Cup_0", [1.5, 9.75, 29.5])
+    np.testing.assert_allclose(poses.positions[:2, 0], [1.5, 9.75])
+    np.testing.assert_allclose(Rotation.from_quat(poses.quaternions[:2]).as_euler("xyz")[:, 2], [0.15, 0.975])
+    # After the last sample, there is nothing to interpolate towards
+    assert np.isnan(poses.timestamps[2])
+
+
+def test_slerp_takes_the_shorter_arc():
+    q0 = Rotation.from_euler("z", [[170.0]], degrees=True).as_quat()
+    q1 = -Rotation.from_euler("z", [[-170.0]], degrees=True).as_quat()
+    halfway = Rotation.from_quat(slerp(q0, q1, np.array([0.5])))
+    assert abs(abs(halfway.as_euler("xyz", degrees=True)[0, 2]) - 180.0) < 1e-6
+
+
+def test_samples_stay_below_max_samples():
+    recording = _Recording(np.arange(0.0, 100.0, 0.5))
+    cache = TrajectoryCache(recording, window=10.0, max_samples=50)
+    for t in np.arange(5.0, 100.0, 10.0):
+        cache.poses_at("Cup_0", [t])
+        assert cache.samples <= 50
+    assert cache.evictions == 8
+    assert cache.stats()["windows"] == 2
+
+
+def test_least_recently_used_windows_are_evicted_first():
+    recording = _Recording(np.arange(0.0, 100.0, 0.5))
+    cache = TrajectoryCache(recording, window=10.0, max_samples=40)
+    cache.poses_at("Cup_0", [5.0])
+    cache.poses_at("Cup_0", [15.0])
+    cache.poses_at("Cup_0", [5.5])
+    cache.poses_at("Cup_0", [25.0])
+    recording.fetched.clear()
+    cache.poses_at("Cup_0", [6.0, 26.0])
+    assert recording.fetched == []
+    cache.poses_at("Cup_0", [16.0])
+    assert recording.fetched == [(10.0, 20.0)]
+
+
+def test_window_larger_than_max_samples_is_used_but_not_kept():
+    cache = TrajectoryCache(_Recording(np.arange(0.0, 10.0, 0.1)), window=10.0, max_samples=10)
+    assert cache.pose_at("Cup_0", 5.05)[1][0] == pytest.approx(5.0)
+    assert cache.samples == 0
+
+
+@pytest.fixture
+def knowrob(server):
+    recording = _Recording(np.arange(1000.0, 1030.0, 1.0))
+
+    def trajectory(query_str: str):
+        start, end = map(float, query_str.split(", ")[1:3])
+        poses = recording("Cup_0", start, end)
+        return [{"Trajectory": [{"term": ["-", t, ["map", pos, quat]]} for t, pos, quat in
+                                zip(poses.timestamps.tolist(), poses.positions.tolist(), poses.quaternions.tolist())]}]
+
+    server.add_solutions(r"^tf_mng_trajectory", trajectory)
+    server.add_solutions(r"^mem_tf_get", [{"Pose": ["map", [-1.0, 0.0, 0.0], [0.0, 0.0, 0.0, 1.0]]}])
+    return server
+
+
+def test_get_object_pose_matches_mem_tf_get(knowrob):
+    neem_interface = NEEMInterface()
+    neem_interface.enable_trajectory_cache(window=10.0)
+    assert neem_interface.get_object_pose("Cup_0", 1012.7).pos[0] == 1012.0
+    # Before the first sample, the cache falls back to mem_tf_get
+    assert neem_interface.get_object_pose("Cup_0", 990.0).pos[0] == -1.0
+    poses = neem_interface.get_object_poses("Cup_0", [1001.5, 990.0])
+    np.testing.assert_array_equal(poses.positions[:, 0], [1001.0, -1.0])
+
+
+def test_trajectory_cache_is_cleared_when_the_knowledge_base_changes(knowrob):
+    neem_interface = NEEMInterface()
+    cache = neem_interface.enable_trajectory_cache(window=10.0)
+    neem_interface.get_object_pose("Cup_0", 1012.7)
+    assert cache.samples > 0
+    neem_interface.prolog.ensure_once("kb_project(holds(a, b, c))")
+    neem_interface.get_object_pose("Cup_0", 1001.5)
+    assert cache.stats()["windows"] == 1
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+from scipy.spatial.transform import Rotation
+
+from src.neem_interface_python.neem_interface import NEEMInterface, TrajectoryInsertionError
+from src.neem_interface_python.utils.utils import Pose
+
+_ROW_TIME = re.compile(r"\[([\d.]+),[\d.]+,'Cup_0'")
+
+
+@pytest.fixture
+def inserted(server):
+    """
+    Start times of the poses inserted by the server. Poses with a start time of 3 fail, those at 7 raise an error.
+    """
+    inserted = []
+
+    def insert(query_str: str):
+        statuses = []
+        for start_time in map(float, _ROW_TIME.findall(query_str)):
+            status = {3.0: "false", 7.0: "error"}.get(start_time, "true")
+            if status == "true":
+                inserted.append(start_time)
+            statuses.append(status)
+        return [{"Statuses": statuses}]
+
+    server.add_solutions(r"findall\(Status", insert)
+    return inserted
+
+
+def _poses(n: int):
+    return [Pose("world", [float(i), 0.0, 0.0], Rotation.identity()) for i in range(n)]
+
+
+def test_failing_poses_are_reported_by_index(server, inserted):
+    times = [float(i) for i in range(10)]
+    with pytest.raises(TrajectoryInsertionError) as error:
+        NEEMInterface().assert_object_trajectory("Cup_0", _poses(10), times, times, batch_size=4)
+    assert sorted(error.value.errors) == [3, 7]
+    # Poses of failing batches are not inserted a second time
+    assert sorted(inserted) == [t for t in times if t not in (3.0, 7.0)]
+    assert all(query.startswith("tf_logger_enable") and query.endswith("tf_logger_disable")
+               for query in server.received_queries[1:])
+
+
+def test_rejected_batch_reports_all_of_its_poses(server, inserted):
+    server.add_failure(r"\[4\.0,4\.0,'Cup_0'")
+    times = [float(i) for i in range(10)]
+    insertion = NEEMInterface().assert_object_trajectory("Cup_0", _poses(10), times, times, batch_size=4,
+                                                         insert_last_pose_synchronously=False)
+    with pytest.raises(TrajectoryInsertionError) as error:
+        insertion.wait(timeout=5)
+    assert sorted(error.value.errors) == [3, 4, 5, 6, 7]
+    assert insertion.inserted == 5
+
+
+def test_error_of_the_pose_iterator_is_raised_after_the_batches(server, inserted):
+    def poses():
+        yield from _poses(4)
+        raise RuntimeError("Lost the tracker")
+
+    times = [float(i) for i in range(10, 20)]
+    insertion = NEEMInterface().assert_object_trajectory("Cup_0", poses(), times, times, batch_size=2,
+                                                         insert_last_pose_synchronously=False)
+    with pytest.raises(RuntimeError):
+        insertion.wait(timeout=5)
+    assert insertion.inserted == 4
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.neem_interface_python.neem_interface import NEEMInterface
+
+
+def _bounds(query_str: str):
+    return tuple(map(float, query_str.split(", ")[1:3]))
+
+
+@pytest.fixture
+def knowrob(server):
+    """
+    One sample per second at x = time, and one wrench per second with fx = time
+    """
+    def tf_trajectory(query_str: str):
+        start, end = _bounds(query_str)
+        return [{"Trajectory": [{"term": ["-", t, ["map", [t, 0.0, 0.0], [0.0, 0.0, 0.0, 1.0]]]}
+                                for t in np.arange(np.ceil(start), end + 0.5, 1.0).tolist() if t <= end]}]
+
+    def wrench_trajectory(query_str: str):
+        start, end = _bounds(query_str)
+        return [{"Trajectory": [{"term": ["-", t, ["Hand_0", [t, 0.0, 0.0], [0.0, 0.0, 0.0]]]}
+                                for t in np.arange(np.ceil(start), end + 0.5, 1.0).tolist() if t <= end]}]
+
+    server.add_solutions(r"^tf_mng_trajectory", tf_trajectory)
+    server.add_solutions(r"^wrench_mng_trajectory", wrench_trajectory)
+    return server
+
+
+def _fetched(server, predicate: str):
+    return [_bounds(query) for query in server.received_queries if query.startswith(predicate)]
+
+
+def test_tf_windows_are_yielded_in_order_without_duplicates(knowrob):
+    chunks = list(NEEMInterface().iter_tf_trajectory("Cup_0", 0.0, 25.0, window=10.0))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 6]
+    timestamps = np.concatenate([chunk.timestamps for chunk in chunks])
+    np.testing.assert_array_equal(timestamps, np.arange(0.0, 26.0))
+    np.testing.assert_array_equal(chunks[1].positions[:, 0], np.arange(10.0, 20.0))
+    assert all(chunk.frame == "Cup_0" and chunk.reference_frame == "map" for chunk in chunks)
+    assert _fetched(knowrob, "tf_mng_trajectory") == [(0.0, 10.0), (10.0, 20.0), (20.0, 25.0)]
+
+
+def test_wrench_windows(knowrob):
+    chunks = list(NEEMInterface().iter_wrench_trajectory("Hand_0", 0.0, 20.0, window=10.0))
+    assert [len(chunk) for chunk in chunks] == [10, 11]
+    np.testing.assert_array_equal(np.concatenate([chunk.wrenches[:, 0] for chunk in chunks]), np.arange(0.0, 21.0))
+    assert np.isnan(chunks[0].positions).all()
+
+
+def test_window_longer_than_the_range(knowrob):
+    chunks = list(NEEMInterface().iter_tf_trajectory("Cup_0", 3.0, 5.0, window=10.0))
+    assert len(chunks) == 1
+    np.testing.assert_array_equal(chunks[0].timestamps, [3.0, 4.0, 5.0])
+
+
+@pytest.mark.parametrize("window", [0.0, -1.0])
+def test_window_must_be_positive(knowrob, window):
+    with pytest.raises(ValueError):
+        NEEMInterface().iter_tf_trajectory("Cup_0", 0.0, 10.0, window=window)
+
+
+def test_next_window_is_prefetched(knowrob):
+    chunks = NEEMInterface().iter_tf_trajectory("Cup_0", 0.0, 30.0, window=10.0)
+    next(chunks)
+    deadline = time.monotonic() + 5
+    while len(_fetched(knowrob, "tf_mng_trajectory")) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Only the window after the one being processed is fetched ahead
+    time.sleep(0.05)
+    assert _fetched(knowrob, "tf_mng_trajectory") == [(0.0, 10.0), (10.0, 20.0)]
+    chunks.close()
+
+
+def test_prefetching_does_not_wait_for_the_pool_executor(knowrob):
+    neem_interface = NEEMInterface()
+    release = threading.Event()
+    busy = [neem_interface.pool_executor.submit(release.wait) for _ in range(neem_interface.max_workers)]
+    try:
+        chunks = neem_interface.iter_tf_trajectory("Cup_0", 0.0, 20.0, window=10.0)
+        assert [len(chunk) for chunk in chunks] == [10, 11]
+    finally:
+        release.set()
+    assert all(future.result() for future in busy)
+
+
+def test_closing_the_iterator_cancels_the_remaining_windows(knowrob):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_trajectory(query_str: str):
+        if _bounds(query_str)[0] > 0.0:
+            started.set()
+            release.wait(5)
+        return [{"Trajectory": []}]
+
+    knowrob.add_solutions(r"^tf_mng_trajectory", slow_trajectory)
+    chunks = NEEMInterface().iter_tf_trajectory("Cup_0", 0.0, 40.0, window=10.0)
+    next(chunks)
+    assert started.wait(5)
+    chunks.close()
+    release.set()
+    time.sleep(0.05)
+    assert _fetched(knowrob, "tf_mng_trajectory") == [(0.0, 10.0), (10.0, 20.0)]
@@ -0,0 +1,116 @@
+import pytest
+
+from src.neem_interface_python.neem_interface import NEEMInterface, NEEMError
+from src.neem_interface_python.utils.triple_store import TripleStore
+
+DUL = "http://www.ontologydesignpatterns.org/ont/dul/DUL.owl#"
+SOMA = "http://www.ease-crc.org/ont/SOMA.owl#"
+HAS_PARTICIPANT = f"{DUL}hasParticipant"
+HAS_REGION = f"{DUL}hasRegion"
+HAS_DATA_VALUE = f"{DUL}hasDataValue"
+
+TRIPLES = [
+    [f"{SOMA}Grasping_0", HAS_PARTICIPANT, f"{SOMA}Cup_0"],
+    [f"{SOMA}Grasping_0", HAS_PARTICIPANT, f"{SOMA}Hand_0"],
+    [f"{SOMA}Pouring_0", HAS_PARTICIPANT, f"{SOMA}Cup_0"],
+    [f"{SOMA}Cup_0", HAS_REGION, f"{SOMA}Color_0"],
+    [f"{SOMA}Color_0", HAS_DATA_VALUE, [0.1, 0.2, 0.3]],
+]
+
+
+@pytest.fixture
+def store() -> TripleStore:
+    store = TripleStore({"dul": DUL, "soma": SOMA}, [HAS_PARTICIPANT, HAS_DATA_VALUE])
+    for triple in TRIPLES:
+        store.add(*triple)
+    return store
+
+
+def test_spo_index(store):
+    assert sorted(store.objects(f"{SOMA}Grasping_0", HAS_PARTICIPANT)) == [f"{SOMA}Cup_0", f"{SOMA}Hand_0"]
+    assert sorted(store.predicate_objects("soma:'Grasping_0'")) == [(HAS_PARTICIPANT, f"{SOMA}Cup_0"),
+                                                                     (HAS_PARTICIPANT, f"{SOMA}Hand_0")]
+    assert (f"{SOMA}Pouring_0", "dul:hasParticipant", "soma:Cup_0") in store
+
+
+def test_pos_index(store):
+    assert sorted(store.subjects("dul:'hasParticipant'", f"{SOMA}Cup_0")) == [f"{SOMA}Grasping_0",
+                                                                              f"{SOMA}Pouring_0"]
+    assert sorted(store.triples(predicate=HAS_REGION)) == [(f"{SOMA}Cup_0", HAS_REGION, f"{SOMA}Color_0")]
+
+
+def test_osp_index(store):
+    assert store.predicates(f"{SOMA}Cup_0", f"{SOMA}Color_0") == [HAS_REGION]
+    assert sorted(store.subject_predicates(f"{SOMA}Cup_0")) == [(f"{SOMA}Grasping_0", HAS_PARTICIPANT),
+                                                                (f"{SOMA}Pouring_0", HAS_PARTICIPANT)]
+
+
+def test_duplicates_and_unknown_terms(store):
+    assert not store.add(*TRIPLES[0])
+    assert len(store) == len(TRIPLES)
+    assert store.objects(f"{SOMA}Unknown_0", HAS_PARTICIPANT) == []
+    assert list(store.triples(subject=f"{SOMA}Unknown_0")) == []
+
+
+def test_compound_literals_are_returned_as_lists(store):
+    assert store.objects(f"{SOMA}Color_0", HAS_DATA_VALUE) == [[0.1, 0.2, 0.3]]
+    store.objects(f"{SOMA}Color_0", HAS_DATA_VALUE)[0].append(0.4)
+    assert store.objects(f"{SOMA}Color_0", HAS_DATA_VALUE) == [[0.1, 0.2, 0.3]]
+    assert store.subjects(HAS_DATA_VALUE, [0.1, 0.2, 0.3]) == [f"{SOMA}Color_0"]
+
+
+def test_complete_predicates(store):
+    assert store.complete("dul:hasParticipant")
+    assert not store.complete(HAS_REGION)
+
+
+@pytest.fixture
+def knowrob(server):
+    server.add_solutions(r"findall\(\[S, P, O\]", [{"Prefixes": [["dul", DUL], ["soma", SOMA]], "Triples": TRIPLES,
+                                                    "CompletePredicates": [HAS_PARTICIPANT, HAS_DATA_VALUE]}])
+    server.add_solutions(r"holds\('[^']*', '[^']*', X\)", [{"X": f"{SOMA}Color_0"}, {"X": f"{SOMA}Color_1"}])
+    return server
+
+
+def _snapshots(server) -> int:
+    return sum("findall([S, P, O]" in query for query in server.received_queries)
+
+
+def _live_lookups(server) -> int:
+    return sum(", X))" in query for query in server.received_queries)
+
+
+def test_snapshot_answers_lookups_without_round_trips(knowrob):
+    neem_interface = NEEMInterface()
+    neem_interface.enable_triple_snapshot()
+    knowrob.reset_stats()
+    assert sorted(neem_interface.get_triple_objects(f"{SOMA}Grasping_0", HAS_PARTICIPANT)) == [f"{SOMA}Cup_0",
+                                                                                                f"{SOMA}Hand_0"]
+    assert neem_interface.get_triple_objects(f"{SOMA}Color_0", HAS_DATA_VALUE) == [[0.1, 0.2, 0.3]]
+    assert len(neem_interface.get_triple_subject_predicates(f"{SOMA}Cup_0")) == 2
+    with pytest.raises(NEEMError):
+        neem_interface.get_triple_predicate_objects(f"{SOMA}Unknown_0")
+    assert knowrob.service_calls == 0
+
+
+def test_predicates_with_inferences_are_queried_live(knowrob):
+    neem_interface = NEEMInterface()
+    neem_interface.enable_triple_snapshot()
+    objects = neem_interface.get_triple_objects(f"{SOMA}Cup_0", HAS_REGION)
+    assert sorted(objects) == [f"{SOMA}Color_0", f"{SOMA}Color_1"]
+    assert _live_lookups(knowrob) == 1
+
+
+def test_snapshot_is_taken_again_after_the_knowledge_base_changed(knowrob):
+    neem_interface = NEEMInterface()
+    neem_interface.enable_triple_snapshot()
+    neem_interface.get_triple_objects(f"{SOMA}Grasping_0", HAS_PARTICIPANT)
+    assert _snapshots(knowrob) == 1
+    neem_interface.assert_agent_with_effector("Hand_0", agent_iri="Agent_0")
+    neem_interface.get_triple_objects(f"{SOMA}Grasping_0", HAS_PARTICIPANT)
+    assert _snapshots(knowrob) == 2
+    NEEMInterface.knowledge_base_replaced()
+    neem_interface.get_triple_subjects(HAS_PARTICIPANT, f"{SOMA}Cup_0")
+    neem_interface.get_triple_subjects(HAS_PARTICIPANT, f"{SOMA}Cup_0")
+    assert _snapshots(knowrob) == 3
+    assert _live_lookups(knowrob) == 0
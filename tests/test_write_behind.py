@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+from src.neem_interface_python.rosprolog_client import Prolog, PrologException, PrologQueryRejected
+from src.neem_interface_python.utils.write_behind import WriteBehindQueue
+
+_GOAL = re.compile(r"catch\(\(\\\+ \\\+ \((.*?)\n\) -> (WriteBehindStatus\d+)", re.DOTALL)
+
+
+@pytest.fixture
+def executed(server):
+    """
+    Goals executed by the server, in order. Goals containing 'fail' fail.
+    """
+    executed = []
+
+    def execute(query_str: str):
+        solution = {}
+        for goal, status in _GOAL.findall(query_str):
+            executed.append(goal)
+            solution[status] = "false" if "fail" in goal else "true"
+        return [solution]
+
+    server.add_solutions(r"WriteBehindStatus", execute)
+    return executed
+
+
+def test_goals_are_executed_in_submission_order(server, executed):
+    queue = WriteBehindQueue(Prolog(), max_batch_size=4, flush_interval=0.01)
+    goals = [f"kb_project(holds(a, b, {i}))" for i in range(10)]
+    results = [queue.submit(goal) for goal in goals]
+    queue.flush(timeout=5)
+    assert all(result.done() for result in results)
+    assert executed == goals
+    assert server.calls["query"] == 3
+    queue.close()
+
+
+def test_flush_waits_only_for_goals_submitted_before(server, executed):
+    queue = WriteBehindQueue(Prolog(), flush_interval=10)
+    first = queue.submit("kb_project(holds(a, b, c))")
+    queue.flush(timeout=5)
+    second = queue.submit("kb_project(holds(a, b, d))")
+    assert first.done() and executed == ["kb_project(holds(a, b, c))"]
+    # The second goal waits for more goals to batch with, for up to flush_interval
+    assert not second.done()
+    queue.close(timeout=5)
+    assert second.done() and executed == ["kb_project(holds(a, b, c))", "kb_project(holds(a, b, d))"]
+
+
+def test_failing_goal_does_not_stop_the_others(server, executed):
+    queue = WriteBehindQueue(Prolog(), flush_interval=0.01)
+    results = [queue.submit(goal) for goal in ["kb_project(a)", "fail_project(b)", "kb_project(c)"]]
+    queue.flush(timeout=5)
+    assert results[0].result() is None and results[2].result() is None
+    with pytest.raises(PrologException):
+        results[1].result()
+    assert executed == ["kb_project(a)", "fail_project(b)", "kb_project(c)"]
+    queue.close()
+
+
+def test_rejected_batch_is_executed_one_by_one(server, executed):
+    server.add_failure(r"malformed\(")
+    queue = WriteBehindQueue(Prolog(), flush_interval=0.01)
+    results = [queue.submit(goal) for goal in ["kb_project(a)", "malformed(", "kb_project(c)"]]
+    queue.flush(timeout=5)
+    assert results[0].result() is None and results[2].result() is None
+    with pytest.raises(PrologQueryRejected):
+        results[1].result()
+    assert server.received_queries[1:] == ["kb_project(a)", "malformed(", "kb_project(c)"]
+    queue.close()
+
+
+def test_transport_errors_are_not_retried(server):
+    prolog = Prolog()
+    calls = []
+
+    def ensure_once(query_str):
+        calls.append(query_str)
+        raise TimeoutError("rosbridge did not answer")
+
+    prolog.ensure_once = ensure_once
+    queue = WriteBehindQueue(prolog, flush_interval=0.01)
+    results = [queue.submit(goal) for goal in ["kb_project(a)", "kb_project(b)"]]
+    queue.flush(timeout=5)
+    for result in results:
+        with pytest.raises(TimeoutError):
+            result.result()
+    assert len(calls) == 1
+    queue.close()